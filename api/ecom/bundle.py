@@ -0,0 +1,219 @@
+"""
+Product detail bundle: everything the storefront detail page renders, in one
+response.
+
+Assembled with a fixed number of queries regardless of variant/image count:
+product (+category/brand/unit/default variant), variants, variant attributes,
+images, image attributes, stock totals, category tree, related products. The
+anonymous part is cached per product and catalog generation; the wishlist flags
+are overlaid per user afterwards (one query).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Prefetch, Sum
+
+from apps.ecom.cache import get_catalog_generation
+from apps.ecom.models import Product, ProductImage, ProductVariant, Wishlist
+from apps.inventory.models import Stock
+from apps.master.models import AttributeValue, Category
+
+RELATED_LIMIT = 8
+BREADCRUMB_MAX_DEPTH = 6
+
+
+def bundle_cache_key(slug, generation):
+    return f"public:ProductBundle:{slug}:{generation}"
+
+
+def _media_url(request, field):
+    if not field:
+        return None
+    return request.build_absolute_uri(field.url) if request else field.url
+
+
+def _price_fields(variant):
+    if variant is None:
+        return {'price': None, 'old_price': None, 'on_sale': False}
+    if variant.is_on_sale:
+        return {'price': variant.discount_price, 'old_price': variant.price, 'on_sale': True}
+    return {'price': variant.price, 'old_price': None, 'on_sale': False}
+
+
+def _availability(product, available):
+    if not product.track_inventory or available > 0:
+        return {'in_stock': True, 'backorder': False}
+    return {'in_stock': False, 'backorder': product.allow_backorder}
+
+
+def _breadcrumbs(category):
+    """Walk the first-parent chain using the full (small) category tree in two queries."""
+    if category is None:
+        return []
+    parents = {}
+    for child_id, parent_id in Category.parent.through.objects.order_by('pk').values_list(
+            'from_category_id', 'to_category_id'):
+        parents.setdefault(child_id, parent_id)
+
+    chain, seen, current = [category.id], {category.id}, category.id
+    while current in parents and len(chain) < BREADCRUMB_MAX_DEPTH:
+        current = parents[current]
+        if current in seen:
+            break
+        seen.add(current)
+        chain.append(current)
+
+    names = {c['id']: c for c in Category.objects.filter(id__in=chain).values('id', 'name', 'slug')}
+    return [names[cid] for cid in reversed(chain) if cid in names]
+
+
+def _related(product, request):
+    if product.category_id is None:
+        return []
+    qs = (
+        Product.objects.filter(is_active=True, category_id=product.category_id)
+        .exclude(pk=product.pk)
+        .select_related('default_variant', 'brand')
+        .order_by('-is_featured', '-id')[:RELATED_LIMIT]
+    )
+    return [
+        {
+            'id': p.id,
+            'name': p.name,
+            'slug': p.slug,
+            'thumbnail': _media_url(request, p.thumbnail),
+            'brand_name': p.brand.name if p.brand else None,
+            'default_variant': p.default_variant_id,
+            **_price_fields(p.default_variant),
+        }
+        for p in qs
+    ]
+
+
+def build_product_bundle(product, request):
+    """Anonymous (cacheable) part of the bundle for an already fetched product."""
+    variants = list(
+        ProductVariant.objects.filter(product=product, is_active=True).prefetch_related(
+            Prefetch('attributes', queryset=AttributeValue.objects.select_related('attribute'))
+        )
+    )
+    images = list(ProductImage.objects.filter(product=product).prefetch_related('attributes'))
+    stock_totals = dict(
+        Stock.objects.filter(product_variant__product=product)
+        .values('product_variant_id')
+        .annotate(available=Sum(F('quantity_on_hand') - F('quantity_reserved')))
+        .values_list('product_variant_id', 'available')
+    )
+
+    # Attribute matrix: attribute -> values used by any variant, and value-combination -> variant
+    attr_map = {}
+    matrix = {}
+    for variant in variants:
+        value_ids = []
+        for value in variant.attributes.all():
+            attr = value.attribute
+            entry = attr_map.setdefault(attr.id, {
+                'id': attr.id, 'name': attr.name, 'display_order': attr.display_order, 'values': {},
+            })
+            entry['values'][value.id] = {'id': value.id, 'value': value.value, 'color_code': value.color_code}
+            value_ids.append(value.id)
+        matrix[','.join(str(v) for v in sorted(value_ids))] = variant.id
+    attributes = [
+        {'id': a['id'], 'name': a['name'], 'values': list(a['values'].values())}
+        for a in sorted(attr_map.values(), key=lambda a: (a['display_order'], a['name']))
+    ]
+
+    image_attrs = {img.id: {v.id for v in img.attributes.all()} for img in images}
+    image_data = [
+        {
+            'id': img.id,
+            'image': _media_url(request, img.image),
+            'alt_text': img.alt_text,
+            'display_order': img.display_order,
+            'attributes': sorted(image_attrs[img.id]),
+        }
+        for img in images
+    ]
+
+    variant_data = []
+    for variant in variants:
+        value_ids = [v.id for v in variant.attributes.all()]
+        # Same rule as ProductVariantSerializer.get_image_list: images sharing ANY attribute
+        matched = [d['image'] for d, img in zip(image_data, images) if image_attrs[img.id].intersection(value_ids)]
+        available = stock_totals.get(variant.id, variant.stock)
+        variant_data.append({
+            'id': variant.id,
+            'sku': variant.sku,
+            'variant_name': variant.variant_name,
+            'is_default': product.default_variant_id == variant.id,
+            'price': variant.price,
+            'discount_price': variant.discount_price,
+            'is_discount': variant.is_discount,
+            'on_sale': variant.is_on_sale,
+            'attributes': value_ids,
+            'image_list': matched,
+            'available': available,
+            **_availability(product, available),
+        })
+
+    default_variant = product.default_variant
+    details = {
+        'id': product.id,
+        'name': product.name,
+        'slug': product.slug,
+        'short_description': product.short_description,
+        'description': product.description,
+        'key_features': product.key_features,
+        'category': product.category_id,
+        'category_name': product.category.name if product.category else None,
+        'brand': product.brand_id,
+        'brand_name': product.brand.name if product.brand else None,
+        'unit_name': product.unit.name if product.unit else None,
+        'thumbnail': _media_url(request, product.thumbnail),
+        'thumbnail_hover': _media_url(request, product.thumbnail_hover),
+        'product_type': product.product_type,
+        'weight': product.weight,
+        'dimensions': product.dimensions,
+        'warranty': product.warranty,
+        'tax_type': product.tax_type,
+        'min_order_quantity': product.min_order_quantity,
+        'max_order_quantity': product.max_order_quantity,
+        'meta_title': product.meta_title,
+        'meta_description': product.meta_description,
+        'default_variant': product.default_variant_id,
+        **_price_fields(default_variant),
+    }
+    in_stock = any(v['in_stock'] for v in variant_data) if variant_data else not product.track_inventory
+
+    return {
+        'product': details,
+        'attributes': attributes,
+        'variant_matrix': matrix,
+        'variants': variant_data,
+        'images': image_data,
+        'in_stock': in_stock,
+        'breadcrumbs': _breadcrumbs(product.category),
+        'related': _related(product, request),
+    }
+
+
+def get_product_bundle(product, request):
+    """Cached bundle plus the per-user wishlist overlay."""
+    use_cache = getattr(settings, 'PUBLIC_API_CACHE_ENABLED', True)
+    data = None
+    if use_cache:
+        key = bundle_cache_key(product.slug, get_catalog_generation())
+        data = cache.get(key)
+    if data is None:
+        data = build_product_bundle(product, request)
+        if use_cache:
+            cache.set(key, data, getattr(settings, 'PUBLIC_API_CACHE_TIMEOUT', 300))
+
+    wishlisted = set()
+    if request.user.is_authenticated:
+        ids = [product.id] + [item['id'] for item in data['related']]
+        wishlisted = set(Wishlist.objects.filter(user=request.user, product_id__in=ids).values_list('product_id', flat=True))
+    return {
+        **data,
+        'is_in_wishlist': product.id in wishlisted,
+        'related': [{**item, 'is_in_wishlist': item['id'] in wishlisted} for item in data['related']],
+    }
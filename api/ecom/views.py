@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.core.cache import cache
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 from rest_framework import viewsets
@@ -8,9 +9,11 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import status
 
+from api.ecom.bundle import get_product_bundle
 from api.ecom.new_arrival import NewProductSerializer
 from api.ecom.serializers import ProductListSerializer, ProductDetailsSerializer, WishlistSerializer
 from apps.ecom.models import Product, Wishlist
+from apps.ecom.search_index import search_products
 from apps.master.models import Category, Brand
 
 
@@ -97,6 +100,38 @@ class ProductViewSet(CachedReadOnlyMixin, viewsets.ModelViewSet):
             return ProductDetailsSerializer
         return ProductListSerializer
 
+    @action(detail=True, methods=['get'], url_path='bundle')
+    def bundle(self, request, slug=None):
+        """Everything the product detail page needs in one response (see api.ecom.bundle)."""
+        product = get_object_or_404(
+            Product.objects.select_related('category', 'brand', 'unit', 'default_variant'), slug=slug
+        )
+        return Response(get_product_bundle(product, request))
+
+    @action(detail=False, methods=['get'], url_path='suggest')
+    def suggest(self, request):
+        """Search-as-you-type: prefix match on product name, SKU or barcode."""
+        query = request.query_params.get('q', '').strip()
+        if len(query) < 2:
+            return Response({'results': []})
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 20)
+        except ValueError:
+            limit = 10
+        results = []
+        for item in search_products(query, limit=limit):
+            thumbnail = item['thumbnail']
+            results.append({
+                'id': item['id'],
+                'name': item['name'],
+                'slug': item['slug'],
+                'brand': item['brand'],
+                'category': item['category'],
+                'variant_count': item['variant_count'],
+                'thumbnail': request.build_absolute_uri(settings.MEDIA_URL + thumbnail) if thumbnail else None,
+            })
+        return Response({'results': results})
+
     def retrieve(self, request, *args, **kwargs):
         # Override custom retrieve logic but keep caching wrapper executed above by calling parent if cache miss
         if not getattr(settings, 'PUBLIC_API_CACHE_ENABLED', True) or request.user.is_authenticated:
@@ -1,13 +1,18 @@
-from decimal import Decimal
-
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
-from apps.order.models import Cart, CartItem, CartCoupon, Coupon, merge_guest_cart_into_user, quantize_money
+from apps.order import cart_cache
+from apps.order.cart_store import CartOwner, get_cart_store
+from apps.order.models import Cart, CartItem, Coupon, merge_guest_cart_into_user
+from apps.order.pricing import price_items, shipping_quotes
 from apps.ecom.models import ProductVariant
+from apps.master.models import ShippingMethod
 
 
 def _resolve_owner(request):
@@ -73,28 +78,21 @@ class CartSummarySerializer(serializers.Serializer):
     shipping = serializers.CharField()
     tax = serializers.CharField()
     total = serializers.CharField()
+    tax_included = serializers.CharField()
+    weight = serializers.CharField()
     coupon = serializers.CharField(allow_blank=True)
+    shipping_method = serializers.CharField(allow_blank=True)
+
+    @staticmethod
+    def from_cart(cart: Cart, shipping_method=None):
+        applied = getattr(cart, "applied_coupon", None)
+        items = list(cart.items.select_related("variant", "variant__product", "variant__product__selling_tax"))
+        return CartSummarySerializer.from_items(items, applied.coupon if applied else None, shipping_method)
 
     @staticmethod
-    def from_cart(cart: Cart):
-        items = list(cart.items.select_related("variant", "variant__product"))
-        subtotal = sum((i.line_total for i in items), Decimal("0.00"))
-        coupon = getattr(cart, "applied_coupon", None)
-        discount = Decimal("0.00")
-        if coupon:
-            discount = coupon.coupon.apply(subtotal)
-        shipping = Decimal("0.00")
-        tax = Decimal("0.00")
-        total = quantize_money(subtotal - discount + shipping + tax)
-        return {
-            "items": items,
-            "subtotal": str(quantize_money(subtotal)),
-            "discount": str(quantize_money(discount)),
-            "shipping": str(quantize_money(shipping)),
-            "tax": str(quantize_money(tax)),
-            "total": str(total),
-            "coupon": coupon.coupon.code if coupon else "",
-        }
+    def from_items(items, coupon: Coupon = None, shipping_method=None):
+        # Same engine as Order.create_from_cart, so the cart shows what checkout charges
+        return {"items": items, **price_items(items, coupon, shipping_method).as_dict()}
 
 
 class CartAddSerializer(serializers.Serializer):
@@ -104,7 +102,9 @@ class CartAddSerializer(serializers.Serializer):
     def validate(self, attrs):
         variant_id = attrs.get("variant_id")
         quantity = attrs.get("quantity")
-        variant = get_object_or_404(ProductVariant, pk=variant_id, is_active=True, product__is_active=True)
+        # Product joined in: add-to-cart validates min/max/stock against this snapshot
+        variant = get_object_or_404(ProductVariant.objects.select_related("product"),
+                                    pk=variant_id, is_active=True, product__is_active=True)
         attrs["variant"] = variant
         attrs["quantity"] = quantity
         return attrs
@@ -118,10 +118,60 @@ class CouponApplySerializer(serializers.Serializer):
     code = serializers.CharField(max_length=50)
 
 
+class CartBatchOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=["add", "set", "remove"])
+    variant_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        if attrs["op"] == "add":
+            attrs.setdefault("quantity", 1)
+        elif attrs["op"] == "set" and "quantity" not in attrs:
+            raise serializers.ValidationError({"quantity": "This field is required."})
+        return attrs
+
+
+MAX_BATCH_OPERATIONS = 100
+
+
+def _shipping_method(request):
+    """Optional ?shipping_method=<id> to quote shipping in the summary."""
+    method_id = request.query_params.get("shipping_method")
+    if not method_id:
+        return None
+    try:
+        return ShippingMethod.objects.get(pk=int(method_id), is_active=True)
+    except (ValueError, ShippingMethod.DoesNotExist):
+        raise serializers.ValidationError({"shipping_method": "Unknown or inactive shipping method."})
+
+
+def _build_summary(store, owner, shipping_method=None):
+    items, coupon = store.lines(owner)
+    data = CartSummarySerializer.from_items(items, coupon, shipping_method)
+    data["items"] = CartItemSerializer(data["items"], many=True).data
+    return data
+
+
+def _cart_summary(store, owner, shipping_method=None):
+    """
+    Summary for reads, cached per cart version. Mutating endpoints use
+    _build_summary(): their version bump only lands once the write commits.
+    """
+    # Key first: it pins the cart version/catalog generation the summary is built from
+    key = cart_cache.summary_key(owner, suffix=shipping_method.pk if shipping_method else "")
+    data = cache.get(key)
+    if data is None:
+        data = _build_summary(store, owner, shipping_method)
+        cache.set(key, data, cart_cache.summary_timeout())
+    return data
+
+
 class CartViewSet(viewsets.ViewSet):
     """
     Cart endpoints:
-    - GET /cart/ -> summary
+    - GET /cart/ -> summary (?shipping_method=<id> to include its shipping cost)
+    - GET /cart/count/ -> {lines, quantity} for the header badge
+    - GET /cart/shipping-quotes/ -> cost of every active shipping method for this cart
     - POST /cart/ {variant_id, quantity} -> add or increment item
     - PATCH /cart/items/{id}/ {quantity} -> update line quantity
     - DELETE /cart/items/{id}/ -> remove line
@@ -129,102 +179,126 @@ class CartViewSet(viewsets.ViewSet):
     - POST /cart/remove-coupon/
     - POST /cart/clear/
     - POST /cart/merge/ {guest_token} (merge provided guest cart into current user cart)
+    - POST /cart/batch/ {operations: [...]} -> several add/set/remove changes, one summary
+
+    Storage goes through apps.order.cart_store (DB rows, or Redis hashes for hot carts).
     """
     permission_classes = [AllowAny]
 
-    def list(self, request):
+    def _owner_store(self, request):
         user, guest_token = _resolve_owner(request)
-        cart = Cart.objects.get_or_create_for_owner(user=user, guest_token=guest_token)
-        data = CartSummarySerializer.from_cart(cart)
-        data["items"] = CartItemSerializer(data["items"], many=True).data
-        return Response(data)
+        owner = CartOwner(user=user, guest_token=guest_token)
+        return owner, get_cart_store(owner)
+
+    def list(self, request):
+        owner, store = self._owner_store(request)
+        return Response(_cart_summary(store, owner, _shipping_method(request)))
 
     def create(self, request):
-        user, guest_token = _resolve_owner(request)
-        cart = Cart.objects.get_or_create_for_owner(user=user, guest_token=guest_token)
+        owner, store = self._owner_store(request)
         ser = CartAddSerializer(data=request.data)
         ser.is_valid(raise_exception=True)
-        variant = ser.validated_data["variant"]
-        qty = ser.validated_data["quantity"]
         try:
-            item = cart.items.get(variant=variant)
-            item.quantity = item.quantity + qty
-            item.save()
-        except CartItem.DoesNotExist:
-            item = CartItem(cart=cart, variant=variant, quantity=qty)
-            item.save()
-        data = CartSummarySerializer.from_cart(cart)
-        data["items"] = CartItemSerializer(data["items"], many=True).data
-        return Response(data, status=status.HTTP_201_CREATED)
+            store.add(owner, ser.validated_data["variant"], ser.validated_data["quantity"])
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({"detail": e.messages})
+        return Response(_build_summary(store, owner), status=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=["put", "patch"], url_path=r"items/(?P<pk>[^/.]+)")
     def update_item(self, request, pk=None):
-        user, guest_token = _resolve_owner(request)
-        cart = Cart.objects.get_or_create_for_owner(user=user, guest_token=guest_token)
-        item = get_object_or_404(CartItem, pk=pk, cart=cart)
+        owner, store = self._owner_store(request)
         ser = CartUpdateQuantitySerializer(data=request.data)
         ser.is_valid(raise_exception=True)
-        item.quantity = ser.validated_data["quantity"]
-        item.save()
-        data = CartSummarySerializer.from_cart(cart)
-        data["items"] = CartItemSerializer(data["items"], many=True).data
-        return Response(data)
+        try:
+            found = store.set_quantity(owner, pk, ser.validated_data["quantity"])
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({"detail": e.messages})
+        if not found:
+            raise Http404
+        return Response(_build_summary(store, owner))
 
     @action(detail=False, methods=["delete"], url_path=r"items/(?P<pk>[^/.]+)")
     def delete_item(self, request, pk=None):
-        user, guest_token = _resolve_owner(request)
-        cart = Cart.objects.for_owner(user=user, guest_token=guest_token)
-        if not cart:
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        try:
-            item = CartItem.objects.get(pk=pk, cart=cart)
-        except CartItem.DoesNotExist:
+        owner, store = self._owner_store(request)
+        if not store.remove(owner, pk):
             return Response(status=status.HTTP_204_NO_CONTENT)
-        item.delete()
-        data = CartSummarySerializer.from_cart(cart)
-        data["items"] = CartItemSerializer(data["items"], many=True).data
-        return Response(data, status=status.HTTP_200_OK)
+        return Response(_build_summary(store, owner), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"], url_path="count")
+    def count(self, request):
+        """Header badge: {"lines", "quantity"}; served from cache while the cart version is unchanged."""
+        owner, store = self._owner_store(request)
+        key = cart_cache.count_key(owner)
+        data = cache.get(key)
+        if data is None:
+            data = store.count(owner)
+            cache.set(key, data, cart_cache.summary_timeout())
+        return Response(data)
+
+    @action(detail=False, methods=["get"], url_path="shipping-quotes")
+    def quotes(self, request):
+        """Quote all active shipping methods from one pass over the cart; cached per cart version."""
+        owner, store = self._owner_store(request)
+        key = cart_cache.summary_key(owner, suffix="quotes")
+        data = cache.get(key)
+        if data is None:
+            items, coupon = store.lines(owner)
+            data = shipping_quotes(items, coupon, ShippingMethod.objects.filter(is_active=True))
+            cache.set(key, data, cart_cache.summary_timeout())
+        return Response(data)
+
+    @action(detail=False, methods=["post"], url_path="batch")
+    def batch(self, request):
+        """
+        Apply several line changes at once and return one summary.
+        Body: {"operations": [{"op": "add", "variant_id": 1, "quantity": 2},
+                              {"op": "set", "variant_id": 2, "quantity": 1},
+                              {"op": "remove", "variant_id": 3}]}
+        Invalid operations are skipped and reported in "results" by index.
+        """
+        owner, store = self._owner_store(request)
+        operations = request.data.get("operations")
+        if not isinstance(operations, list) or not operations:
+            raise serializers.ValidationError({"operations": "A non-empty list is required."})
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            raise serializers.ValidationError({"operations": f"At most {MAX_BATCH_OPERATIONS} operations."})
+
+        results, valid = [None] * len(operations), []
+        for index, raw in enumerate(operations):
+            ser = CartBatchOperationSerializer(data=raw if isinstance(raw, dict) else {})
+            if ser.is_valid():
+                valid.append((index, ser.validated_data))
+            else:
+                results[index] = {"index": index, "ok": False, "errors": ser.errors}
+        errors = store.apply_batch(owner, [op for _, op in valid]) if valid else []
+        for (index, _), error in zip(valid, errors):
+            results[index] = {"index": index, "ok": error is None, **({"errors": [error]} if error else {})}
+
+        data = _build_summary(store, owner)
+        data["results"] = results
+        return Response(data)
 
     @action(detail=False, methods=["post"], url_path="apply-coupon")
     def apply_coupon(self, request):
-        user, guest_token = _resolve_owner(request)
-        cart = Cart.objects.get_or_create_for_owner(user=user, guest_token=guest_token)
+        owner, store = self._owner_store(request)
         ser = CouponApplySerializer(data=request.data)
         ser.is_valid(raise_exception=True)
-        code = ser.validated_data["code"]
-        ok = CartCoupon.apply(code, cart=cart)
-        if not ok:
+        if not store.apply_coupon(owner, ser.validated_data["code"]):
             return Response({"detail": "Invalid or ineligible coupon."}, status=status.HTTP_400_BAD_REQUEST)
-        data = CartSummarySerializer.from_cart(cart)
-        data["items"] = CartItemSerializer(data["items"], many=True).data
-        return Response(data)
+        return Response(_build_summary(store, owner))
 
     @action(detail=False, methods=["post"], url_path="remove-coupon")
     def remove_coupon(self, request):
-        user, guest_token = _resolve_owner(request)
-        cart = Cart.objects.for_owner(user=user, guest_token=guest_token)
-        if cart:
-            CartCoupon.remove(cart)
-        data = CartSummarySerializer.from_cart(cart) if cart else CartSummarySerializer.from_cart(
-            Cart.objects.get_or_create_for_owner(user=user, guest_token=guest_token)
-        )
-        data["items"] = CartItemSerializer(data["items"], many=True).data
-        return Response(data)
+        owner, store = self._owner_store(request)
+        store.remove_coupon(owner)
+        return Response(_build_summary(store, owner))
 
     @action(detail=False, methods=["post"], url_path="clear")
     def clear_cart(self, request):
-        user, guest_token = _resolve_owner(request)
-        cart = Cart.objects.for_owner(user=user, guest_token=guest_token)
-        if cart:
-            cart.items.all().delete()
-            CartCoupon.remove(cart)
-        data = CartSummarySerializer.from_cart(cart) if cart else {"items": [], "subtotal": "0.00", "discount": "0.00",
-                                                                   "shipping": "0.00", "tax": "0.00", "total": "0.00",
-                                                                   "coupon": ""}
-        if "items" in data and isinstance(data["items"], list) and data["items"] and not isinstance(data["items"][0],
-                                                                                                    dict):
-            data["items"] = CartItemSerializer(data["items"], many=True).data
-        return Response(data)
+        owner, store = self._owner_store(request)
+        store.clear(owner)
+        # Same shape as every other summary, without reading the cart back
+        return Response(CartSummarySerializer.from_items([]))
 
     @action(detail=False, methods=["post"], url_path="merge")
     def merge_guest(self, request):
@@ -239,8 +313,12 @@ class CartViewSet(viewsets.ViewSet):
             "guest_token")
         if not gtok:
             return Response({"detail": "guest_token required."}, status=status.HTTP_400_BAD_REQUEST)
+        guest, owner = CartOwner(guest_token=gtok), CartOwner(user=request.user)
+        guest_store, store = get_cart_store(guest), get_cart_store(owner)
+        # Hot carts are written back first; the merge itself runs on the DB rows
+        guest_store.persist(guest)
+        store.persist(owner)
         merge_guest_cart_into_user(request.user, gtok)
-        cart = Cart.objects.get_or_create_for_owner(user=request.user)
-        data = CartSummarySerializer.from_cart(cart)
-        data["items"] = CartItemSerializer(data["items"], many=True).data
-        return Response(data)
+        guest_store.evict(guest)
+        store.evict(owner)
+        return Response(_build_summary(store, owner))
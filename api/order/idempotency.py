@@ -0,0 +1,64 @@
+from functools import wraps
+
+from rest_framework import serializers, status
+from rest_framework.response import Response
+
+from apps.order import idempotency
+from apps.order.cart_store import CartOwner
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+def _owner_key(request):
+    user = request.user if getattr(request.user, "is_authenticated", False) else None
+    guest_token = request.headers.get("X-Guest-Token") or request.query_params.get("guest_token")
+    if user is None and not guest_token:
+        return None
+    return CartOwner(user=user, guest_token=guest_token).key
+
+
+def _replay(record):
+    return Response(record.response_body, status=record.response_status, headers={"Idempotent-Replayed": "true"})
+
+
+def idempotent(scope: str):
+    """
+    Honour an ``Idempotency-Key`` header on a viewset action (apps.order.idempotency):
+    the first request runs, retries with the same key replay its response.
+    Requests without the header (or without an owner) run as before.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            owner = _owner_key(request) if key else None
+            if owner is None:
+                return view(self, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                raise serializers.ValidationError({"detail": f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters."})
+
+            fingerprint = idempotency.request_fingerprint(request.method, request.path, request.data)
+            record, claimed = idempotency.claim(owner, scope, key, fingerprint)
+            if not claimed:
+                if record.fingerprint != fingerprint:
+                    return Response({"detail": f"{IDEMPOTENCY_HEADER} was already used with a different request."},
+                                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                record = idempotency.wait(record)
+                if record is None or record.status != idempotency.COMPLETED:
+                    return Response({"detail": "A request with this Idempotency-Key is still in progress."},
+                                    status=status.HTTP_409_CONFLICT, headers={"Retry-After": "1"})
+                return _replay(record)
+
+            try:
+                response = view(self, request, *args, **kwargs)
+            except Exception:
+                idempotency.release(record)
+                raise
+            if response.status_code >= 500:
+                idempotency.release(record)
+            else:
+                idempotency.complete(record, response.status_code, response.data)
+            return response
+        return wrapper
+    return decorator
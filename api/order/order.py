@@ -3,6 +3,8 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.decorators import action
 
+from api.order.idempotency import idempotent
+from apps.order.cart_store import CartOwner, get_cart_store
 from apps.order.models import Order, OrderItem, Address, Cart, quantize_money
 
 
@@ -108,7 +110,7 @@ class OrderViewSet(viewsets.ViewSet):
     Order endpoints:
     - GET /orders/ -> list current owner's orders
     - GET /orders/{id}/ -> retrieve order
-    - POST /orders/ -> create order from cart with addresses
+    - POST /orders/ -> create order from cart with addresses (Idempotency-Key header honoured)
     """
     permission_classes = [AllowAny]
 
@@ -157,6 +159,7 @@ class OrderViewSet(viewsets.ViewSet):
             return Response(status=status.HTTP_404_NOT_FOUND)
         return Response(OrderSerializer(order, context={'request': request}).data)
 
+    @idempotent("orders.create")
     def create(self, request):
         # keep_guest=True so we can optionally use a guest cart while authenticated
         user, guest_token = _resolve_owner(request, keep_guest=True)
@@ -222,6 +225,11 @@ class OrderViewSet(viewsets.ViewSet):
                     country=bill_data["country"],
                 )
 
+        # Hot carts (apps.order.cart_store) are written back so checkout reads current DB rows
+        owner = CartOwner(guest_token=guest_token) if guest_token else CartOwner(user=user)
+        cart_store = get_cart_store(owner)
+        cart_store.persist(owner)
+
         # Select cart
         if user and guest_token:
             cart = Cart.objects.for_owner(guest_token=guest_token)
@@ -247,4 +255,5 @@ class OrderViewSet(viewsets.ViewSet):
             shipping_method=shipping_method,
             currency="BDT",
         )
+        cart_store.evict(owner)
         return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 
-from apps.ecom.models import Product, ProductVariant, ProductImage
+from apps.ecom.models import Product, ProductVariant, ProductImage, VariantPriceHistory
 from apps.order.models import Cart, CartItem
 
 
@@ -64,3 +64,12 @@ class CartAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'created_at', 'updated_at']
     search_fields = ['user__username', 'user__email']
     inlines = [CartItemInline]
+
+
+@admin.register(VariantPriceHistory)
+class VariantPriceHistoryAdmin(admin.ModelAdmin):
+    list_display = ['variant', 'effective_from', 'price', 'discount_price', 'purchase_price']
+    search_fields = ['variant__sku', 'variant__product__name']
+    list_filter = ['effective_from']
+    raw_id_fields = ['variant']
+    date_hierarchy = 'effective_from'
@@ -0,0 +1,307 @@
+"""
+Staff bulk pricing.
+
+Reprices every variant matching a brand/category/tag/attribute filter with a
+handful of set-based UPDATEs instead of a save() per row:
+
+- price change : percent (+/-), absolute (+/-) or a fixed price
+- discount     : percent or absolute off the new price, a fixed discount price,
+                 or clear; optional start/end window
+- rounding     : cent, whole, ninety_nine (x.99), nearest_5, nearest_10
+
+The same expressions drive ``preview`` (annotated SELECT, nothing written) and
+``apply`` (chunked UPDATE ... WHERE id IN (...)). Applying appends price
+history rows for the variants that actually changed, invalidates the product
+caches once for the whole run and notifies the scan index with one signal.
+"""
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Ceil, Greatest, Round
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_POST
+
+from apps.ecom.models import ProductVariant, VariantPriceHistory
+from apps.ecom.price_history import baseline_rows
+from apps.ecom.signals import invalidate_product_caches, variants_bulk_changed
+
+UPDATE_CHUNK_SIZE = 5000
+HISTORY_CHUNK_SIZE = 1000
+PREVIEW_ROWS = 20
+FILTER_LOOKUPS = {
+    'brand': 'product__brand_id__in',
+    'category': 'product__category_id__in',
+    'tag': 'product__tags__id__in',
+    'attribute_value': 'attributes__id__in',
+}
+FILTER_FLAGS = ('include_inactive', 'all')
+CENT = Decimal('0.01')
+
+PRICE_MODES = ('percent', 'absolute', 'set')
+DISCOUNT_MODES = ('percent', 'absolute', 'set', 'clear')
+ROUNDING_MODES = ('cent', 'whole', 'ninety_nine', 'nearest_5', 'nearest_10')
+
+_MONEY = DecimalField(max_digits=12, decimal_places=2)
+_ZERO = Value(Decimal('0.00'), output_field=_MONEY)
+
+
+class BulkPricingError(ValueError):
+    """Raised for an invalid bulk pricing request."""
+
+
+def _money(expression):
+    return ExpressionWrapper(expression, output_field=_MONEY)
+
+
+def _dec(value, field):
+    try:
+        result = Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        raise BulkPricingError(f'{field} must be a number.')
+    if not result.is_finite():
+        raise BulkPricingError(f'{field} must be a number.')
+    return result
+
+
+def _round(expression, rounding):
+    if rounding == 'whole':
+        expression = Round(expression)
+    elif rounding == 'ninety_nine':
+        expression = Ceil(expression) - Value(Decimal('0.01'))
+    elif rounding in ('nearest_5', 'nearest_10'):
+        step = Value(Decimal(5 if rounding == 'nearest_5' else 10))
+        expression = Round(expression / step) * step
+    else:
+        expression = Round(expression, 2)
+    return Greatest(_money(expression), _ZERO, output_field=_MONEY)
+
+
+class BulkPriceChange:
+    """
+    A validated bulk pricing operation.
+
+    filters : brand, category, tag, attribute_value (ids or lists of ids), include_inactive;
+              at least one id filter, or "all": true to reprice the whole catalog
+    price   : {"mode": "percent"|"absolute"|"set", "value": "10"}
+    discount: {"mode": "percent"|"absolute"|"set"|"clear", "value": "15",
+               "start": "2026-11-01T00:00:00Z", "end": "2026-11-30T23:59:59Z"}
+    rounding: one of ROUNDING_MODES (default "cent")
+    """
+
+    def __init__(self, filters=None, price=None, discount=None, rounding='cent'):
+        self.filters = filters or {}
+        self.price = price or {}
+        self.discount = discount or {}
+        self.rounding = rounding or 'cent'
+        self._validate()
+
+    @classmethod
+    def from_json(cls, body):
+        try:
+            data = json.loads(body or '{}')
+        except ValueError:
+            raise BulkPricingError('Invalid JSON body.')
+        if not isinstance(data, dict):
+            raise BulkPricingError('Invalid JSON body.')
+        return cls(data.get('filters'), data.get('price'), data.get('discount'), data.get('rounding'))
+
+    def _validate(self):
+        if not isinstance(self.filters, dict):
+            raise BulkPricingError('filters must be an object.')
+        unknown = sorted(set(self.filters) - set(FILTER_LOOKUPS) - set(FILTER_FLAGS))
+        if unknown:
+            raise BulkPricingError(f'Unknown filters: {", ".join(unknown)}.')
+        has_filter = any(self.filters.get(key) not in (None, '', []) for key in FILTER_LOOKUPS)
+        if not has_filter and self.filters.get('all') is not True:
+            raise BulkPricingError('Give at least one filter, or "all": true to reprice every variant.')
+        if self.rounding not in ROUNDING_MODES:
+            raise BulkPricingError(f'rounding must be one of: {", ".join(ROUNDING_MODES)}.')
+        if not self.price and not self.discount:
+            raise BulkPricingError('Nothing to change: give a price and/or discount rule.')
+        if self.price:
+            if self.price.get('mode') not in PRICE_MODES:
+                raise BulkPricingError(f'price.mode must be one of: {", ".join(PRICE_MODES)}.')
+            self.price_value = _dec(self.price.get('value'), 'price.value')
+            if self.price['mode'] == 'percent' and self.price_value <= -100:
+                raise BulkPricingError('price.value must be greater than -100 percent.')
+            if self.price['mode'] == 'set' and self.price_value < 0:
+                raise BulkPricingError('price.value must not be negative.')
+        if self.discount:
+            mode = self.discount.get('mode')
+            if mode not in DISCOUNT_MODES:
+                raise BulkPricingError(f'discount.mode must be one of: {", ".join(DISCOUNT_MODES)}.')
+            if mode != 'clear':
+                self.discount_value = _dec(self.discount.get('value'), 'discount.value')
+                if self.discount_value < 0 or (mode == 'percent' and self.discount_value >= 100):
+                    raise BulkPricingError('discount.value is out of range.')
+            self.discount_start = self._parse_when('start')
+            self.discount_end = self._parse_when('end')
+            if self.discount_start and self.discount_end and self.discount_end <= self.discount_start:
+                raise BulkPricingError('discount.end must be after discount.start.')
+
+    def _parse_when(self, key):
+        raw = self.discount.get(key)
+        if not raw:
+            return None
+        when = parse_datetime(raw)
+        if when is None:
+            raise BulkPricingError(f'discount.{key} must be an ISO 8601 datetime.')
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+        return when
+
+    # -- selection -------------------------------------------------------
+    def queryset(self):
+        qs = ProductVariant.objects.all()
+        if not self.filters.get('include_inactive'):
+            qs = qs.filter(is_active=True)
+        for key, lookup in FILTER_LOOKUPS.items():
+            ids = self.filters.get(key)
+            if ids in (None, '', []):
+                continue
+            try:
+                ids = [int(i) for i in (ids if isinstance(ids, (list, tuple)) else [ids])]
+            except (TypeError, ValueError):
+                raise BulkPricingError(f'filters.{key} must be an id or a list of ids.')
+            # Filtered via a subquery so M2M joins cannot duplicate rows
+            qs = qs.filter(id__in=ProductVariant.objects.filter(**{lookup: ids}).values('id'))
+        return qs
+
+    # -- expressions -----------------------------------------------------
+    def new_price(self):
+        if not self.price:
+            return F('price')
+        mode, value = self.price['mode'], self.price_value
+        if mode == 'percent':
+            expression = F('price') * Value(1 + value / 100)
+        elif mode == 'absolute':
+            expression = F('price') + Value(value)
+        else:
+            expression = Value(value)
+        return _round(_money(expression), self.rounding)
+
+    def new_discount(self):
+        """Expression for discount_price, or None when the discount is left alone."""
+        mode = self.discount.get('mode')
+        if not mode:
+            return None
+        if mode == 'clear':
+            return Value(None, output_field=_MONEY)
+        price, value = self.new_price(), self.discount_value
+        if mode == 'percent':
+            expression = price * Value(1 - value / 100)
+        elif mode == 'absolute':
+            expression = price - Value(value)
+        else:
+            expression = Value(value)
+        return _round(_money(expression), self.rounding)
+
+    def updates(self):
+        updates = {}
+        if self.price:
+            updates['price'] = self.new_price()
+        discount = self.new_discount()
+        if discount is not None:
+            clear = self.discount['mode'] == 'clear'
+            updates.update(
+                discount_price=discount,
+                is_discount=not clear,
+                discount_start=None if clear else self.discount_start,
+                discount_end=None if clear else self.discount_end,
+            )
+        return updates
+
+    # -- operations ------------------------------------------------------
+    def preview(self, rows=PREVIEW_ROWS):
+        qs = self.queryset()
+        annotations = {'new_price': self.new_price()}
+        discount = self.new_discount()
+        if discount is not None:
+            annotations['new_discount_price'] = discount
+        sample = qs.annotate(**annotations).order_by('id').values(
+            'id', 'sku', 'variant_name', 'product__name', 'price', 'discount_price', *annotations,
+        )[:rows]
+        sample = list(sample)
+        for row in sample:
+            # Backends without a native decimal type (SQLite) return unquantized annotations
+            for key in annotations:
+                if row[key] is not None:
+                    row[key] = Decimal(row[key]).quantize(CENT)
+        return {'matched': qs.count(), 'sample': sample}
+
+    def apply(self):
+        """Run the UPDATEs in one transaction; returns {'matched', 'updated', 'history'}."""
+        now = timezone.now()
+        with transaction.atomic():
+            before = {
+                row[0]: row[1:]
+                for row in self.queryset().values_list(
+                    'id', 'price', 'discount_price', 'is_discount', 'discount_start', 'discount_end',
+                    'purchase_price', 'product__slug', 'created_at',
+                ).iterator(chunk_size=UPDATE_CHUNK_SIZE)
+            }
+            ids = list(before)
+            updates = self.updates()
+            updated = 0
+            for start in range(0, len(ids), UPDATE_CHUNK_SIZE):
+                chunk = ids[start:start + UPDATE_CHUNK_SIZE]
+                updated += ProductVariant.objects.filter(id__in=chunk).update(updated_at=now, **updates)
+
+            history, previous, changed_ids, slugs = [], {}, [], set()
+            for start in range(0, len(ids), UPDATE_CHUNK_SIZE):
+                chunk = ids[start:start + UPDATE_CHUNK_SIZE]
+                for vid, *new, purchase_price in ProductVariant.objects.filter(id__in=chunk).values_list(
+                        'id', 'price', 'discount_price', 'is_discount', 'discount_start', 'discount_end', 'purchase_price'):
+                    old = before[vid]
+                    # A moved discount window alone still changes what the storefront shows
+                    if tuple(new) == old[:5]:
+                        continue
+                    changed_ids.append(vid)
+                    slugs.add(old[6])
+                    price, discount_price, is_discount = new[:3]
+                    discount = discount_price if is_discount else None
+                    if (price, discount) != (old[0], old[1] if old[2] else None):
+                        previous[vid] = ((old[0], old[1] if old[2] else None, old[5]), old[7])
+                        history.append(VariantPriceHistory(
+                            variant_id=vid, effective_from=now, price=price,
+                            discount_price=discount, purchase_price=purchase_price,
+                        ))
+            VariantPriceHistory.objects.bulk_create(baseline_rows(previous, now) + history, batch_size=HISTORY_CHUNK_SIZE)
+
+            if changed_ids:
+                transaction.on_commit(lambda: invalidate_product_caches(sorted(slugs)))
+                variants_bulk_changed.send(sender=ProductVariant, product=None, variant_ids=changed_ids)
+        return {'matched': len(ids), 'updated': len(changed_ids), 'history': len(history)}
+
+
+@staff_member_required(login_url='staff_login')
+@require_POST
+def bulk_price_preview(request):
+    """
+    Preview a bulk pricing rule without writing anything.
+    JSON body: {"filters": {...}, "price": {...}, "discount": {...}, "rounding": "cent"}
+    (see BulkPriceChange). Returns the matched count and before/after sample rows.
+    """
+    try:
+        change = BulkPriceChange.from_json(request.body)
+        result = change.preview()
+    except BulkPricingError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, **result})
+
+
+@staff_member_required(login_url='staff_login')
+@require_POST
+def bulk_price_apply(request):
+    """Apply a bulk pricing rule (same body as bulk_price_preview)."""
+    try:
+        change = BulkPriceChange.from_json(request.body)
+        result = change.apply()
+    except BulkPricingError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, **result})
@@ -0,0 +1,36 @@
+"""
+Catalog generation counter.
+
+Every catalog change (product, variant, image, brand/category rename) bumps a
+single integer in the shared cache. Derived data - in-process indexes,
+fragment caches, bundles - embeds the generation it was built from and is
+simply treated as stale once the counter moves, so no key scanning is needed.
+"""
+import time
+
+from django.core.cache import cache
+
+CATALOG_GENERATION_KEY = 'catalog:generation'
+
+
+def _seed() -> int:
+    # Seed from the clock so a counter lost to eviction/restart never goes backwards
+    return int(time.time() * 1000)
+
+
+def get_catalog_generation() -> int:
+    generation = cache.get(CATALOG_GENERATION_KEY)
+    if generation is None:
+        # add() is a no-op if another process initialised it meanwhile
+        cache.add(CATALOG_GENERATION_KEY, _seed(), timeout=None)
+        generation = cache.get(CATALOG_GENERATION_KEY) or _seed()
+    return generation
+
+
+def bump_catalog_generation() -> int:
+    try:
+        return cache.incr(CATALOG_GENERATION_KEY)
+    except ValueError:
+        seed = _seed()
+        cache.add(CATALOG_GENERATION_KEY, seed, timeout=None)
+        return seed
@@ -0,0 +1,291 @@
+"""
+Streaming product/variant export.
+
+Rows are read with ``values()`` projections and ``iterator(chunk_size=...)`` and
+written straight into a ``StreamingHttpResponse`` so worker memory stays flat no
+matter how many SKUs the catalog holds.
+
+Formats:
+- csv     : spreadsheet friendly, one variant per row
+- ndjson  : one JSON object per line (feeds, scripts, bulk import UIs)
+- merchant: Google-Merchant style RSS 2.0 XML feed
+
+The public merchant feed is streamed into a file in default_storage once per
+catalog generation, parameter set and MERCHANT_FEED_CACHE_TIMEOUT window
+(which bounds stock staleness), chunk by chunk, and the file is streamed back
+to clients. While one request rebuilds it, others get the previous file; with
+no file yet they are streamed straight from the database.
+"""
+import csv
+import hashlib
+import re
+import tempfile
+import time
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.http import FileResponse, StreamingHttpResponse, HttpResponseBadRequest
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+
+from apps.ecom.cache import get_catalog_generation
+from apps.ecom.models import ProductVariant
+
+EXPORT_CHUNK_SIZE = 2000
+DEFAULT_CURRENCY = 'BDT'
+CURRENCY_RE = re.compile(r'^[A-Z]{3}$')
+MERCHANT_FEED_LOCK_TIMEOUT = 120
+
+# (values() lookup, output column)
+VARIANT_EXPORT_FIELDS = [
+    ('id', 'id'),
+    ('sku', 'sku'),
+    ('barcode', 'barcode'),
+    ('variant_name', 'variant_name'),
+    ('product_id', 'product_id'),
+    ('product__name', 'product_name'),
+    ('product__slug', 'product_slug'),
+    ('product__brand__name', 'brand'),
+    ('product__category__name', 'category'),
+    ('price', 'price'),
+    ('discount_price', 'discount_price'),
+    ('is_discount', 'is_discount'),
+    ('discount_start', 'discount_start'),
+    ('discount_end', 'discount_end'),
+    ('purchase_price', 'purchase_price'),
+    ('stock', 'stock'),
+    ('is_active', 'is_active'),
+]
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson'),
+    'merchant': ('application/xml; charset=utf-8', 'xml'),
+}
+
+
+class ExportParamError(ValueError):
+    pass
+
+
+def _id_param(request, name):
+    raw = request.GET.get(name)
+    if raw in (None, ''):
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise ExportParamError(f'{name} must be an integer id.')
+
+
+def _currency_param(request):
+    currency = request.GET.get('currency', DEFAULT_CURRENCY).strip().upper()
+    if not CURRENCY_RE.match(currency):
+        raise ExportParamError('currency must be a 3-letter ISO 4217 code.')
+    return currency
+
+
+def variant_export_queryset(brand_id=None, category_id=None, active_only=True):
+    """Base queryset shared by every export (and the inventory variants API)."""
+    qs = ProductVariant.objects.all()
+    if active_only:
+        qs = qs.filter(is_active=True, product__is_active=True)
+    if brand_id:
+        qs = qs.filter(product__brand_id=brand_id)
+    if category_id:
+        qs = qs.filter(product__category_id=category_id)
+    # Stable order keeps exports diffable and lets the DB walk the pk index
+    return qs.order_by('pk')
+
+
+def iter_rows(qs, fields=VARIANT_EXPORT_FIELDS, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield plain dicts keyed by output column, chunk_size rows per DB fetch."""
+    lookups = [lookup for lookup, _ in fields]
+    renames = [(lookup, column) for lookup, column in fields if lookup != column]
+    for row in qs.values(*lookups).iterator(chunk_size=chunk_size):
+        for lookup, column in renames:
+            row[column] = row.pop(lookup)
+        yield row
+
+
+class _Echo:
+    """File-like object whose write() just returns the value (for csv.writer)."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, columns):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([row[col] for col in columns])
+
+
+def stream_ndjson(rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+# -------------------------------
+# Google Merchant feed
+# -------------------------------
+MERCHANT_FIELDS = VARIANT_EXPORT_FIELDS + [
+    ('product__description', 'description'),
+    ('product__short_description', 'short_description'),
+    ('product__thumbnail', 'thumbnail'),
+    ('product__track_inventory', 'track_inventory'),
+    ('product__allow_backorder', 'allow_backorder'),
+]
+
+
+def _merchant_item(row, base_url, currency, now):
+    link = base_url + reverse('product_detail', args=[row['product_slug']])
+    title = row['product_name'] if not row['variant_name'] else f"{row['product_name']} - {row['variant_name']}"
+    description = row['short_description'] or row['description'] or title
+    if not row['track_inventory'] or row['stock'] > 0:
+        availability = 'in_stock'
+    elif row['allow_backorder']:
+        availability = 'backorder'
+    else:
+        availability = 'out_of_stock'
+
+    parts = [
+        '<item>',
+        f"<g:id>{escape(row['sku'])}</g:id>",
+        f"<g:item_group_id>{row['product_id']}</g:item_group_id>",
+        f"<title>{escape(title)}</title>",
+        f"<description>{escape(description[:5000])}</description>",
+        f"<link>{escape(link)}</link>",
+        f"<g:price>{row['price']} {escape(currency)}</g:price>",
+        f"<g:availability>{availability}</g:availability>",
+        '<g:condition>new</g:condition>',
+    ]
+    sale_active = (
+        row['is_discount'] and row['discount_price'] is not None and row['discount_price'] < row['price']
+        and (row['discount_start'] is None or row['discount_start'] <= now)
+        and (row['discount_end'] is None or row['discount_end'] >= now)
+    )
+    if sale_active:
+        parts.append(f"<g:sale_price>{row['discount_price']} {escape(currency)}</g:sale_price>")
+    if row['thumbnail']:
+        parts.append(f"<g:image_link>{escape(base_url + settings.MEDIA_URL + row['thumbnail'])}</g:image_link>")
+    if row['brand']:
+        parts.append(f"<g:brand>{escape(row['brand'])}</g:brand>")
+    if row['barcode']:
+        parts.append(f"<g:gtin>{escape(row['barcode'])}</g:gtin>")
+    if row['category']:
+        parts.append(f"<g:product_type>{escape(row['category'])}</g:product_type>")
+    parts.append('</item>\n')
+    return ''.join(parts)
+
+
+def stream_merchant_xml(rows, base_url, title='Product feed', currency=DEFAULT_CURRENCY):
+    now = timezone.now()
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n'
+           f'<channel><title>{escape(title)}</title><link>{escape(base_url)}/</link>'
+           '<description>Product feed</description>\n')
+    for row in rows:
+        yield _merchant_item(row, base_url, currency, now)
+    yield '</channel></rss>\n'
+
+
+def streaming_export_response(fmt, qs, request, filename='variants'):
+    """Build a StreamingHttpResponse for the given format over qs."""
+    content_type, ext = EXPORT_FORMATS[fmt]
+    if fmt == 'merchant':
+        base_url = request.build_absolute_uri('/').rstrip('/')
+        body = stream_merchant_xml(iter_rows(qs, MERCHANT_FIELDS), base_url, currency=_currency_param(request))
+    elif fmt == 'csv':
+        body = stream_csv(iter_rows(qs), [column for _, column in VARIANT_EXPORT_FIELDS])
+    else:
+        body = stream_ndjson(iter_rows(qs))
+    response = StreamingHttpResponse(body, content_type=content_type)
+    if fmt != 'merchant':
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{ext}"'
+    return response
+
+
+# -------------------------------
+# Views
+# -------------------------------
+@staff_member_required(login_url='staff_login')
+@require_GET
+def export_variants(request):
+    """
+    Staff export of variants.
+    Query params: format=csv|ndjson|merchant (default csv), brand, category, include_inactive=1
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('Unsupported export format.')
+    try:
+        qs = variant_export_queryset(
+            brand_id=_id_param(request, 'brand'),
+            category_id=_id_param(request, 'category'),
+            active_only=request.GET.get('include_inactive') not in ('1', 'true'),
+        )
+        return streaming_export_response(fmt, qs, request, filename=f"variants-{timezone.now():%Y%m%d}")
+    except ExportParamError as e:
+        return HttpResponseBadRequest(str(e))
+
+
+@require_GET
+def merchant_feed(request):
+    """
+    Public Google-Merchant style feed of all active variants.
+    Query params: brand, category, currency (3-letter code, default BDT)
+    """
+    try:
+        brand_id, category_id = _id_param(request, 'brand'), _id_param(request, 'category')
+        currency = _currency_param(request)
+    except ExportParamError as e:
+        return HttpResponseBadRequest(str(e))
+
+    base_url = request.build_absolute_uri('/').rstrip('/')
+    qs = variant_export_queryset(brand_id=brand_id, category_id=category_id)
+    body = lambda: stream_merchant_xml(iter_rows(qs, MERCHANT_FIELDS), base_url, currency=currency)
+    content_type = EXPORT_FORMATS['merchant'][0]
+    path = stored_merchant_feed(f"{base_url}|{brand_id}|{category_id}|{currency}", body)
+    if path is None:
+        return StreamingHttpResponse(body(), content_type=content_type)
+    return FileResponse(default_storage.open(path, 'rb'), content_type=content_type)
+
+
+def stored_merchant_feed(params: str, body) -> str:
+    """
+    Storage path of the current feed file for ``params``, writing it from
+    ``body()`` (an iterator of str chunks) when missing. None while another
+    request builds the first one.
+    """
+    digest = hashlib.md5(params.encode()).hexdigest()
+    timeout = max(getattr(settings, 'MERCHANT_FEED_CACHE_TIMEOUT', 60 * 15), 1)
+    path = f"feeds/merchant-{digest}-{get_catalog_generation()}-{int(time.time() // timeout)}.xml"
+    latest_key = f"feeds:merchant:latest:{digest}"
+    latest = cache.get(latest_key)
+    if latest == path and default_storage.exists(path):
+        return path
+    if not cache.add(f"{latest_key}:lock", 1, timeout=MERCHANT_FEED_LOCK_TIMEOUT):
+        # Another request is writing the new file
+        return latest if latest and default_storage.exists(latest) else None
+    try:
+        if not default_storage.exists(path):
+            with tempfile.TemporaryFile() as tmp:
+                for chunk in body():
+                    tmp.write(chunk.encode())
+                tmp.seek(0)
+                path = default_storage.save(path, File(tmp))
+        cache.set(latest_key, path, timeout=None)
+        if latest and latest != path and default_storage.exists(latest):
+            default_storage.delete(latest)
+    finally:
+        cache.delete(f"{latest_key}:lock")
+    return path
@@ -0,0 +1,82 @@
+"""
+Server-rendered storefront home sections.
+
+With STOREFRONT_SERVER_RENDER_HOME enabled, the data-driven HomeSection blocks
+(new arrivals, popular) are rendered into HTML fragments on the server, so the
+home page paints in one request instead of waiting on the AJAX waterfall. Each
+fragment is cached under its section type and the catalog generation, and all
+fragments are fetched with a single get_many. The JSON endpoints stay in place
+for client-side hydration (e.g. wishlist state for signed-in shoppers).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from apps.ecom.cache import get_catalog_generation
+from apps.ecom.models import Product
+
+HOME_FRAGMENT_KEY = 'storefront:home:{section_type}:{generation}'
+HOME_PRODUCT_LIMIT = 8
+
+
+def _card(product, request, price):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'slug': product.slug,
+        'category_name': product.category.name if product.category else None,
+        'thumbnail': request.build_absolute_uri(product.thumbnail.url) if product.thumbnail else None,
+        'thumbnail_hover': request.build_absolute_uri(product.thumbnail_hover.url) if product.thumbnail_hover else None,
+        'price': price,
+    }
+
+
+def _home_products():
+    return Product.objects.select_related('category', 'default_variant')
+
+
+def _render_new_arrivals(request):
+    # Same selection as NewArrivalProductViewSet (?page_size=8)
+    products = _home_products().filter(is_active=True, is_featured=True).order_by('-created_at')[:HOME_PRODUCT_LIMIT]
+    cards = [_card(p, request, p.default_variant.price if p.default_variant else p.get_price()) for p in products]
+    return render_to_string('storefront/partials/home_products.html', {'products': cards, 'layout': 'slide'})
+
+
+def _render_popular(request):
+    # Same selection and pricing as PopularProductViewSet / ProductListSerializer
+    products = _home_products().filter(is_active=True).order_by('-id')[:HOME_PRODUCT_LIMIT]
+    cards = []
+    for p in products:
+        variant = p.default_variant
+        price = variant.get_effective_price() if variant else p.get_price()
+        cards.append(_card(p, request, price))
+    return render_to_string('storefront/partials/home_products.html', {'products': cards, 'layout': 'grid'})
+
+
+# section_type -> renderer(request) returning HTML; sections without one stay static/AJAX
+HOME_FRAGMENT_RENDERERS = {
+    'new_arrivals': _render_new_arrivals,
+    'popular': _render_popular,
+}
+
+
+def render_home_fragments(sections, request):
+    """Return {section_type: html} for every active section that has a renderer."""
+    section_types = [s.section_type for s in sections if s.section_type in HOME_FRAGMENT_RENDERERS]
+    if not section_types:
+        return {}
+    generation = get_catalog_generation()
+    keys = {t: HOME_FRAGMENT_KEY.format(section_type=t, generation=generation) for t in section_types}
+    cached = cache.get_many(keys.values())
+
+    fragments, missing = {}, {}
+    for section_type, key in keys.items():
+        html = cached.get(key)
+        if html is None:
+            html = HOME_FRAGMENT_RENDERERS[section_type](request)
+            missing[key] = html
+        fragments[section_type] = mark_safe(html)
+    if missing:
+        cache.set_many(missing, getattr(settings, 'PUBLIC_API_CACHE_TIMEOUT', 300))
+    return fragments
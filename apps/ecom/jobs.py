@@ -0,0 +1,39 @@
+"""Background jobs for the catalog (apps.jobs)."""
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.http import HttpRequest
+
+from apps.ecom.home_fragments import render_home_fragments
+from apps.jobs.queue import enqueue_on_commit, job
+
+# Catalog edits arriving within this many seconds share one warm-up
+HOME_WARMUP_DELAY = 5
+
+
+class _SiteRequest(HttpRequest):
+    """Stand-in request outside a request cycle: absolute URLs point at settings.DOMAIN."""
+
+    def __init__(self, url):
+        super().__init__()
+        parts = urlsplit(url)
+        self._site_scheme, self._site_host = parts.scheme or 'http', parts.netloc
+
+    def _get_scheme(self):
+        return self._site_scheme
+
+    def get_host(self):
+        return self._site_host
+
+
+@job(max_attempts=3)
+def warm_home_fragments():
+    """Render the home page fragments for the current catalog generation before a shopper has to."""
+    from apps.cms.models import HomeSection
+
+    render_home_fragments(HomeSection.objects.filter(is_active=True), _SiteRequest(settings.DOMAIN))
+
+
+def schedule_home_warmup():
+    if getattr(settings, 'STOREFRONT_SERVER_RENDER_HOME', False):
+        enqueue_on_commit(warm_home_fragments, delay=HOME_WARMUP_DELAY, dedupe_key='ecom.warm_home_fragments')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.ecom.price_history import backfill_price_history
+
+
+class Command(BaseCommand):
+    help = "Record the current prices (dated at created_at) of variants that have no price history yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Variants per batch')
+
+    def handle(self, *args, **options):
+        written = backfill_price_history(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Recorded {written} baseline price row(s)."))
@@ -5,6 +5,7 @@ from decimal import Decimal
 from django.core.validators import MinValueValidator
 from django.db import models
 from django.db.models import Sum
+from django.utils import timezone
 from django.utils.text import slugify
 
 from apps.helpers.models import UserTimestampMixin
@@ -158,6 +159,22 @@ class ProductVariant(UserTimestampMixin):
     def __str__(self):
         return f"{self.product.name} - {self.variant_name or self.sku}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember loaded prices so saves only write history when they change
+        instance._price_snapshot = instance.price_snapshot() if instance._has_price_fields() else None
+        return instance
+
+    def _has_price_fields(self):
+        deferred = self.get_deferred_fields()
+        return not deferred.intersection(('price', 'discount_price', 'is_discount', 'purchase_price'))
+
+    def price_snapshot(self):
+        """(price, active discount price, purchase price) as recorded in VariantPriceHistory."""
+        discount = self.discount_price if self.is_discount else None
+        return self.price, discount, self.purchase_price
+
     def save(self, *args, **kwargs):
         skip_gen = kwargs.pop('_skip_variant_name_generation', False)
         super().save(*args, **kwargs)
@@ -277,3 +294,28 @@ class Wishlist(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
 
+
+class VariantPriceHistory(models.Model):
+    """
+    Append-only price time series. A row is written only when a variant's
+    price, active discount price or purchase price changes; it holds the
+    values in effect from effective_from until the next row.
+    """
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name='price_history')
+    effective_from = models.DateTimeField(default=timezone.now)
+    price = models.DecimalField(max_digits=12, decimal_places=2)
+    discount_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True,
+                                         help_text='Discount price while a discount was enabled, else empty.')
+    purchase_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Variant Price History'
+        verbose_name_plural = 'Variant Price History'
+        ordering = ['variant', '-effective_from']
+        indexes = [
+            models.Index(fields=['variant', '-effective_from'], name='ecom_pricehist_variant_idx'),
+            models.Index(fields=['effective_from'], name='ecom_pricehist_from_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.variant_id} @ {self.effective_from:%Y-%m-%d %H:%M}: {self.price}"
@@ -0,0 +1,128 @@
+"""
+Variant price history: writers and query API.
+
+Rows are appended only when (price, active discount price, purchase price)
+differ from what the variant was loaded with, so the table stays compact.
+A variant without any history yet (created before history was recorded) first
+gets a baseline row with the prices it was loaded with, dated at its
+created_at, so its first change does not lose the old price;
+`manage.py backfill_price_history` writes those baselines up front.
+Single saves go through the ProductVariant post_save receiver; bulk writers
+(variant upsert, matrix generator, bulk pricing) call record_price_changes().
+
+Queries take a page of variant ids and answer in one statement each:
+- prices_at(ids, when)          -> price row in effect at ``when``
+- price_range(ids, start, end)  -> min/max of price and selling price in a window
+"""
+from django.db.models import F, Max, Min, OuterRef, Q, Subquery, Window
+from django.db.models.functions import Coalesce, Least, RowNumber
+from django.utils import timezone
+
+from apps.ecom.models import ProductVariant, VariantPriceHistory
+
+HISTORY_FIELDS = ('price', 'discount_price', 'purchase_price')
+
+
+def _row(variant_id, effective_from, snapshot):
+    price, discount_price, purchase_price = snapshot
+    return VariantPriceHistory(
+        variant_id=variant_id, effective_from=effective_from,
+        price=price, discount_price=discount_price, purchase_price=purchase_price,
+    )
+
+
+def baseline_rows(previous, effective_from):
+    """
+    Rows recording the prices variants had before a change, for those without
+    any history yet. previous: {variant_id: (old snapshot, created_at)}.
+    """
+    previous = {vid: old for vid, old in previous.items() if old[0] is not None and old[0][0] is not None}
+    if not previous:
+        return []
+    recorded = set(
+        VariantPriceHistory.objects.filter(variant_id__in=previous).values_list('variant_id', flat=True).distinct()
+    )
+    return [
+        _row(vid, min(created_at or effective_from, effective_from), snapshot)
+        for vid, (snapshot, created_at) in previous.items() if vid not in recorded
+    ]
+
+
+def record_price_changes(variants, effective_from=None):
+    """Bulk-append history rows for variants whose prices changed since load/last record."""
+    effective_from = effective_from or timezone.now()
+    rows, previous = [], {}
+    for variant in variants:
+        snapshot = variant.price_snapshot()
+        loaded = getattr(variant, '_price_snapshot', None)
+        if snapshot == loaded or variant.price is None:
+            continue
+        previous[variant.pk] = (loaded, variant.created_at)
+        rows.append(_row(variant.pk, effective_from, snapshot))
+        variant._price_snapshot = snapshot
+    if rows:
+        VariantPriceHistory.objects.bulk_create(baseline_rows(previous, effective_from) + rows, batch_size=1000)
+    return len(rows)
+
+
+def backfill_price_history(chunk_size=1000) -> int:
+    """Write a baseline row (current prices, at created_at) for every variant without history."""
+    written = 0
+    variants = ProductVariant.objects.filter(price_history__isnull=True, price__isnull=False).order_by('id')
+    while True:
+        chunk = list(variants.only('id', 'price', 'discount_price', 'is_discount', 'purchase_price', 'created_at')[:chunk_size])
+        if not chunk:
+            break
+        VariantPriceHistory.objects.bulk_create([
+            _row(v.pk, v.created_at or timezone.now(), v.price_snapshot()) for v in chunk
+        ])
+        written += len(chunk)
+        if len(chunk) < chunk_size:
+            break
+    return written
+
+
+def _selling_price():
+    return Least(F('price'), Coalesce(F('discount_price'), F('price')))
+
+
+def prices_at(variant_ids, when=None):
+    """{variant_id: {'effective_from', 'price', 'discount_price', 'purchase_price'}} at ``when``."""
+    when = when or timezone.now()
+    qs = (
+        VariantPriceHistory.objects
+        .filter(variant_id__in=variant_ids, effective_from__lte=when)
+        .annotate(rank=Window(RowNumber(), partition_by=[F('variant_id')], order_by=F('effective_from').desc()))
+        .filter(rank=1)
+        .values('variant_id', 'effective_from', *HISTORY_FIELDS)
+    )
+    return {row.pop('variant_id'): row for row in qs}
+
+
+def price_range(variant_ids, start, end=None):
+    """
+    {variant_id: {'min_price', 'max_price', 'min_selling_price', 'max_selling_price'}}
+    over [start, end], counting the row already in effect at ``start``.
+    Answers "lowest price in the last 30 days" for a whole page in one query.
+    """
+    end = end or timezone.now()
+    in_effect_at_start = (
+        VariantPriceHistory.objects
+        .filter(variant_id=OuterRef('variant_id'), effective_from__lt=start)
+        .order_by('-effective_from')
+        .values('effective_from')[:1]
+    )
+    qs = (
+        VariantPriceHistory.objects
+        .filter(variant_id__in=variant_ids, effective_from__lte=end)
+        .filter(Q(effective_from__gte=start) | Q(effective_from=Subquery(in_effect_at_start)))
+        .values('variant_id')
+        .annotate(
+            min_price=Min('price'),
+            max_price=Max('price'),
+            min_selling_price=Min(_selling_price()),
+            max_selling_price=Max(_selling_price()),
+        )
+        .order_by()
+    )
+    return {row.pop('variant_id'): row for row in qs}
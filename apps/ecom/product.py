@@ -1,16 +1,23 @@
 # views.py
+import json
+from decimal import Decimal, InvalidOperation
 
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.db import transaction
 from django.db.models import Q
 from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.views.generic import TemplateView
 
 from .forms import ProductForm
 from .models import ProductVariant, Product
+from .variants import (
+    upsert_variants, plan_variant_matrix, apply_variant_matrix, VariantUpsertError, DEFAULT_SKU_TEMPLATE,
+)
 from ..master.models import Attribute, Category, Brand, AttributeValue, Unit, Tax
 
 
@@ -92,6 +99,25 @@ def to_bool(val):
     return str(val).lower() in ('1', 'true', 'on', 'yes') if val is not None else False
 
 
+def _to_decimal(val):
+    """Blank or invalid POST values become None."""
+    if val is None or val == '':
+        return None
+    try:
+        value = Decimal(val)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    return value if value.is_finite() else None
+
+
+def _row_attribute_value_ids(data, prefix):
+    """Value ids of an editor row: full attr_ids list when present, else the 2-attribute inputs."""
+    attr_ids = data.get(f'{prefix}[attr_ids]')
+    if attr_ids:
+        return [vid for vid in attr_ids.split(',') if vid.strip()]
+    return [vid for vid in (data.get(f'{prefix}[first_attr_id]'), data.get(f'{prefix}[second_attr_id]')) if vid]
+
+
 class ProductCreateView(View):
     def get(self, request):
         form = ProductForm()
@@ -280,12 +306,15 @@ class ProductVariantWarehouseView(View):
         # Build existing variants payload for rendering/editing
         existing_variants = []
         for v in product.variants.all().prefetch_related('attributes'):
-            avs = list(v.attributes.all()[:2])
+            all_avs = list(v.attributes.all())
+            avs = all_avs[:2]
             first_attr_id = avs[0].id if len(avs) > 0 else ''
             second_attr_id = avs[1].id if len(avs) > 1 else ''
-            combo = " / ".join([a.value for a in avs]) if avs else ''
+            combo = " / ".join([a.value for a in all_avs]) if all_avs else ''
             existing_variants.append({
                 'id': v.id,
+                # Full signature so variants with 3+ attributes survive an editor save
+                'attr_ids': ','.join(str(a.id) for a in all_avs),
                 'sku': v.sku,
                 'purchase_price': v.purchase_price,
                 'price': v.price,
@@ -447,83 +476,77 @@ class ProductVariantWarehouseView(View):
                     messages.error(request, e)
                 return redirect('product_variants_step', product_id=product.id)
 
-            # Upsert submitted variants
+            # Upsert submitted variants in bulk
+            rows = []
             index = 0
-            kept_ids = []
-            default_variant_obj = None
-
             while f'variants[{index}][sku]' in request.POST:
-                vid = request.POST.get(f'variants[{index}][id]')
-                sku = (request.POST.get(f'variants[{index}][sku]') or '').strip()
-                price_raw = request.POST.get(f'variants[{index}][price]')
-                try:
-                    price = float(price_raw) if price_raw is not None and price_raw != '' else None
-                except (TypeError, ValueError):
-                    price = None
-
-                purchase_price_raw = request.POST.get(f'variants[{index}][purchase_price]')
-                try:
-                    purchase_price = float(purchase_price_raw) if purchase_price_raw is not None and purchase_price_raw != '' else None
-                except (TypeError, ValueError):
-                    purchase_price = None
+                prefix = f'variants[{index}]'
+                rows.append({
+                    'id': request.POST.get(f'{prefix}[id]') or None,
+                    'sku': (request.POST.get(f'{prefix}[sku]') or '').strip(),
+                    'price': _to_decimal(request.POST.get(f'{prefix}[price]')),
+                    'purchase_price': _to_decimal(request.POST.get(f'{prefix}[purchase_price]')),
+                    'is_active': to_bool(request.POST.get(f'{prefix}[is_active]')),
+                    'is_discount': to_bool(request.POST.get(f'{prefix}[is_discount]')),
+                    'discount_price': _to_decimal(request.POST.get(f'{prefix}[discount_price]')),
+                    'attribute_value_ids': _row_attribute_value_ids(request.POST, prefix),
+                })
+                index += 1
 
-                is_variant_active = to_bool(request.POST.get(f'variants[{index}][is_active]'))
-                is_discount = to_bool(request.POST.get(f'variants[{index}][is_discount]'))
-                discount_price_raw = request.POST.get(f'variants[{index}][discount_price]')
-                try:
-                    discount_price = float(discount_price_raw) if discount_price_raw is not None and discount_price_raw != '' else None
-                except (TypeError, ValueError):
-                    discount_price = None
-
-                first_attr_id = request.POST.get(f'variants[{index}][first_attr_id]')
-                second_attr_id = request.POST.get(f'variants[{index}][second_attr_id]')
-                # variant_image = request.FILES.get(f'variants[{index}][image]')  # removed
-
-                if vid:
-                    variant = get_object_or_404(ProductVariant, id=vid, product=product)
-                    variant.sku = sku
-                    variant.price = price
-                    variant.purchase_price = purchase_price
-                    variant.is_active = is_variant_active
-                    variant.is_discount = is_discount
-                    variant.discount_price = discount_price
-                    # if variant_image:
-                    #     variant.image = variant_image  # removed
-                    variant.attributes.clear()
-                else:
-                    variant = ProductVariant.objects.create(
-                        product=product,
-                        sku=sku,
-                        price=price,
-                        purchase_price=purchase_price,
-                        is_active=is_variant_active,
-                        is_discount=is_discount,
-                        discount_price=discount_price,
-                        # image=variant_image  # removed
-                    )
-
-                if first_attr_id:
-                    variant.attributes.add(AttributeValue.objects.get(id=first_attr_id))
-                if second_attr_id:
-                    variant.attributes.add(AttributeValue.objects.get(id=second_attr_id))
+            try:
+                upsert_variants(product, rows, default_index=default_index)
+            except VariantUpsertError as e:
+                transaction.set_rollback(True)
+                messages.error(request, str(e))
+                return redirect('product_variants_step', product_id=product.id)
 
-                variant.save()
-                kept_ids.append(variant.id)
-                if str(index) == str(default_index):
-                    default_variant_obj = variant
+        return redirect('product_list')
 
-                index += 1
 
-            product.variants.exclude(id__in=kept_ids).delete()
+MAX_MATRIX_COMBINATIONS = 5000
 
-            product.is_variant = True
-            if default_variant_obj:
-                product.default_variant = default_variant_obj
-                product.save(update_fields=['is_variant', 'default_variant'])
-            else:
-                product.save(update_fields=['is_variant'])
 
-        return redirect('product_list')
+@staff_member_required(login_url='staff_login')
+@require_POST
+def product_variant_matrix(request, product_id):
+    """
+    Generate variants for any number of attributes.
+    JSON body: {"attributes": {"<attribute_id>": [value_id, ...], ...},
+                "sku_template": "{product}-{values}", "price": "100.00",
+                "purchase_price": "60.00", "retire": "deactivate"|"delete", "dry_run": true}
+    Returns the create/keep/retire counts (and previews); persists unless dry_run.
+    """
+    product = get_object_or_404(Product, id=product_id)
+    try:
+        data = json.loads(request.body or '{}')
+        if not isinstance(data, dict):
+            raise VariantUpsertError('Expected a JSON object.')
+        attributes = data.get('attributes') or {}
+        if not isinstance(attributes, dict) or not all(
+                isinstance(ids, list) and all(isinstance(i, (int, str)) for i in ids) for ids in attributes.values()):
+            raise VariantUpsertError('attributes must map attribute ids to lists of value ids.')
+        price = _to_decimal(data.get('price'))
+        purchase_price = _to_decimal(data.get('purchase_price'))
+        retire = data.get('retire', 'deactivate')
+        if retire not in ('deactivate', 'delete'):
+            raise VariantUpsertError('retire must be "deactivate" or "delete".')
+        combinations = 1
+        for ids in attributes.values():
+            combinations *= max(len(ids), 1)
+        if combinations > MAX_MATRIX_COMBINATIONS:
+            raise VariantUpsertError(f'At most {MAX_MATRIX_COMBINATIONS} combinations per product.')
+        sku_template = data.get('sku_template') or DEFAULT_SKU_TEMPLATE
+        if not isinstance(sku_template, str):
+            raise VariantUpsertError('sku_template must be a string.')
+        plan = plan_variant_matrix(product, attributes, sku_template)
+    except (ValueError, KeyError, IndexError) as e:
+        # VariantUpsertError (incl. bad SKU templates), bad JSON and non-numeric ids
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    result = plan.as_dict()
+    if not data.get('dry_run'):
+        apply_variant_matrix(plan, price=price, purchase_price=purchase_price, retire=retire)
+    return JsonResponse({'success': True, 'dry_run': bool(data.get('dry_run')), **result})
 
 
 def get_attribute_values(request):
@@ -0,0 +1,189 @@
+"""
+In-process typeahead index for product names, SKUs and barcodes.
+
+The index keeps one sorted list of (term, product_id) tuples per match kind
+(name, code, name word), searched with bisect, so a lookup is a few binary
+searches plus short scans - no database round trip. Kinds are scanned best
+first and a worse kind is only scanned while results are missing, so common
+word prefixes cannot crowd out name or exact SKU matches. It is rebuilt
+lazily (two values() queries) whenever the shared catalog generation moves;
+the generation check itself is throttled to SEARCH_INDEX_CHECK_INTERVAL
+seconds so hot typeahead traffic rarely touches the cache either. With a
+per-process cache (LocMem) other processes' bumps are invisible, so the
+catalog's row counts and last update times stand in for the generation.
+
+Shared by the staff inventory search (PO/requisition forms) and the storefront
+search-as-you-type endpoint.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from apps.ecom.cache import get_catalog_generation
+from apps.helpers.utils import cache_is_shared
+
+# Match kinds, best first (also used as ranking weight)
+EXACT_CODE, NAME_PREFIX, CODE_PREFIX, WORD_PREFIX = 0, 1, 2, 3
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _normalise(text: str) -> str:
+    return (text or '').strip().lower()
+
+
+def _words(text: str):
+    return _WORD_RE.findall(_normalise(text))
+
+
+class ProductSearchIndex:
+    """Immutable snapshot; a rebuild creates a new instance and swaps it in."""
+
+    def __init__(self, products, variants, generation):
+        self.generation = generation
+        self.products = {}
+        terms = {NAME_PREFIX: [], CODE_PREFIX: [], WORD_PREFIX: []}
+        variant_counts = defaultdict(int)
+        for v in variants:
+            if v['product_id'] not in products:
+                continue
+            if v['is_active']:
+                variant_counts[v['product_id']] += 1
+            for code in (v['sku'], v['barcode']):
+                code = _normalise(code)
+                if code:
+                    terms[CODE_PREFIX].append((code, v['product_id']))
+
+        for pid, p in products.items():
+            words = set(_words(p['name']))
+            self.products[pid] = {
+                'id': pid,
+                'name': p['name'],
+                'slug': p['slug'],
+                'thumbnail': p['thumbnail'] or '',
+                'brand': p['brand__name'] or '',
+                'category': p['category__name'] or '',
+                'variant_count': variant_counts.get(pid, 0),
+                '_words': words,
+            }
+            terms[NAME_PREFIX].append((_normalise(p['name']), pid))
+            for word in words:
+                terms[WORD_PREFIX].append((word, pid))
+        for kind_terms in terms.values():
+            kind_terms.sort()
+        self.terms = terms
+
+    def _prefix_scan(self, kind, prefix, limit, exact=False):
+        """(term, pid) of ``kind`` starting with (or, exact, equal to) ``prefix``, in term order."""
+        terms = self.terms[kind]
+        idx = bisect_left(terms, (prefix,))
+        out = []
+        while idx < len(terms) and len(out) < limit:
+            term, pid = terms[idx]
+            if term != prefix if exact else not term.startswith(prefix):
+                break
+            out.append((term, pid))
+            idx += 1
+        return out
+
+    def search(self, query, limit=20):
+        query = _normalise(query)
+        if not query:
+            return []
+        tokens = _words(query)
+        scan_limit = max(limit * 10, 200)
+
+        best = {}
+
+        def offer(kind, term, pid):
+            if pid not in best or (kind, len(term)) < best[pid]:
+                best[pid] = (kind, len(term))
+
+        # Best kind first; a worse kind cannot outrank ``limit`` products already found
+        for term, pid in self._prefix_scan(CODE_PREFIX, query, scan_limit, exact=True):
+            offer(EXACT_CODE, term, pid)
+        for kind in (NAME_PREFIX, CODE_PREFIX, WORD_PREFIX):
+            if len(best) >= limit:
+                break
+            for term, pid in self._prefix_scan(kind, query, scan_limit):
+                offer(kind, term, pid)
+            # Multi-word queries: every token must prefix some word of the name ("red shi" -> "Red Shirt")
+            if kind == WORD_PREFIX and len(tokens) > 1:
+                for term, pid in self._prefix_scan(WORD_PREFIX, tokens[0], scan_limit):
+                    if pid in best:
+                        continue
+                    words = self.products[pid]['_words']
+                    if all(any(w.startswith(t) for w in words) for t in tokens[1:]):
+                        best[pid] = (WORD_PREFIX, len(term))
+
+        ranked = sorted(best.items(), key=lambda item: (item[1], self.products[item[0]]['name']))
+        return [
+            {k: v for k, v in self.products[pid].items() if not k.startswith('_')}
+            for pid, _ in ranked[:limit]
+        ]
+
+
+_lock = threading.Lock()
+_index = None
+_checked_at = 0.0
+
+
+def _build(generation):
+    from apps.ecom.models import Product, ProductVariant
+
+    products = {
+        p['id']: p for p in Product.objects.filter(is_active=True).values(
+            'id', 'name', 'slug', 'thumbnail', 'brand__name', 'category__name'
+        ).iterator(chunk_size=5000)
+    }
+    variants = ProductVariant.objects.filter(product__is_active=True).values(
+        'product_id', 'sku', 'barcode', 'is_active'
+    ).iterator(chunk_size=5000)
+    return ProductSearchIndex(products, variants, generation)
+
+
+def _catalog_fingerprint():
+    """Stand-in generation for per-process caches: row counts and last update times of what the index shows."""
+    from apps.ecom.models import Product, ProductVariant
+    from apps.master.models import Brand, Category
+
+    return tuple(
+        tuple(model.objects.aggregate(Count('id'), Max('updated_at')).values())
+        for model in (Product, ProductVariant, Brand, Category)
+    )
+
+
+def get_index() -> ProductSearchIndex:
+    """Return a current index, rebuilding if the catalog generation moved."""
+    global _index, _checked_at
+    now = time.monotonic()
+    interval = getattr(settings, 'SEARCH_INDEX_CHECK_INTERVAL', 2)
+    index = _index
+    if index is not None and now - _checked_at < interval:
+        return index
+    generation = get_catalog_generation() if cache_is_shared() else _catalog_fingerprint()
+    if index is not None and index.generation == generation:
+        _checked_at = now
+        return index
+    with _lock:
+        if _index is None or _index.generation != generation:
+            _index = _build(generation)
+        _checked_at = now
+        return _index
+
+
+def search_products(query, limit=20):
+    return get_index().search(query, limit=limit)
+
+
+def reset_index():
+    """Drop the in-process snapshot (next lookup rebuilds)."""
+    global _index, _checked_at
+    with _lock:
+        _index = None
+        _checked_at = 0.0
@@ -1,9 +1,44 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete, m2m_changed
-from django.dispatch import receiver
+from django.dispatch import receiver, Signal
 from django.core.cache import cache
 from django.db.backends.signals import connection_created
 
+from apps.ecom.cache import bump_catalog_generation
+from apps.ecom.jobs import schedule_home_warmup
 from apps.ecom.models import Product, ProductVariant, ProductImage
+from apps.ecom.price_history import record_price_changes
+from apps.master.models import Brand, Category
+
+
+# Sent by bulk variant operations (which bypass model signals) with the affected variant ids
+variants_bulk_changed = Signal()
+
+# Products collected while inside coalesce_product_invalidation()
+_invalidation_batch = contextvars.ContextVar('product_invalidation_batch', default=None)
+
+
+@contextmanager
+def coalesce_product_invalidation():
+    """
+    Collapse the per-row cache invalidations fired while the block runs into a
+    single invalidation, run once the surrounding transaction commits.
+    """
+    if _invalidation_batch.get() is not None:
+        yield  # already batching further up the stack
+        return
+    batch = {}
+    token = _invalidation_batch.set(batch)
+    try:
+        yield
+    finally:
+        _invalidation_batch.reset(token)
+        if batch:
+            slugs = [product.slug for product in batch.values()]
+            transaction.on_commit(lambda: invalidate_product_caches(slugs))
 
 
 # Signal to configure SQLite for better concurrency
@@ -37,6 +72,14 @@ def variant_changed(sender, instance, **kwargs):
     _invalidate_product_cache(instance.product)
 
 
+@receiver(post_save, sender=ProductVariant)
+def record_variant_price_history(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & {'price', 'discount_price', 'is_discount', 'purchase_price'}:
+        return
+    if instance._has_price_fields():
+        record_price_changes([instance])
+
+
 @receiver(post_save, sender=ProductImage)
 @receiver(post_delete, sender=ProductImage)
 def product_image_changed(sender, instance, **kwargs):
@@ -49,6 +92,16 @@ def variant_attributes_changed(sender, instance, action, **kwargs):
         _invalidate_product_cache(instance.product)
 
 
+# Brand/category names are denormalised into search results and fragments
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_taxonomy_changed(sender, instance, **kwargs):
+    bump_catalog_generation()
+    schedule_home_warmup()
+
+
 # Simple prefix-based invalidation (best-effort) - scans cache backend if supported
 PREFIXES = [
     'ProductViewSet', 'PopularProductViewSet', 'NewArrivalProductViewSet'
@@ -56,18 +109,25 @@ PREFIXES = [
 
 
 def _invalidate_product_cache(product: Product):
+    batch = _invalidation_batch.get()
+    if batch is not None:
+        batch[product.pk] = product
+        return
+    invalidate_product_caches([product.slug])
+
+
+def invalidate_product_caches(slugs):
+    """Bump the catalog generation and drop cached public product responses, once for all slugs."""
     try:
-        cache_backend = cache
-        base_key_prefix = getattr(cache_backend, 'key_prefix', '')
-        if hasattr(cache_backend, 'client') and hasattr(cache_backend.client, 'get_client'):
-            client = cache_backend.client.get_client(write=True)
+        bump_catalog_generation()
+        schedule_home_warmup()
+        if hasattr(cache, 'delete_pattern'):
+            # django-redis: SCAN + delete, handling key prefix/version itself
             for cls_name in PREFIXES:
-                pattern = f"{base_key_prefix}:public:{cls_name}:*" if base_key_prefix else f"public:{cls_name}:*"
-                for key in client.scan_iter(match=pattern):
-                    client.delete(key)
+                cache.delete_pattern(f"public:{cls_name}:*")
         else:
-            for cls_name in PREFIXES:
-                retrieve_key = f"public:{cls_name}:retrieve:{product.slug}"
-                cache.delete(retrieve_key)
+            cache.delete_many([
+                f"public:{cls_name}:retrieve:{slug}" for cls_name in PREFIXES for slug in slugs
+            ])
     except Exception:
         pass
@@ -1,17 +1,20 @@
 """
 Customer-facing storefront views.
 """
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import TemplateView
 
 
 from apps.cms.models import HomeSection
+from apps.ecom.home_fragments import render_home_fragments
 
 
 class StorefrontHomeView(TemplateView):
     """
     Homepage with hero slider, featured products, new arrivals.
-    All data loaded via AJAX from APIs.
+    Data loaded via AJAX from APIs, or rendered server-side from cached
+    fragments when STOREFRONT_SERVER_RENDER_HOME is enabled.
     """
     template_name = 'storefront/home.html'
 
@@ -23,6 +26,9 @@ class StorefrontHomeView(TemplateView):
         # Convert to a dictionary for easy access in template: {section_type: True}
         # This allows for {% if home_sections.flash_sale %} style checks
         context['home_sections'] = {s.section_type: True for s in sections}
+        context['fragments'] = {}
+        if getattr(settings, 'STOREFRONT_SERVER_RENDER_HOME', False):
+            context['fragments'] = render_home_fragments(sections, self.request)
         return context
 
 
@@ -7,8 +7,11 @@ from apps.ecom.product import (
     ProductListView,
     get_attribute_values,
     product_list_ajax,  # <-- Add this import
+    product_variant_matrix,
 )
 from apps.ecom.product_images import manage_product_images  # added import
+from apps.ecom.exports import export_variants, merchant_feed
+from apps.ecom.bulk_pricing import bulk_price_apply, bulk_price_preview
 from apps.ecom.storefront_views import (
     StorefrontHomeView,
     ProductListView as StorefrontProductListView,
@@ -54,6 +57,13 @@ urlpatterns = [
     path('add-product/', ProductCreateView.as_view(), name='product_create'),
     path('product/<int:product_id>/edit-step1/', ProductStep1EditView.as_view(), name='product_step1_edit'),
     path('product/<int:product_id>/variants/', ProductVariantWarehouseView.as_view(), name='product_variants_step'),
+    path('product/<int:product_id>/variants/matrix/', product_variant_matrix, name='product_variant_matrix'),
     path('ajax/get-attribute-values/', get_attribute_values, name='get_attribute_values'),
     path('product/<int:product_id>/images/', manage_product_images, name='product_images'),  # added path
+    path('product/export/', export_variants, name='product_export'),
+    path('product/bulk-price/preview/', bulk_price_preview, name='product_bulk_price_preview'),
+    path('product/bulk-price/apply/', bulk_price_apply, name='product_bulk_price_apply'),
+
+    # Feeds
+    path('feeds/google-merchant.xml', merchant_feed, name='merchant_feed'),
 ]
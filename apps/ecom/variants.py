@@ -0,0 +1,348 @@
+"""
+Set-based variant persistence.
+
+``upsert_variants`` replaces the per-row save loop of the variant editor: all
+referenced attribute values are fetched once, variants are written with
+bulk_create/bulk_update, the attribute through-table is rewritten in bulk,
+variant names are generated in memory and cache invalidation is coalesced to
+one run per product after commit.
+
+``plan_variant_matrix``/``apply_variant_matrix`` generate variants for any
+number of attributes: the Cartesian product of the selected values is walked
+lazily and diffed against existing variants by attribute signature (a
+frozenset of value ids, so lookups are O(1)), producing create/keep/retire sets
+that are persisted with the same bulk operations.
+"""
+import itertools
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import ProtectedError, Q
+from django.utils import timezone
+from django.utils.text import slugify
+
+from apps.ecom.models import Product, ProductVariant
+from apps.ecom.price_history import record_price_changes
+from apps.ecom.signals import coalesce_product_invalidation, variants_bulk_changed
+from apps.master.models import AttributeValue
+
+VARIANT_UPDATE_FIELDS = [
+    'sku', 'variant_name', 'price', 'purchase_price', 'is_active', 'is_discount', 'discount_price',
+    'updated_at',  # bulk_update() does not apply auto_now
+]
+
+
+class VariantUpsertError(ValueError):
+    """Raised when submitted variant rows cannot be persisted."""
+
+
+def variant_name_for(values):
+    """
+    Name from attribute values ordered by _sort_values (attributes in their
+    display order): "Red", "Red (M)", "Red (M / Cotton)".
+    """
+    if not values:
+        return ''
+    first, rest = values[0].value, [v.value for v in values[1:]]
+    return f"{first} ({' / '.join(rest)})" if rest else first
+
+
+def _attribute_key(value):
+    return value.attribute.display_order, value.attribute.name
+
+
+def _sort_values(values):
+    """Attribute order (display_order, name) first, then value order; values need their attribute loaded."""
+    return sorted(values, key=lambda v: (*_attribute_key(v), v.display_order, v.value))
+
+
+@transaction.atomic
+def upsert_variants(product: Product, rows, default_index=None, delete_missing=True):
+    """
+    Persist variant rows for a product in a fixed number of queries.
+
+    rows: iterable of dicts with keys id (optional), sku, price, purchase_price,
+    is_active, is_discount, discount_price and attribute_value_ids.
+    Variants of the product not present in rows are deleted when delete_missing.
+    Names are generated from the attribute values for new variants and for
+    those still carrying a generated (or blank) name; names edited by staff
+    are kept. Returns the saved variants in row order.
+    """
+    rows = list(rows)
+    existing = {v.id: v for v in product.variants.prefetch_related('attributes__attribute')}
+
+    value_ids = {int(vid) for row in rows for vid in row.get('attribute_value_ids') or []}
+    values = AttributeValue.objects.select_related('attribute').in_bulk(value_ids) if value_ids else {}
+    unknown = value_ids - set(values)
+    if unknown:
+        raise VariantUpsertError(f"Unknown attribute value(s): {', '.join(map(str, sorted(unknown)))}")
+
+    skus = [row['sku'] for row in rows]
+    taken = set(
+        ProductVariant.objects.filter(sku__in=skus).exclude(product=product).values_list('sku', flat=True)
+    )
+    if taken:
+        raise VariantUpsertError(f"SKU already used by another product: {', '.join(sorted(taken))}")
+
+    to_create, to_update, variants, row_values = [], [], [], []
+    now = timezone.now()
+    for row in rows:
+        vid = int(row['id']) if row.get('id') else None
+        if vid is not None and vid not in existing:
+            raise VariantUpsertError(f"Variant {vid} does not belong to this product.")
+        variant = existing[vid] if vid is not None else ProductVariant(product=product)
+        generated = vid is None or variant.variant_name == variant_name_for(_sort_values(variant.attributes.all()))
+        for field in ('sku', 'price', 'purchase_price', 'is_active', 'is_discount', 'discount_price'):
+            setattr(variant, field, row.get(field))
+        attr_values = _sort_values([values[int(v)] for v in row.get('attribute_value_ids') or []])
+        if generated or not variant.variant_name:
+            variant.variant_name = variant_name_for(attr_values) or variant.variant_name
+        if vid is not None:
+            variant.updated_at = now
+        (to_update if vid is not None else to_create).append(variant)
+        variants.append(variant)
+        row_values.append(attr_values)
+
+    kept_ids = {v.id for v in to_update}
+    removed_ids = [vid for vid in existing if vid not in kept_ids] if delete_missing else []
+    through = ProductVariant.attributes.through
+
+    with coalesce_product_invalidation():
+        if removed_ids:
+            if product.default_variant_id in removed_ids:
+                Product.objects.filter(pk=product.pk).update(default_variant=None)
+                product.default_variant = None
+            # Frees SKUs for reuse by the new rows below
+            ProductVariant.objects.filter(id__in=removed_ids).delete()
+        if to_update:
+            ProductVariant.objects.bulk_update(to_update, VARIANT_UPDATE_FIELDS, batch_size=500)
+            through.objects.filter(productvariant_id__in=kept_ids).delete()
+        if to_create:
+            ProductVariant.objects.bulk_create(to_create, batch_size=500)
+
+        through.objects.bulk_create(
+            [
+                through(productvariant_id=variant.id, attributevalue_id=value.id)
+                for variant, attr_values in zip(variants, row_values)
+                for value in attr_values
+            ],
+            batch_size=1000,
+        )
+
+        default = None
+        if default_index is not None and 0 <= int(default_index) < len(variants):
+            default = variants[int(default_index)]
+        elif product.default_variant_id is None and variants:
+            default = variants[0]
+        product.is_variant = True
+        update_fields = ['is_variant']
+        if default is not None:
+            product.default_variant = default
+            update_fields.append('default_variant')
+        product.save(update_fields=update_fields)
+
+        record_price_changes(variants)
+        variants_bulk_changed.send(sender=ProductVariant, product=product, variant_ids=[v.id for v in variants])
+    return variants
+
+
+# -------------------------------
+# N-dimensional matrix generator
+# -------------------------------
+DEFAULT_SKU_TEMPLATE = '{product}-{values}'
+SKU_LOOKUP_CHUNK = 1000
+
+
+def _value_token(value):
+    return (value.code or slugify(value.value) or str(value.id)).upper()
+
+
+def render_sku(template, product, values, index):
+    """Fill a SKU template; placeholders: {product}, {product_id}, {values}, {index}."""
+    try:
+        return template.format(
+            product=(product.slug or str(product.id)).upper(),
+            product_id=product.id,
+            values='-'.join(_value_token(v) for v in values),
+            index=index,
+        )
+    except (KeyError, IndexError, AttributeError, TypeError, ValueError) as e:
+        # Unknown placeholders, attribute/index access on them, bad format specs
+        raise VariantUpsertError(f'Invalid SKU template: {e!r}.')
+
+
+class VariantMatrixPlan:
+    """Result of diffing a value matrix against a product's variants."""
+
+    def __init__(self, product, dimensions):
+        self.product = product
+        self.dimensions = dimensions  # [(attribute_id, [AttributeValue, ...]), ...]
+        self.create = []  # [(sku, (AttributeValue, ...)), ...]
+        self.keep = []  # [ProductVariant, ...]
+        self.retire = []  # [ProductVariant, ...]
+
+    @property
+    def combination_count(self):
+        count = 1
+        for _, values in self.dimensions:
+            count *= len(values)
+        return count
+
+    def as_dict(self, preview=20):
+        return {
+            'combinations': self.combination_count,
+            'create': len(self.create),
+            'keep': len(self.keep),
+            'retire': len(self.retire),
+            'create_preview': [
+                {'sku': sku, 'variant_name': variant_name_for(values), 'attribute_value_ids': [v.id for v in values]}
+                for sku, values in self.create[:preview]
+            ],
+            'retire_preview': [{'id': v.id, 'sku': v.sku} for v in self.retire[:preview]],
+        }
+
+
+def _unique_skus(candidates):
+    """Suffix candidates (-2, -3, ...) that collide with each other or existing SKUs."""
+    taken = set()
+    for start in range(0, len(candidates), SKU_LOOKUP_CHUNK):
+        chunk = candidates[start:start + SKU_LOOKUP_CHUNK]
+        taken.update(ProductVariant.objects.filter(sku__in=chunk).values_list('sku', flat=True))
+
+    result, pending = [], []
+    for idx, sku in enumerate(candidates):
+        if sku in taken:
+            pending.append(idx)
+            result.append(None)
+        else:
+            taken.add(sku)
+            result.append(sku)
+
+    suffix = 2
+    while pending:
+        tries = {idx: f"{candidates[idx]}-{suffix}" for idx in pending}
+        taken.update(ProductVariant.objects.filter(sku__in=tries.values()).values_list('sku', flat=True))
+        still = []
+        for idx, sku in tries.items():
+            if sku in taken:
+                still.append(idx)
+            else:
+                taken.add(sku)
+                result[idx] = sku
+        pending, suffix = still, suffix + 1
+    return result
+
+
+def plan_variant_matrix(product: Product, value_ids_by_attribute, sku_template=DEFAULT_SKU_TEMPLATE):
+    """
+    Diff the Cartesian product of value_ids_by_attribute ({attribute_id: [value_id, ...]})
+    against the product's variants. Runs a fixed number of queries for any matrix size.
+    """
+    requested = {int(a): {int(v) for v in ids} for a, ids in value_ids_by_attribute.items() if ids}
+    if not requested:
+        raise VariantUpsertError('Select at least one attribute value.')
+    all_ids = set().union(*requested.values())
+    values = AttributeValue.objects.select_related('attribute').in_bulk(all_ids)
+    dimensions = []
+    for attribute_id in sorted(requested):
+        dim = [values[v] for v in requested[attribute_id] if v in values]
+        if len(dim) != len(requested[attribute_id]) or any(v.attribute_id != attribute_id for v in dim):
+            raise VariantUpsertError(f'Invalid values for attribute {attribute_id}.')
+        dimensions.append((attribute_id, _sort_values(dim)))
+    # Same attribute order as variant names (and the {values} SKU placeholder)
+    dimensions.sort(key=lambda dimension: _attribute_key(dimension[1][0]))
+
+    plan = VariantMatrixPlan(product, dimensions)
+    variants = {v.id: v for v in product.variants.all()}
+    signatures = {vid: set() for vid in variants}
+    for vid, value_id in ProductVariant.attributes.through.objects.filter(
+            productvariant__product=product).values_list('productvariant_id', 'attributevalue_id'):
+        signatures[vid].add(value_id)
+    by_signature = {frozenset(sig): variants[vid] for vid, sig in signatures.items()}
+
+    seen, candidates, combos = set(), [], []
+    # itertools.product is lazy: only new combinations are materialised
+    for index, combo in enumerate(itertools.product(*(dim for _, dim in dimensions)), start=1):
+        signature = frozenset(v.id for v in combo)
+        variant = by_signature.get(signature)
+        if variant is not None:
+            plan.keep.append(variant)
+            seen.add(variant.id)
+        else:
+            candidates.append(render_sku(sku_template, product, combo, index))
+            combos.append(combo)
+
+    plan.create = list(zip(_unique_skus(candidates), combos))
+    plan.retire = [v for vid, v in variants.items() if vid not in seen]
+    return plan
+
+
+@transaction.atomic
+def apply_variant_matrix(plan: VariantMatrixPlan, price=None, purchase_price=None, retire='deactivate'):
+    """
+    Persist a plan: bulk-create new combinations, re-activate kept ones and
+    retire the rest (retire='deactivate' or 'delete'). Variants that still
+    have stock, holds or cart lines, or are referenced by purchasing/receiving
+    records, are deactivated instead of deleted.
+    """
+    product = plan.product
+    if price is None:
+        price = product.default_variant.price if product.default_variant_id else Decimal('0.00')
+
+    through = ProductVariant.attributes.through
+    with coalesce_product_invalidation():
+        created = [
+            ProductVariant(
+                product=product, sku=sku, variant_name=variant_name_for(list(values)),
+                price=price, purchase_price=purchase_price, is_active=True,
+            )
+            for sku, values in plan.create
+        ]
+        ProductVariant.objects.bulk_create(created, batch_size=500)
+        through.objects.bulk_create(
+            [
+                through(productvariant_id=variant.id, attributevalue_id=value.id)
+                for variant, (_, values) in zip(created, plan.create)
+                for value in values
+            ],
+            batch_size=1000,
+        )
+
+        kept_ids = [v.id for v in plan.keep]
+        ProductVariant.objects.filter(id__in=kept_ids, is_active=False).update(is_active=True, updated_at=timezone.now())
+
+        retire_ids = [v.id for v in plan.retire]
+        if retire_ids and product.default_variant_id in retire_ids:
+            Product.objects.filter(pk=product.pk).update(default_variant=None)
+            product.default_variant = None
+        deleted = []
+        if retire_ids and retire == 'delete':
+            # Deleting would cascade to these rows; such variants are only deactivated
+            in_use = set(
+                ProductVariant.objects.filter(id__in=retire_ids).filter(
+                    Q(stocks__quantity_on_hand__gt=0) | Q(stocks__quantity_reserved__gt=0)
+                    | Q(reservations__isnull=False) | Q(cart_items__isnull=False)
+                ).values_list('id', flat=True)
+            )
+            deletable = [vid for vid in retire_ids if vid not in in_use]
+            try:
+                with transaction.atomic():
+                    ProductVariant.objects.filter(id__in=deletable).delete()
+                deleted = deletable
+            except ProtectedError:
+                deleted = []
+        deactivate = [vid for vid in retire_ids if vid not in set(deleted)]
+        if deactivate:
+            ProductVariant.objects.filter(id__in=deactivate).update(is_active=False, updated_at=timezone.now())
+
+        product.is_variant = True
+        update_fields = ['is_variant']
+        if product.default_variant_id is None and (plan.keep or created):
+            product.default_variant = (plan.keep or created)[0]
+            update_fields.append('default_variant')
+        product.save(update_fields=update_fields)
+
+        record_price_changes(created)
+        changed = [v.id for v in created] + kept_ids + deactivate
+        variants_bulk_changed.send(sender=ProductVariant, product=product, variant_ids=changed)
+    return created
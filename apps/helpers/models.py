@@ -33,3 +33,55 @@ class UserTimestampMixin(models.Model):
 
     class Meta:
         abstract = True
+
+
+class FieldTrackerMixin:
+    """
+    Remembers ``tracked_fields`` as loaded from the database (from_db) so code
+    can ask what changed without re-reading the row:
+
+        order.has_changed('status'), order.previous_value('status')
+
+    The snapshot is refreshed after save() - post_save receivers still see the
+    values the row had before - and by refresh_from_db(). Instances that were
+    never loaded, and fields that were deferred, count as changed.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def _snapshot_tracked_fields(self, names=None):
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        for name in self.tracked_fields:
+            attname = self._meta.get_field(name).attname
+            if (names is None or name in names or attname in names) and attname in self.__dict__:
+                loaded[name] = self.__dict__[attname]
+
+    def has_changed(self, name) -> bool:
+        loaded = self.__dict__.get('_loaded_values', {})
+        if name not in loaded:
+            return True
+        return getattr(self, self._meta.get_field(name).attname) != loaded[name]
+
+    def previous_value(self, name):
+        """Value of ``name`` when loaded (None if it was not)."""
+        return self.__dict__.get('_loaded_values', {}).get(name)
+
+    def changed_fields(self) -> dict:
+        """{name: (previous, current)} for tracked fields that changed."""
+        return {
+            name: (self.previous_value(name), getattr(self, self._meta.get_field(name).attname))
+            for name in self.tracked_fields if self.has_changed(name)
+        }
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_tracked_fields(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_tracked_fields(fields)
@@ -1,6 +1,9 @@
 import calendar
 import re
 
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
 from django.db import models
 from django.urls import reverse
 from django.utils import timezone
@@ -56,6 +59,11 @@ def cleanhtml(raw_html):
     return cleantext
 
 
+def cache_is_shared(alias='default') -> bool:
+    """False for per-process cache backends (LocMem, dummy): other processes never see their writes."""
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
 class CsrfExemptSessionAuthentication(SessionAuthentication):
     def enforce_csrf(self, request):
         pass
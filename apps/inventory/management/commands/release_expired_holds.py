@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.inventory.reservations import DEFAULT_CHUNK_SIZE, release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Release lapsed add-to-cart stock holds, in chunks. Schedule it (e.g. every few minutes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Holds per transaction')
+
+    def handle(self, *args, **options):
+        released = release_expired_holds(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired hold(s)."))
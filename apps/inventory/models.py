@@ -393,6 +393,47 @@ class Stock(UserTimestampMixin):
         return self.quantity_on_hand - self.quantity_reserved
 
 
+class StockReservation(models.Model):
+    """
+    A hold on warehouse stock (see apps.inventory.reservations). Cart holds
+    are keyed by ``holder`` and expire; order holds belong to ``order`` and
+    last until the order is confirmed (converted into an 'out' movement) or
+    cancelled. Stock.quantity_reserved mirrors the active holds.
+    """
+    STATUS_ACTIVE = 'active'
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('released', 'Released'),
+        ('converted', 'Converted'),
+        ('reversed', 'Reversed'),
+    ]
+
+    product_variant = models.ForeignKey('ecom.ProductVariant', on_delete=models.CASCADE, related_name='reservations')
+    warehouse = models.ForeignKey('master.Warehouse', on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.DecimalField(max_digits=12, decimal_places=2)
+    holder = models.CharField(max_length=64, blank=True, help_text='Cart owner key for cart holds')
+    order = models.ForeignKey('order.Order', on_delete=models.CASCADE, null=True, blank=True,
+                              related_name='stock_reservations')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Stock Reservation'
+        verbose_name_plural = 'Stock Reservations'
+        indexes = [
+            # Available = on hand - SUM(active holds) per variant/warehouse
+            models.Index(fields=['product_variant', 'warehouse', 'expires_at'],
+                         condition=models.Q(status='active'), name='inv_resv_active_idx'),
+            models.Index(fields=['holder'], condition=models.Q(status='active'), name='inv_resv_holder_idx'),
+            models.Index(fields=['expires_at'], condition=models.Q(status='active'), name='inv_resv_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.status} {self.product_variant_id}@{self.warehouse_id} x {self.quantity}"
+
+
 class StockMovement(UserTimestampMixin):
     MOVEMENT_TYPES = [
         ('in', 'In'),
@@ -0,0 +1,301 @@
+"""
+Stock reservations (holds) with expiry.
+
+A hold takes ``quantity`` of a variant in one warehouse out of what can be
+sold:
+
+    available = Stock.quantity_on_hand - SUM(active, unexpired holds)
+
+aggregated per variant/warehouse over the partial index inv_resv_active_idx.
+Holds are created
+
+- at checkout (Order.create_from_cart) for every stock-tracked line; they
+  belong to the order and do not expire, and
+- at add-to-cart for scarce variants (ProductVariant.stock at or below
+  INVENTORY_SCARCE_THRESHOLD), keyed by the cart owner and expiring after
+  INVENTORY_CART_HOLD_TTL seconds; checkout takes them over, clearing the
+  cart releases them, a guest signing in moves them to the user's key and
+  a removed line's hold simply lapses.
+
+Confirming an order turns its holds into StockMovement 'out' entries
+(quantity_on_hand goes down); cancelling releases active holds and reverses
+converted ones with 'in' movements. ``release_expired_holds`` (scheduled)
+sweeps expired cart holds.
+
+Every writer locks the variants' Stock rows first, in id order, and only then
+touches holds, so holds, conversions and sweeps cannot deadlock each other.
+Stock.quantity_reserved is kept equal to the active holds in the same
+transaction. Variants without Stock rows are not tracked per warehouse and
+never get holds.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Sum, When
+from django.utils import timezone
+
+from apps.inventory.models import Stock, StockMovement, StockReservation
+from apps.inventory.scan import record_variant_changes
+
+ACTIVE = StockReservation.STATUS_ACTIVE
+HOLD_FIELDS = ('id', 'product_variant_id', 'warehouse_id', 'quantity')
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def format_quantity(value) -> str:
+    return f"{Decimal(value).normalize():f}"
+
+
+class InsufficientStock(ValidationError):
+    def __init__(self, variant_id, requested, available):
+        self.variant_id, self.requested, self.available = variant_id, requested, max(available, 0)
+        super().__init__(f"Only {format_quantity(self.available)} available, {format_quantity(requested)} requested.")
+
+
+def cart_hold_ttl() -> int:
+    return getattr(settings, 'INVENTORY_CART_HOLD_TTL', 15 * 60)
+
+
+def is_scarce(variant) -> bool:
+    """Worth holding at add-to-cart: low on stock and not sold on backorder (product loaded)."""
+    threshold = getattr(settings, 'INVENTORY_SCARCE_THRESHOLD', 0)
+    product = variant.product
+    return (threshold > 0 and product.track_inventory and not product.allow_backorder
+            and variant.stock <= threshold)
+
+
+def active_holds(now=None):
+    now = now or timezone.now()
+    return StockReservation.objects.filter(status=ACTIVE).filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+
+
+def held_quantities(variant_ids) -> dict:
+    """{(variant_id, warehouse_id): quantity under active holds}."""
+    rows = (
+        active_holds().filter(product_variant_id__in=variant_ids)
+        .values('product_variant_id', 'warehouse_id').annotate(held=Sum('quantity'))
+    )
+    return {(row['product_variant_id'], row['warehouse_id']): row['held'] for row in rows}
+
+
+def available_quantities(variant_ids) -> dict:
+    """{variant_id: on hand - active holds} over all warehouses, for variants with Stock rows."""
+    on_hand = dict(
+        Stock.objects.filter(product_variant_id__in=variant_ids)
+        .values('product_variant_id').annotate(total=Sum('quantity_on_hand'))
+        .values_list('product_variant_id', 'total')
+    )
+    held = defaultdict(Decimal)
+    for (variant_id, _), quantity in held_quantities(list(on_hand)).items():
+        held[variant_id] += quantity
+    return {variant_id: total - held[variant_id] for variant_id, total in on_hand.items()}
+
+
+# -------------------------------
+# Internals
+# -------------------------------
+def _lock_stock(variant_ids):
+    return list(
+        Stock.objects.select_for_update()
+        .filter(product_variant_id__in=variant_ids)
+        .order_by('product_variant_id', 'warehouse_id')
+    )
+
+
+def _add_to_stock(field: str, deltas: dict) -> None:
+    """Add {(variant_id, warehouse_id): delta} to a Stock column in one UPDATE."""
+    deltas = {pair: delta for pair, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    matches = Q()
+    whens = []
+    for (variant_id, warehouse_id), delta in deltas.items():
+        matches |= Q(product_variant_id=variant_id, warehouse_id=warehouse_id)
+        whens.append(When(product_variant_id=variant_id, warehouse_id=warehouse_id, then=F(field) + delta))
+    Stock.objects.filter(matches).update(**{
+        field: Case(*whens, default=F(field), output_field=DecimalField(max_digits=12, decimal_places=2)),
+    })
+
+
+def _sums(holds) -> dict:
+    sums = defaultdict(Decimal)
+    for row in holds:
+        sums[(row['product_variant_id'], row['warehouse_id'])] += row['quantity']
+    return sums
+
+
+def _close(holds, status: str) -> dict:
+    """Move locked hold rows to ``status``; returns their quantities per variant/warehouse."""
+    StockReservation.objects.filter(pk__in=[row['id'] for row in holds]).update(status=status, updated_at=timezone.now())
+    return _sums(holds)
+
+
+def _release_locked(holds) -> None:
+    sums = _close(holds, 'released')
+    _add_to_stock('quantity_reserved', {pair: -quantity for pair, quantity in sums.items()})
+
+
+def _publish(variant_ids) -> None:
+    # Stock rows were changed with update(): no post_save for the scan snapshot
+    variant_ids = list(variant_ids)
+    transaction.on_commit(lambda: record_variant_changes(variant_ids))
+
+
+def _locked_holds(queryset):
+    """Lock the Stock rows behind ``queryset``'s holds, then read the holds."""
+    variant_ids = set(queryset.values_list('product_variant_id', flat=True))
+    if not variant_ids:
+        return variant_ids, []
+    _lock_stock(variant_ids)
+    return variant_ids, list(queryset.values(*HOLD_FIELDS))
+
+
+def _owner_filter(holder: str, order) -> Q:
+    return Q(order=order) if order is not None else Q(holder=holder, order__isnull=True)
+
+
+# -------------------------------
+# API
+# -------------------------------
+def hold(lines: dict, holder: str = '', order=None, ttl=None) -> list:
+    """
+    Hold {variant_id: quantity} for a cart owner key (``holder``) or an
+    ``order``, replacing that owner's active holds on those variants.
+    ttl: seconds until the hold lapses (None: until released/converted).
+    Raises InsufficientStock; variants without Stock rows are skipped.
+    """
+    lines = {variant_id: Decimal(quantity) for variant_id, quantity in lines.items() if quantity}
+    if not lines:
+        return []
+    with transaction.atomic():
+        stocks = _lock_stock(lines)
+        if not stocks:
+            return []
+        previous = list(
+            StockReservation.objects.filter(_owner_filter(holder, order), status=ACTIVE, product_variant_id__in=lines)
+            .values(*HOLD_FIELDS)
+        )
+        if previous:
+            _release_locked(previous)
+
+        held = held_quantities(lines)
+        warehouses = defaultdict(list)
+        for stock in stocks:
+            pair = (stock.product_variant_id, stock.warehouse_id)
+            warehouses[stock.product_variant_id].append((stock.warehouse_id, stock.quantity_on_hand - held.get(pair, 0)))
+
+        expires_at = timezone.now() + timedelta(seconds=ttl) if ttl else None
+        holds, reserved = [], defaultdict(Decimal)
+        for variant_id, need in lines.items():
+            if variant_id not in warehouses:
+                continue
+            # Fullest warehouses first, so a line is split as little as possible
+            candidates = sorted(warehouses[variant_id], key=lambda row: row[1], reverse=True)
+            available = sum((max(row[1], 0) for row in candidates), Decimal('0'))
+            if available < need:
+                raise InsufficientStock(variant_id, need, available)
+            for warehouse_id, free in candidates:
+                take = min(free, need)
+                if take <= 0:
+                    break
+                holds.append(StockReservation(
+                    product_variant_id=variant_id, warehouse_id=warehouse_id, quantity=take,
+                    holder='' if order is not None else holder, order=order, expires_at=expires_at,
+                ))
+                reserved[(variant_id, warehouse_id)] += take
+                need -= take
+
+        StockReservation.objects.bulk_create(holds)
+        _add_to_stock('quantity_reserved', reserved)
+        _publish(lines)
+    return holds
+
+
+def release(holder: str = '', order=None, variant_ids=None) -> int:
+    """Release the owner's active holds (optionally only on ``variant_ids``); returns how many."""
+    queryset = StockReservation.objects.filter(_owner_filter(holder, order), status=ACTIVE)
+    if variant_ids is not None:
+        queryset = queryset.filter(product_variant_id__in=variant_ids)
+    with transaction.atomic():
+        touched, holds = _locked_holds(queryset)
+        if holds:
+            _release_locked(holds)
+            _publish(touched)
+    return len(holds)
+
+
+def transfer(holder: str, new_holder: str) -> int:
+    """Hand ``holder``'s active cart holds to ``new_holder`` (guest cart merged on login); returns how many."""
+    queryset = StockReservation.objects.filter(holder=holder, order__isnull=True, status=ACTIVE)
+    with transaction.atomic():
+        _, holds = _locked_holds(queryset)
+        if holds:
+            # Quantities do not change, so Stock.quantity_reserved stays as it is
+            StockReservation.objects.filter(pk__in=[row['id'] for row in holds]).update(
+                holder=new_holder, updated_at=timezone.now(),
+            )
+    return len(holds)
+
+
+def convert_order_holds(order) -> int:
+    """Order confirmed: its active holds leave stock as 'out' movements."""
+    with transaction.atomic():
+        touched, holds = _locked_holds(StockReservation.objects.filter(order=order, status=ACTIVE))
+        if not holds:
+            return 0
+        sums = _close(holds, 'converted')
+        _add_to_stock('quantity_reserved', {pair: -quantity for pair, quantity in sums.items()})
+        _add_to_stock('quantity_on_hand', {pair: -quantity for pair, quantity in sums.items()})
+        StockMovement.objects.bulk_create([
+            StockMovement(product_variant_id=variant_id, warehouse_id=warehouse_id, movement_type='out',
+                          quantity=-quantity, reference=order.order_number, note='Order confirmed')
+            for (variant_id, warehouse_id), quantity in sums.items()
+        ])
+        _publish(touched)
+    return len(holds)
+
+
+def cancel_order_holds(order) -> int:
+    """Order cancelled: release active holds and put converted quantities back with 'in' movements."""
+    released = release(order=order)
+    with transaction.atomic():
+        touched, holds = _locked_holds(StockReservation.objects.filter(order=order, status='converted'))
+        if not holds:
+            return released
+        sums = _close(holds, 'reversed')
+        _add_to_stock('quantity_on_hand', sums)
+        StockMovement.objects.bulk_create([
+            StockMovement(product_variant_id=variant_id, warehouse_id=warehouse_id, movement_type='in',
+                          quantity=quantity, reference=order.order_number, note='Order cancelled')
+            for (variant_id, warehouse_id), quantity in sums.items()
+        ])
+        _publish(touched)
+    return released + len(holds)
+
+
+def release_expired_holds(chunk_size=DEFAULT_CHUNK_SIZE) -> int:
+    """Release lapsed holds chunk by chunk (one short transaction each); returns how many."""
+    released = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                StockReservation.objects.filter(status=ACTIVE, expires_at__lte=timezone.now())
+                .order_by('expires_at').values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            # Re-checked after locking: a hold refreshed meanwhile is no longer expired
+            touched, holds = _locked_holds(
+                StockReservation.objects.filter(pk__in=ids, status=ACTIVE, expires_at__lte=timezone.now())
+            )
+            if holds:
+                _release_locked(holds)
+                _publish(touched)
+        released += len(holds)
+        if len(ids) < chunk_size:
+            break
+    return released
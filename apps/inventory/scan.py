@@ -0,0 +1,232 @@
+"""
+Barcode/SKU scan snapshot for receiving (GRN) and counter workflows.
+
+Each process keeps a warm ``code -> variant`` map (id, sku, barcode, name,
+price, purchase_price, stock and available quantity per warehouse) so a batch
+of scanned codes resolves with dict lookups instead of model instances.
+
+Invalidation is incremental: variant/stock signals append the changed variant
+id(s) to a short changelog in the shared cache and bump a version counter. On the
+next lookup a process reads the entries it has not seen yet and reloads just
+those variants (two queries). If the changelog has gaps (evicted, restarted
+cache) or is too long, the snapshot is rebuilt from scratch. Bulk ``update()``
+calls bypass signals, so snapshots are also rebuilt after SCAN_INDEX_MAX_AGE
+seconds.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from apps.ecom.models import ProductVariant
+from apps.inventory.models import Stock
+
+SCAN_VERSION_KEY = 'inventory:scan:version'
+SCAN_CHANGE_KEY = 'inventory:scan:change:{}'
+SCAN_CHANGE_TTL = 60 * 60
+# Beyond this many pending changes (or changed variants) a full rebuild is
+# cheaper than replaying
+MAX_REPLAY = 500
+MAX_REPLAY_VARIANTS = 5000
+
+VARIANT_FIELDS = (
+    'id', 'sku', 'barcode', 'variant_name', 'product_id', 'product__name',
+    'price', 'purchase_price', 'stock', 'is_active',
+)
+
+
+def _seed() -> int:
+    return int(time.time() * 1000)
+
+
+def _current_version() -> int:
+    version = cache.get(SCAN_VERSION_KEY)
+    if version is None:
+        cache.add(SCAN_VERSION_KEY, _seed(), timeout=None)
+        version = cache.get(SCAN_VERSION_KEY) or _seed()
+    return version
+
+
+def record_variant_changes(variant_ids):
+    """Publish changed variant ids to every process' snapshot (best-effort)."""
+    variant_ids = list(variant_ids)
+    if not variant_ids:
+        return
+    try:
+        try:
+            version = cache.incr(SCAN_VERSION_KEY)
+        except ValueError:
+            # Counter lost: a fresh seed forces everyone into a full rebuild
+            cache.add(SCAN_VERSION_KEY, _seed(), timeout=None)
+            return
+        if len(variant_ids) > MAX_REPLAY_VARIANTS:
+            # Bulk repricing etc.: no change entry, so readers see a gap and rebuild
+            return
+        cache.set(SCAN_CHANGE_KEY.format(version), variant_ids, SCAN_CHANGE_TTL)
+    except Exception:
+        pass
+
+
+def record_variant_change(variant_id):
+    record_variant_changes([variant_id])
+
+
+def _row(values, stocks):
+    name = values['product__name']
+    if values['variant_name']:
+        name = f"{name} - {values['variant_name']}"
+    return {
+        'id': values['id'],
+        'sku': values['sku'],
+        'barcode': values['barcode'],
+        'name': name,
+        'product_id': values['product_id'],
+        'price': values['price'],
+        'purchase_price': values['purchase_price'],
+        'stock': values['stock'],
+        'is_active': values['is_active'],
+        # {warehouse_id: available quantity}
+        'warehouses': stocks.get(values['id'], {}),
+    }
+
+
+def _load(variant_ids=None):
+    """Fetch snapshot rows, optionally restricted to variant_ids (two queries)."""
+    variants = ProductVariant.objects.all()
+    stock_qs = Stock.objects.all()
+    if variant_ids is not None:
+        variants = variants.filter(id__in=variant_ids)
+        stock_qs = stock_qs.filter(product_variant_id__in=variant_ids)
+
+    stocks = defaultdict(dict)
+    for s in stock_qs.values_list('product_variant_id', 'warehouse_id', 'quantity_on_hand', 'quantity_reserved'):
+        stocks[s[0]][s[1]] = s[2] - s[3]
+    return [_row(v, stocks) for v in variants.values(*VARIANT_FIELDS).iterator(chunk_size=5000)]
+
+
+class ScanSnapshot:
+    def __init__(self, version):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.by_id = {}
+        self.by_code = {}
+        self.by_code_ci = {}
+
+    def put(self, row):
+        self.drop(row['id'])
+        self.by_id[row['id']] = row
+        for code in (row['sku'], row['barcode']):
+            if code:
+                self.by_code[code] = row
+                self.by_code_ci.setdefault(code.lower(), row)
+
+    def drop(self, variant_id):
+        old = self.by_id.pop(variant_id, None)
+        if old is None:
+            return
+        for code in (old['sku'], old['barcode']):
+            if code:
+                if self.by_code.get(code) is old:
+                    del self.by_code[code]
+                if self.by_code_ci.get(code.lower()) is old:
+                    del self.by_code_ci[code.lower()]
+
+    def get(self, code):
+        return self.by_code.get(code) or self.by_code_ci.get(code.lower())
+
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def _full_build(version):
+    snapshot = ScanSnapshot(version)
+    for row in _load():
+        snapshot.put(row)
+    return snapshot
+
+
+def get_snapshot() -> ScanSnapshot:
+    global _snapshot
+    version = _current_version()
+    snapshot = _snapshot
+    max_age = getattr(settings, 'SCAN_INDEX_MAX_AGE', 300)
+    if (snapshot is not None and snapshot.version == version
+            and time.monotonic() - snapshot.built_at < max_age):
+        return snapshot
+
+    with _lock:
+        snapshot = _snapshot
+        if snapshot is None or time.monotonic() - snapshot.built_at >= max_age \
+                or not 0 <= version - snapshot.version <= MAX_REPLAY:
+            _snapshot = _full_build(version)
+            return _snapshot
+        if snapshot.version == version:
+            return snapshot
+
+        keys = [SCAN_CHANGE_KEY.format(v) for v in range(snapshot.version + 1, version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            _snapshot = _full_build(version)
+            return _snapshot
+
+        changed_ids = set()
+        for ids in changes.values():
+            changed_ids.update(ids)
+        if len(changed_ids) > MAX_REPLAY_VARIANTS:
+            _snapshot = _full_build(version)
+            return _snapshot
+        rows = _load(changed_ids)
+        for variant_id in changed_ids:
+            snapshot.drop(variant_id)
+        for row in rows:
+            snapshot.put(row)
+        snapshot.version = version
+        return snapshot
+
+
+def resolve_codes(codes, warehouse_id=None):
+    """
+    Resolve scanned SKUs/barcodes. Returns (results, missing) where results is a
+    list of {'code', 'variant'} in scan order. Codes missing from the snapshot
+    are retried against the database in a single query before being reported.
+    """
+    snapshot = get_snapshot()
+    found, unresolved = [], []
+    for code in codes:
+        row = snapshot.get(code)
+        if row is None:
+            unresolved.append(code)
+        found.append((code, row))
+
+    if unresolved:
+        ids = list(ProductVariant.objects.filter(
+            Q(sku__in=unresolved) | Q(barcode__in=unresolved)
+        ).values_list('id', flat=True))
+        if ids:
+            with _lock:
+                for row in _load(ids):
+                    snapshot.put(row)
+            found = [(code, row or snapshot.get(code)) for code, row in found]
+
+    results, missing = [], []
+    for code, row in found:
+        if row is None:
+            missing.append(code)
+            continue
+        variant = {k: v for k, v in row.items() if k != 'warehouses'}
+        if warehouse_id is not None:
+            variant['available'] = row['warehouses'].get(warehouse_id, 0)
+        else:
+            variant['warehouses'] = row['warehouses']
+        results.append({'code': code, 'variant': variant})
+    return results, missing
+
+
+def reset_snapshot():
+    global _snapshot
+    with _lock:
+        _snapshot = None
@@ -1,11 +1,16 @@
 from decimal import Decimal
 
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+from apps.ecom.models import ProductVariant
 from apps.inventory.models import (
     GoodsReceiptNote, StockAdjustment, StockTransfer, Stock, StockMovement
 )
+from apps.ecom.signals import variants_bulk_changed
+from apps.inventory.reservations import cancel_order_holds, convert_order_holds
+from apps.inventory.scan import record_variant_change, record_variant_changes
 
 
 # -------------------------------
@@ -110,3 +115,47 @@ def stock_transfer_auto_apply(sender, instance, created, **kwargs):
                     reference=f"TRF-{instance.id}"
                 )
             ])
+
+
+# -------------------------------
+# Scan snapshot: publish changed variants
+# -------------------------------
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def variant_scan_changed(sender, instance, **kwargs):
+    variant_id = instance.pk
+    transaction.on_commit(lambda: record_variant_change(variant_id))
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def stock_scan_changed(sender, instance, **kwargs):
+    variant_id = instance.product_variant_id
+    transaction.on_commit(lambda: record_variant_change(variant_id))
+
+
+@receiver(variants_bulk_changed)
+def variants_bulk_scan_changed(sender, variant_ids, **kwargs):
+    variant_ids = list(variant_ids)
+    transaction.on_commit(lambda: record_variant_changes(variant_ids))
+
+
+# -------------------------------
+# Order status: confirm / cancel stock holds
+# -------------------------------
+HOLD_CONVERTING_STATUSES = {'confirmed', 'processing', 'shipped', 'delivered'}
+
+
+@receiver(post_save, sender='order.Order')
+def order_stock_holds(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Confirmation (or skipping straight to fulfilment) turns the order's holds
+    into 'out' movements; cancellation releases or reverses them. Status
+    changes come from Order's field tracker (FieldTrackerMixin).
+    """
+    if created or (update_fields is not None and 'status' not in update_fields) or not instance.has_changed('status'):
+        return
+    if instance.status == 'cancelled':
+        cancel_order_holds(instance)
+    elif instance.status in HOLD_CONVERTING_STATUSES:
+        convert_order_holds(instance)
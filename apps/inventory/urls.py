@@ -34,6 +34,7 @@ urlpatterns = [
     # APIs for bulk import/search
     path('api/variants/', views.api_get_variants, name='api_get_variants'),
     path('api/products/search/', views.api_search_products, name='api_search_products'),
+    path('api/variants/scan/', views.api_scan_variants, name='api_scan_variants'),
     path('api/products/<int:product_id>/variants/', views.api_get_product_variants, name='api_get_product_variants'),
 
     # APIs for requisition import into PO
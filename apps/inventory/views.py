@@ -1,22 +1,25 @@
+import json
 from decimal import Decimal
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Q, Count
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
 from django.urls import reverse
-from django.views.decorators.http import require_GET, require_POST
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
 
+from apps.ecom.exports import variant_export_queryset, iter_rows, stream_ndjson
 from apps.ecom.models import Product, ProductVariant
+from apps.ecom.search_index import search_products
 from apps.inventory.forms import (
     PurchaseRequisitionForm,
     PurchaseRequisitionItemFormSet,
 )
 from apps.inventory.forms_po import PurchaseOrderForm, PurchaseOrderItemFormSet, AdditionalCostFormSet
 from apps.inventory.models import PurchaseRequisition, PurchaseOrder
+from apps.inventory.scan import resolve_codes
 from apps.inventory.requisitions import generate_pr_number, recalc_requisition_total
 from apps.inventory.pos import generate_po_number, recalc_po_totals, update_requisition_ordered
 from apps.master.models import Warehouse, Supplier, Tax
@@ -427,37 +430,45 @@ def po_pdf(request, pk: int):
 
 
 # API Endpoints for Bulk Import and Product Search
+BULK_IMPORT_VARIANT_FIELDS = [
+    ('id', 'id'),
+    ('sku', 'sku'),
+    ('variant_name', 'variant_name'),
+    ('purchase_price', 'purchase_price'),
+    ('product__name', 'product_name'),
+]
+
+
+def _bulk_import_variant(row):
+    return {
+        'id': row['id'],
+        'display_name': f"{row['product_name']} - {row['variant_name']} ({row['sku']})",
+        'sku': row['sku'],
+        'price': str(row['purchase_price']),
+        'product_name': row['product_name'],
+    }
+
+
 @staff_member_required(login_url='staff_login')
 @require_GET
 def api_get_variants(request):
     """
     Get product variants filtered by brand and/or category.
     Used for bulk import functionality.
+    Pass ?format=ndjson to stream one variant per line instead of a single JSON document.
     """
     try:
-        brand_id = request.GET.get('brand')
-        category_id = request.GET.get('category')
-
-        variants_qs = ProductVariant.objects.select_related('product', 'product__brand', 'product__category').filter(
-            is_active=True,
-            product__is_active=True
+        variants_qs = variant_export_queryset(
+            brand_id=request.GET.get('brand'),
+            category_id=request.GET.get('category'),
         )
-
-        if brand_id:
-            variants_qs = variants_qs.filter(product__brand_id=brand_id)
-
-        if category_id:
-            variants_qs = variants_qs.filter(product__category_id=category_id)
-
         # Removed hard cap to import ALL variants as requested
-        variants = [{
-            'id': v.id,
-            'display_name': f"{v.product.name} - {v.variant_name} ({v.sku})",
-            'sku': v.sku,
-            'price': str(v.purchase_price),
-            'product_name': v.product.name,
-        } for v in variants_qs]
+        rows = (_bulk_import_variant(row) for row in iter_rows(variants_qs, BULK_IMPORT_VARIANT_FIELDS))
 
+        if request.GET.get('format') == 'ndjson':
+            return StreamingHttpResponse(stream_ndjson(rows), content_type='application/x-ndjson; charset=utf-8')
+
+        variants = list(rows)
         return JsonResponse({'variants': variants, 'count': len(variants)})
     except Exception as e:
         return JsonResponse({'error': str(e), 'variants': []}, status=500)
@@ -476,33 +487,48 @@ def api_search_products(request):
         if not query or len(query) < 2:
             return JsonResponse({'products': []})
 
-        # Search in product name or variant SKU/barcode
-        products_qs = Product.objects.filter(
-            Q(is_active=True) &
-            (
-                    Q(name__icontains=query) |
-                    Q(variants__sku__icontains=query) |
-                    Q(variants__barcode__icontains=query)
-            )
-        ).select_related('brand', 'category').annotate(
-            variant_count=Count('variants', filter=Q(variants__is_active=True))
-        ).distinct()[:20]
-
-        products = []
-        for product in products_qs:
-            products.append({
-                'id': product.id,
-                'name': product.name,
-                'brand': product.brand.name if product.brand else '',
-                'category': product.category.name if product.category else '',
-                'variant_count': product.variant_count,
-            })
+        # Prefix match on name words, SKU and barcode served from the in-process index
+        products = [
+            {k: p[k] for k in ('id', 'name', 'brand', 'category', 'variant_count')}
+            for p in search_products(query, limit=20)
+        ]
 
         return JsonResponse({'products': products})
     except Exception as e:
         return JsonResponse({'error': str(e), 'products': []}, status=500)
 
 
+MAX_SCAN_CODES = 500
+
+
+@staff_member_required(login_url='staff_login')
+@require_http_methods(['GET', 'POST'])
+def api_scan_variants(request):
+    """
+    Resolve a batch of scanned SKUs/barcodes (GRN entry, counter).
+    GET ?codes=A,B,C&warehouse=1 or POST JSON {"codes": [...], "warehouse": 1}.
+    With a warehouse each variant carries its available quantity there,
+    otherwise the per-warehouse breakdown.
+    """
+    try:
+        if request.method == 'POST':
+            data = json.loads(request.body or '{}')
+            codes = data.get('codes') or []
+            warehouse = data.get('warehouse')
+        else:
+            codes = request.GET.get('codes', '').split(',')
+            warehouse = request.GET.get('warehouse')
+        codes = [str(c).strip() for c in codes if str(c).strip()]
+        if len(codes) > MAX_SCAN_CODES:
+            return JsonResponse({'error': f'At most {MAX_SCAN_CODES} codes per request.'}, status=400)
+        warehouse_id = int(warehouse) if warehouse not in (None, '') else None
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Invalid scan payload.'}, status=400)
+
+    results, missing = resolve_codes(codes, warehouse_id=warehouse_id)
+    return JsonResponse({'results': results, 'missing': missing})
+
+
 @staff_member_required(login_url='staff_login')
 @require_GET
 def api_get_product_variants(request, product_id):
@@ -0,0 +1,21 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from apps.jobs.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'queue', 'status', 'attempts', 'max_attempts', 'run_at', 'updated_at')
+    list_filter = ('status', 'queue', 'name')
+    search_fields = ('name', 'dedupe_key', 'last_error')
+    readonly_fields = ('locked_by', 'locked_at', 'last_error', 'created_at', 'updated_at')
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected failed jobs now')
+    def retry_now(self, request, queryset):
+        # dedupe_key is dropped: an equivalent job may have been queued since
+        updated = queryset.filter(status=Job.STATUS_FAILED).update(
+            status=Job.STATUS_QUEUED, run_at=timezone.now(), attempts=0, dedupe_key='', updated_at=timezone.now(),
+        )
+        self.message_user(request, f"{updated} job(s) queued.")
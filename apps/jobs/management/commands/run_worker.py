@@ -0,0 +1,62 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.jobs.queue import DEFAULT_QUEUE, requeue_stale, work
+
+
+class Command(BaseCommand):
+    help = ("Run background jobs (apps.jobs) with --concurrency worker threads. Keep it running under a "
+            "process manager; SIGINT/SIGTERM stop it after the jobs in progress.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', dest='queues', help=f'Queue to serve (repeatable, default: {DEFAULT_QUEUE})')
+        parser.add_argument('--concurrency', type=int, help='Worker threads (default: JOBS_WORKER_CONCURRENCY)')
+        parser.add_argument('--batch', type=int, default=1, help='Jobs claimed per query')
+        parser.add_argument('--poll-interval', type=float, help='Seconds to wait when no job is due (default: JOBS_POLL_INTERVAL)')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        queues = options['queues'] or [DEFAULT_QUEUE]
+        concurrency = max(options['concurrency'] or getattr(settings, 'JOBS_WORKER_CONCURRENCY', 2), 1)
+        poll_interval = options['poll_interval'] or getattr(settings, 'JOBS_POLL_INTERVAL', 1.0)
+        lock_timeout = getattr(settings, 'JOBS_LOCK_TIMEOUT', 10 * 60)
+        stop = threading.Event()
+        ran = [0] * concurrency
+
+        def shutdown(signum, frame):
+            self.stdout.write("Stopping after the jobs in progress...")
+            stop.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        def run(index):
+            try:
+                ran[index] = work(
+                    f"{socket.gethostname()}:{os.getpid()}:{index}", queues, options['batch'],
+                    poll_interval, stop, options['burst'],
+                )
+            finally:
+                connections.close_all()
+
+        self.stdout.write(f"Serving {', '.join(queues)} with {concurrency} thread(s).")
+        requeue_stale(lock_timeout)
+        threads = [threading.Thread(target=run, args=(i,), name=f"jobs-worker-{i}", daemon=True)
+                   for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        last_sweep = time.monotonic()
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1.0)
+            if time.monotonic() - last_sweep > lock_timeout / 2:
+                requeue_stale(lock_timeout)
+                last_sweep = time.monotonic()
+        self.stdout.write(self.style.SUCCESS(f"Ran {sum(ran)} job(s)."))
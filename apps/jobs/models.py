@@ -0,0 +1,48 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    A unit of background work, run by `manage.py run_worker` (apps.jobs.queue).
+    Rows are deleted once the job succeeds; failed ones stay for inspection.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    queue = models.CharField(max_length=50, default='default')
+    payload = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    dedupe_key = models.CharField(max_length=200, blank=True, default='')
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Workers' "next due job" scan and the stale-lock sweep
+            models.Index(fields=['queue', 'run_at'], name='jobs_ready_idx', condition=Q(status='queued')),
+            models.Index(fields=['locked_at'], name='jobs_running_idx', condition=Q(status='running')),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedupe_key'], name='uniq_job_queued_dedupe',
+                                    condition=Q(status='queued') & ~Q(dedupe_key='')),
+        ]
+        ordering = ('run_at',)
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
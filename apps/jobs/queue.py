@@ -0,0 +1,210 @@
+"""
+Database-backed background jobs.
+
+Work that should not sit in a request's latency path (order e-mails, invoice
+PDFs, cache warming) is stored as a Job row and run by `manage.py run_worker`:
+
+    @job(max_attempts=3)
+    def send_order_confirmation(order_id): ...
+
+    enqueue_on_commit(send_order_confirmation, order_id=order.pk)
+
+Job functions live in each app's ``jobs`` module (autodiscovered at startup)
+and take JSON-serialisable keyword arguments. ``enqueue`` inserts the row in
+the caller's transaction; ``enqueue_on_commit`` waits for the commit, so a
+rolled-back checkout queues nothing. A ``dedupe_key`` folds repeated requests
+into the job still queued under that key (e.g. one cache warm-up after a
+burst of catalog edits).
+
+Workers claim due jobs oldest first with SELECT ... FOR UPDATE SKIP LOCKED
+where the database supports it; elsewhere (SQLite) a conditional UPDATE on
+status decides which worker gets a job. A failed attempt is retried after
+JOBS_RETRY_BACKOFF x 2^(attempt - 1) seconds (capped at JOBS_MAX_BACKOFF) until
+max_attempts, then left as 'failed' with its traceback. Jobs still running
+after JOBS_LOCK_TIMEOUT belong to a dead worker and are requeued. A retry
+whose dedupe_key was queued again meanwhile is folded into that newer job. With
+JOBS_RUN_INLINE (tests, local development without a worker) jobs run
+in-process when enqueued instead.
+"""
+import logging
+import random
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.jobs.models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE = 'default'
+QUEUED, RUNNING, FAILED = Job.STATUS_QUEUED, Job.STATUS_RUNNING, Job.STATUS_FAILED
+
+REGISTRY = {}
+
+
+def job(name: str = None, queue: str = DEFAULT_QUEUE, max_attempts: int = None):
+    """Register a function as a job; its name defaults to the dotted path."""
+    def decorator(func):
+        func.job_name = name or f"{func.__module__}.{func.__name__}"
+        func.job_queue = queue
+        func.job_max_attempts = max_attempts
+        REGISTRY[func.job_name] = func
+        return func
+    return decorator
+
+
+def _resolve(func):
+    name = getattr(func, 'job_name', func)
+    if name not in REGISTRY:
+        raise LookupError(f"Unknown job {name!r}.")
+    return REGISTRY[name]
+
+
+def _run_inline(func, payload) -> None:
+    try:
+        func(**payload)
+    except Exception:
+        logger.exception("Inline job %s failed", func.job_name)
+
+
+# -------------------------------
+# Enqueueing
+# -------------------------------
+def enqueue(func, *, run_at=None, delay: float = None, dedupe_key: str = '', queue: str = None,
+            max_attempts: int = None, **payload):
+    """
+    Queue ``func(**payload)``; ``func`` is a job function or its name.
+    run_at / delay (seconds): not before then. dedupe_key: skipped while a job
+    with the same key is still queued. Returns the Job (None when run inline).
+    """
+    func = _resolve(func)
+    if getattr(settings, 'JOBS_RUN_INLINE', False):
+        _run_inline(func, payload)
+        return None
+    if delay:
+        run_at = timezone.now() + timedelta(seconds=delay)
+    new_job = Job(
+        name=func.job_name, queue=queue or func.job_queue, payload=payload, run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or func.job_max_attempts or getattr(settings, 'JOBS_MAX_ATTEMPTS', 5),
+        dedupe_key=dedupe_key,
+    )
+    if dedupe_key:
+        Job.objects.bulk_create([new_job], ignore_conflicts=True)
+    else:
+        new_job.save()
+    return new_job
+
+
+def enqueue_on_commit(func, **kwargs) -> None:
+    """``enqueue`` once the current transaction commits (immediately outside one)."""
+    func = _resolve(func)  # unknown names fail in the caller, not after the commit
+    transaction.on_commit(lambda: enqueue(func, **kwargs))
+
+
+# -------------------------------
+# Running
+# -------------------------------
+def backoff(attempt: int) -> float:
+    base = getattr(settings, 'JOBS_RETRY_BACKOFF', 10)
+    delay = min(base * 2 ** max(attempt - 1, 0), getattr(settings, 'JOBS_MAX_BACKOFF', 60 * 60))
+    return delay + random.uniform(0, delay / 10)
+
+
+def claim(worker_id: str, queues=(DEFAULT_QUEUE,), limit: int = 1) -> list:
+    """Mark up to ``limit`` due jobs as running for ``worker_id`` and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        due = Job.objects.filter(status=QUEUED, queue__in=queues, run_at__lte=now).order_by('run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        # The status condition settles races on databases without SKIP LOCKED
+        Job.objects.filter(pk__in=ids, status=QUEUED).update(
+            status=RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1, updated_at=now,
+        )
+    return list(Job.objects.filter(pk__in=ids, status=RUNNING, locked_by=worker_id, locked_at=now).order_by('run_at', 'id'))
+
+
+def _requeue(job_pk, **fields) -> bool:
+    """
+    Queue a claimed row again. If a newer job with the same dedupe_key is
+    already queued, that job does the work and this row is deleted instead.
+    """
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job_pk).update(status=QUEUED, locked_by='', locked_at=None, **fields)
+    except IntegrityError:
+        Job.objects.filter(pk=job_pk).delete()
+        return False
+    return True
+
+
+def _fail(job_row, error: str, retry: bool = True) -> None:
+    now = timezone.now()
+    if retry and job_row.attempts < job_row.max_attempts:
+        _requeue(job_row.pk, run_at=now + timedelta(seconds=backoff(job_row.attempts)), last_error=error, updated_at=now)
+    else:
+        Job.objects.filter(pk=job_row.pk).update(
+            status=FAILED, locked_by='', locked_at=None, last_error=error, updated_at=now,
+        )
+    logger.warning("Job %s #%s failed (attempt %s/%s)", job_row.name, job_row.pk, job_row.attempts, job_row.max_attempts)
+
+
+def run_job(job_row) -> bool:
+    """Run one claimed job; True if it succeeded (and was deleted)."""
+    func = REGISTRY.get(job_row.name)
+    if func is None:
+        _fail(job_row, f"Unknown job {job_row.name!r}.", retry=False)
+        return False
+    try:
+        func(**job_row.payload)
+    except Exception:
+        _fail(job_row, traceback.format_exc())
+        return False
+    Job.objects.filter(pk=job_row.pk).delete()
+    return True
+
+
+def requeue_stale(timeout: int = None) -> int:
+    """Jobs running for longer than JOBS_LOCK_TIMEOUT lost their worker: queue them again (or fail them)."""
+    timeout = getattr(settings, 'JOBS_LOCK_TIMEOUT', 10 * 60) if timeout is None else timeout
+    now = timezone.now()
+    stale = Job.objects.filter(status=RUNNING, locked_at__lt=now - timedelta(seconds=timeout))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=FAILED, locked_by='', locked_at=None, last_error='Worker lost.', updated_at=now,
+    )
+    # Row by row: a stale job may collide with a newer one queued under its dedupe_key
+    requeued = 0
+    for job_pk in list(stale.values_list('pk', flat=True)):
+        _requeue(job_pk, run_at=now, updated_at=now)
+        requeued += 1
+    return failed + requeued
+
+
+def work(worker_id: str, queues=(DEFAULT_QUEUE,), batch: int = 1, poll_interval: float = 1.0,
+         stop: threading.Event = None, burst: bool = False) -> int:
+    """
+    Claim and run jobs until ``stop`` is set, or with ``burst`` until none is
+    due. Returns how many jobs were run.
+    """
+    stop = stop or threading.Event()
+    ran = 0
+    while not stop.is_set():
+        close_old_connections()
+        jobs = claim(worker_id, queues, batch)
+        if not jobs:
+            if burst:
+                break
+            stop.wait(poll_interval)
+            continue
+        for job_row in jobs:
+            run_job(job_row)
+            ran += 1
+    return ran
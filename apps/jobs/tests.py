@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.jobs import queue
+from apps.jobs.models import Job
+
+calls = []
+
+
+@queue.job(max_attempts=3)
+def record_call(value):
+    calls.append(value)
+    if value == 'fail':
+        raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_successful_job_is_deleted(self):
+        queue.enqueue(record_call, value='ok')
+        self.assertEqual(queue.work('test', burst=True), 1)
+        self.assertEqual(calls, ['ok'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_job_is_retried_with_backoff(self):
+        queue.enqueue(record_call, value='fail')
+        queue.work('test', burst=True)
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('RuntimeError', job.last_error)
+
+    def test_job_fails_after_max_attempts(self):
+        queue.enqueue(record_call, value='fail', max_attempts=1)
+        queue.work('test', burst=True)
+        self.assertEqual(Job.objects.get().status, Job.STATUS_FAILED)
+
+    def test_dedupe_key_keeps_one_queued_job(self):
+        queue.enqueue(record_call, value='a', dedupe_key='k')
+        queue.enqueue(record_call, value='a', dedupe_key='k')
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_retry_folds_into_newer_job_with_same_dedupe_key(self):
+        queue.enqueue(record_call, value='fail', dedupe_key='k')
+        [claimed] = queue.claim('test')
+        queue.enqueue(record_call, value='fail', dedupe_key='k')
+        self.assertFalse(queue.run_job(claimed))
+        job = Job.objects.get()
+        self.assertNotEqual(job.pk, claimed.pk)
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+        self.assertEqual(job.attempts, 0)
+
+    def test_stale_job_with_requeued_dedupe_key_is_folded(self):
+        queue.enqueue(record_call, value='a', dedupe_key='k')
+        [claimed] = queue.claim('test')
+        queue.enqueue(record_call, value='a', dedupe_key='k')
+        Job.objects.filter(pk=claimed.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        queue.requeue_stale(timeout=60)
+        self.assertEqual(list(Job.objects.values_list('status', flat=True)), [Job.STATUS_QUEUED])
+        self.assertFalse(Job.objects.filter(pk=claimed.pk).exists())
+
+    def test_stale_job_is_requeued(self):
+        queue.enqueue(record_call, value='a')
+        [claimed] = queue.claim('test')
+        Job.objects.filter(pk=claimed.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(queue.requeue_stale(timeout=60), 1)
+        self.assertEqual(Job.objects.get().status, Job.STATUS_QUEUED)
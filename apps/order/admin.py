@@ -1,9 +1,28 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-from apps.order.models import Order
+from apps.order.models import Order, OrderStatus
+
+
+def _status_action(status, label):
+    def action(modeladmin, request, queryset):
+        changed, skipped = Order.bulk_set_status(queryset, status, changed_by=request.user)
+        modeladmin.message_user(request, f"{changed} order(s) marked {label.lower()}.")
+        if skipped:
+            modeladmin.message_user(
+                request, f"{skipped} order(s) skipped: they cannot move to {label.lower()} from their current status.",
+                messages.WARNING,
+            )
+
+    action.__name__ = f"mark_{status}"
+    action.short_description = f"Mark selected orders as {label.lower()}"
+    return action
 
 
 # Register your models here.
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['order_number', 'user', 'guest_email', 'status', 'payment_status', 'subtotal_amount', 'discount_amount', 'shipping_amount', 'total_amount']
+    actions = [
+        _status_action(status, label) for status, label in OrderStatus.choices
+        if status not in (OrderStatus.PENDING, OrderStatus.REFUNDED)
+    ]
@@ -0,0 +1,75 @@
+"""
+Versioned cart summary cache.
+
+Each cart owner has a version counter in the shared cache, bumped by every
+cart store mutation and by CartItem/CartCoupon model signals (admin edits,
+checkout clearing, merges). Summaries are cached under the owner, the cart
+version and the catalog generation (bumped on variant price changes), so a
+stale summary is never read back and nothing has to be deleted. The header
+badge count only depends on the cart version.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.ecom.cache import CATALOG_GENERATION_KEY, get_catalog_generation
+
+CART_VERSION_KEY = 'cart:version:{owner}'
+CART_SUMMARY_KEY = 'cart:summary:{owner}:{version}:{generation}:{suffix}'
+CART_COUNT_KEY = 'cart:count:{owner}:{version}'
+
+
+def _seed() -> int:
+    # Seed from the clock so a counter lost to eviction never goes backwards
+    return int(time.time() * 1000)
+
+
+def _ttl() -> int:
+    return getattr(settings, 'CART_STORE_TTL', 60 * 60 * 24 * 14)
+
+
+def get_cart_version(owner) -> int:
+    key = CART_VERSION_KEY.format(owner=owner.key)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _seed(), timeout=_ttl())
+        version = cache.get(key) or _seed()
+    return version
+
+
+def bump_cart_version(owner) -> None:
+    """Move the owner's cart version once the current transaction commits."""
+    key = CART_VERSION_KEY.format(owner=owner.key)
+
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _seed(), timeout=_ttl())
+
+    # After commit: a reader racing the write must not cache old rows under the new version
+    transaction.on_commit(bump)
+
+
+def summary_key(owner, suffix='') -> str:
+    """
+    Cache key for the owner's current summary (one get_many for both counters).
+    suffix separates variants of the same cart, e.g. the quoted shipping method.
+    """
+    version_key = CART_VERSION_KEY.format(owner=owner.key)
+    found = cache.get_many([version_key, CATALOG_GENERATION_KEY])
+    version = found.get(version_key) or get_cart_version(owner)
+    generation = found.get(CATALOG_GENERATION_KEY) or get_catalog_generation()
+    return CART_SUMMARY_KEY.format(owner=owner.key, version=version, generation=generation, suffix=suffix)
+
+
+def count_key(owner) -> str:
+    return CART_COUNT_KEY.format(owner=owner.key, version=get_cart_version(owner))
+
+
+def summary_timeout() -> int:
+    # Bounded: coupon validity windows can lapse and shipping/tax settings can be
+    # edited without any cart change
+    return getattr(settings, 'CART_SUMMARY_CACHE_TIMEOUT', 300)
@@ -0,0 +1,101 @@
+"""
+Guest cart garbage collection.
+
+Guest carts idle for longer than GUEST_CART_TTL_DAYS are deleted in bounded
+chunks, oldest first (order_cart_guest_idle_idx). A cart counts as idle when
+neither the cart row nor any of its lines was touched since the cutoff; line
+writes do not update Cart.updated_at, so the lines are checked too.
+
+Each chunk is its own short transaction: candidate carts are locked with
+SKIP LOCKED where supported, then lines, coupons and carts are removed with
+plain DELETE ... WHERE id IN (...) statements (no per-row signals; the carts
+are long gone from every cache). An optional JSON-lines snapshot of every
+purged cart is written first for abandoned-cart analytics.
+"""
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from apps.order.models import Cart, CartCoupon, CartItem
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def stale_guest_carts(cutoff):
+    recent_lines = CartItem.objects.filter(cart=OuterRef('pk'), updated_at__gte=cutoff)
+    return (
+        Cart.objects
+        .filter(user__isnull=True, updated_at__lt=cutoff)
+        .exclude(Exists(recent_lines))
+        .order_by('updated_at')
+    )
+
+
+def _snapshot_rows(cart_ids):
+    carts = {
+        row['id']: {**row, 'lines': []}
+        for row in Cart.objects.filter(id__in=cart_ids).values('id', 'guest_token', 'created_at', 'updated_at')
+    }
+    for line in CartItem.objects.filter(cart_id__in=cart_ids).values(
+            'cart_id', 'variant_id', 'variant__sku', 'quantity', 'variant__price', 'added_at'):
+        carts[line.pop('cart_id')]['lines'].append(line)
+    coupons = dict(CartCoupon.objects.filter(cart_id__in=cart_ids).values_list('cart_id', 'coupon__code'))
+    for cart_id, cart in carts.items():
+        cart['coupon'] = coupons.get(cart_id)
+    return carts.values()
+
+
+def purge_stale_guest_carts(days=None, chunk_size=DEFAULT_CHUNK_SIZE, snapshot=None, max_chunks=None,
+                            pause=0.0, dry_run=False, progress=None):
+    """
+    Delete idle guest carts chunk by chunk.
+
+    snapshot: writable text file; one JSON object per purged cart is written before deletion.
+    pause: seconds to sleep between chunks, to leave room for foreground traffic.
+    progress: optional callable(stats) invoked after every chunk.
+    Returns {'carts', 'items', 'coupons', 'chunks', 'seconds', 'rows_per_second'}.
+    """
+    days = settings.GUEST_CART_TTL_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    stats = {'carts': 0, 'items': 0, 'coupons': 0, 'chunks': 0}
+    started = time.monotonic()
+
+    if dry_run:
+        stats['carts'] = stale_guest_carts(cutoff).count()
+        stats['items'] = CartItem.objects.filter(cart__in=stale_guest_carts(cutoff).values('pk')).count()
+    else:
+        while max_chunks is None or stats['chunks'] < max_chunks:
+            with transaction.atomic():
+                candidates = stale_guest_carts(cutoff)
+                if connection.features.has_select_for_update_skip_locked:
+                    # Carts a request is using right now are simply left for the next run
+                    candidates = candidates.select_for_update(skip_locked=True, of=('self',))
+                cart_ids = list(candidates.values_list('id', flat=True)[:chunk_size])
+                if not cart_ids:
+                    break
+                if snapshot is not None:
+                    for row in _snapshot_rows(cart_ids):
+                        snapshot.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+                stats['items'] += CartItem.objects.filter(cart_id__in=cart_ids).delete()[0]
+                stats['coupons'] += CartCoupon.objects.filter(cart_id__in=cart_ids).delete()[0]
+                stats['carts'] += Cart.objects.filter(id__in=cart_ids).delete()[0]
+            stats['chunks'] += 1
+            if progress is not None:
+                progress(_with_rate(stats, started))
+            if len(cart_ids) < chunk_size:
+                break
+            if pause:
+                time.sleep(pause)
+    return _with_rate(stats, started)
+
+
+def _with_rate(stats, started):
+    seconds = time.monotonic() - started
+    rows = stats['carts'] + stats['items'] + stats['coupons']
+    return {**stats, 'seconds': round(seconds, 3), 'rows_per_second': round(rows / seconds, 1) if seconds else 0.0}
@@ -0,0 +1,475 @@
+"""
+Pluggable cart storage.
+
+- DatabaseCartStore: every operation reads/writes Cart/CartItem/CartCoupon
+  (the original behaviour, and the default).
+- RedisCartStore: "hot" carts (guests, and signed-in users with
+  CART_STORE_USERS) live in one Redis hash per owner with a sliding TTL:
+
+      <prefix>:cart:g:<guest_token>  ->  {"v:<variant_id>": qty, "coupon": code, "_ts": epoch}
+      <prefix>:cart:dirty            ->  set of owner keys with unsaved changes
+
+  Writes are deferred: the hash is written back to Cart/CartItem on checkout
+  (Order.create_from_cart only ever reads the DB), on login merge and by the
+  ``flush_carts`` management command, which should run more often than
+  CART_STORE_TTL. A hash that is missing is loaded once from the DB cart.
+
+Lines of hot carts are unsaved CartItem instances whose ``id`` is the variant
+id, so item endpoints keep working with the ids they were given.
+"""
+import logging
+import time
+from decimal import Decimal
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from apps.ecom.models import ProductVariant
+from apps.inventory.reservations import cart_hold_ttl, hold, is_scarce, release
+from apps.order.cart_cache import bump_cart_version
+from apps.order.coupons import get_coupon
+from apps.order.models import Cart, CartCoupon, CartItem
+
+logger = logging.getLogger(__name__)
+
+VARIANT_FIELD_PREFIX = 'v:'
+
+
+class CartOwner:
+    """Either a user (by id) or a guest token."""
+
+    def __init__(self, user=None, guest_token: Optional[str] = None, user_id: Optional[int] = None):
+        self.user = user
+        self.user_id = user.pk if user is not None else user_id
+        self.guest_token = None if self.user_id else guest_token
+        if not self.user_id and not self.guest_token:
+            raise ValueError("Either user or guest_token must be provided.")
+
+    @property
+    def is_guest(self) -> bool:
+        return not self.user_id
+
+    @property
+    def key(self) -> str:
+        return f"g:{self.guest_token}" if self.is_guest else f"u:{self.user_id}"
+
+    @classmethod
+    def from_key(cls, key: str):
+        kind, _, ident = key.partition(':')
+        return cls(user_id=int(ident)) if kind == 'u' else cls(guest_token=ident)
+
+    def lookup(self) -> dict:
+        return {'guest_token': self.guest_token, 'user': None} if self.is_guest else \
+            {'user_id': self.user_id, 'guest_token': None}
+
+
+class DatabaseCartStore:
+    """Cart/CartItem rows are the cart."""
+
+    def get_cart(self, owner: CartOwner, create=True) -> Optional[Cart]:
+        """Owner's cart with its applied coupon joined in; remembered on ``owner`` for the request."""
+        cart = getattr(owner, '_cart', None)
+        if cart is None:
+            qs = Cart.objects.select_related('applied_coupon__coupon')
+            cart = qs.get_or_create(**owner.lookup())[0] if create else qs.filter(**owner.lookup()).first()
+            owner._cart = cart
+        return cart
+
+    def lines(self, owner: CartOwner):
+        """(items with variant/product loaded, Coupon or None)."""
+        cart = self.get_cart(owner)
+        # Everything apps.order.pricing reads is joined in
+        items = list(cart.items.select_related("variant", "variant__product", "variant__product__selling_tax"))
+        applied = CartCoupon.get_applied(cart)
+        return items, applied.coupon if applied else None
+
+    def count(self, owner: CartOwner) -> dict:
+        """{"lines", "quantity"} without loading variants (header badge)."""
+        totals = CartItem.objects.filter(**{f"cart__{k}": v for k, v in owner.lookup().items()}).aggregate(
+            lines=Count("id"), quantity=Sum("quantity"),
+        )
+        return {"lines": totals["lines"], "quantity": totals["quantity"] or 0}
+
+    @staticmethod
+    def _hold_scarce(owner: CartOwner, variant: ProductVariant, quantity: int):
+        """Scarce variants are held for the cart from add-to-cart on (apps.inventory.reservations)."""
+        if is_scarce(variant):
+            hold({variant.pk: quantity}, holder=owner.key, ttl=cart_hold_ttl())
+
+    def add(self, owner: CartOwner, variant: ProductVariant, quantity: int):
+        """``variant`` should come with its product loaded (no lazy loads during validation)."""
+        with transaction.atomic():
+            item = CartItem.add_quantity(self.get_cart(owner), variant, quantity)
+            self._hold_scarce(owner, variant, item.quantity)
+        bump_cart_version(owner)
+
+    def set_quantity(self, owner: CartOwner, line_id, quantity: int) -> bool:
+        item = CartItem.objects.filter(pk=line_id, cart=self.get_cart(owner)).first()
+        if item is None:
+            return False
+        item.quantity = quantity
+        with transaction.atomic():
+            item.save()
+            self._hold_scarce(owner, item.variant, quantity)
+        bump_cart_version(owner)
+        return True
+
+    def remove(self, owner: CartOwner, line_id) -> bool:
+        cart = self.get_cart(owner, create=False)
+        if not cart:
+            return False
+        removed = CartItem.objects.filter(pk=line_id, cart=cart).delete()[0] > 0
+        if removed:
+            bump_cart_version(owner)
+        return removed
+
+    def clear(self, owner: CartOwner):
+        cart = self.get_cart(owner, create=False)
+        if cart:
+            cart.items.all().delete()
+            CartCoupon.remove(cart)
+            release(holder=owner.key)
+            owner._cart = None  # coupon relation cached on it is stale
+            bump_cart_version(owner)
+
+    def apply_coupon(self, owner: CartOwner, code: str) -> bool:
+        applied = CartCoupon.apply(code, cart=self.get_cart(owner))
+        owner._cart = None
+        if applied:
+            bump_cart_version(owner)
+        return applied
+
+    def remove_coupon(self, owner: CartOwner):
+        cart = self.get_cart(owner, create=False)
+        if cart:
+            CartCoupon.remove(cart)
+            owner._cart = None
+            bump_cart_version(owner)
+
+    # -- batch -------------------------------------------------------------
+    def apply_batch(self, owner: CartOwner, operations):
+        """
+        Apply [{"op": "add"|"set"|"remove", "variant_id", "quantity"}, ...] in order.
+
+        Operations are folded in memory against one read of the cart and the
+        net change is written with bulk statements in one transaction. An
+        operation that fails validation is skipped; returns one
+        ``None`` (applied) or error message per operation.
+        """
+        variant_ids = {op["variant_id"] for op in operations}
+        variants = ProductVariant.objects.select_related("product").in_bulk(variant_ids)
+        with transaction.atomic():
+            before = self._batch_state(owner)
+            after = dict(before)
+            errors = []
+            for op in operations:
+                errors.append(self._fold(after, op, variants.get(op["variant_id"])))
+            errors = self._hold_batch(owner, operations, variants, before, after, errors)
+            if after != before:
+                self._batch_write(owner, before, after)
+        return errors
+
+    def _hold_batch(self, owner: CartOwner, operations, variants, before: dict, after: dict, errors):
+        """Hold changed scarce lines; a line that cannot be held keeps its previous quantity."""
+        for variant_id, quantity in list(after.items()):
+            if before.get(variant_id) == quantity:
+                continue
+            try:
+                self._hold_scarce(owner, variants[variant_id], quantity)
+            except ValidationError as e:
+                if variant_id in before:
+                    after[variant_id] = before[variant_id]
+                else:
+                    del after[variant_id]
+                errors = [
+                    " ".join(e.messages) if error is None and op["op"] != "remove" and op["variant_id"] == variant_id
+                    else error
+                    for op, error in zip(operations, errors)
+                ]
+        return errors
+
+    @staticmethod
+    def _fold(state, op, variant) -> Optional[str]:
+        variant_id, current = op["variant_id"], state.get(op["variant_id"])
+        if op["op"] == "remove":
+            state.pop(variant_id, None)
+            return None
+        if op["op"] == "add":
+            if variant is None or not variant.is_active or not variant.product.is_active:
+                return "Variant not available."
+            quantity = (current or 0) + op["quantity"]
+        else:
+            if current is None or variant is None:
+                return "Item not in cart."
+            quantity = op["quantity"]
+        try:
+            CartItem(variant=variant, quantity=quantity).clean()
+        except ValidationError as e:
+            return " ".join(e.messages)
+        state[variant_id] = quantity
+        return None
+
+    def _batch_state(self, owner: CartOwner) -> dict:
+        """{variant_id: quantity}; DB lines are locked until the batch commits."""
+        cart = self.get_cart(owner)
+        return dict(CartItem.objects.select_for_update().filter(cart=cart).values_list("variant_id", "quantity"))
+
+    def _batch_write(self, owner: CartOwner, before: dict, after: dict):
+        cart = self.get_cart(owner)
+        removed = before.keys() - after.keys()
+        if removed:
+            CartItem.objects.filter(cart=cart, variant_id__in=removed).delete()
+        upserts = [
+            CartItem(cart=cart, variant_id=variant_id, quantity=quantity)
+            for variant_id, quantity in after.items() if before.get(variant_id) != quantity
+        ]
+        if upserts:
+            # New and changed lines in one INSERT ... ON CONFLICT DO UPDATE
+            CartItem.objects.bulk_create(
+                upserts, update_conflicts=True, unique_fields=["cart", "variant"],
+                update_fields=["quantity", "updated_at"],
+            )
+        bump_cart_version(owner)
+
+    def persist(self, owner: CartOwner) -> Optional[Cart]:
+        """Make sure the DB cart is current; returns it (None if the owner has none)."""
+        return self.get_cart(owner, create=False)
+
+    def evict(self, owner: CartOwner):
+        """Drop any cached state after the DB cart changed underneath the store."""
+        bump_cart_version(owner)
+
+
+class RedisCartStore(DatabaseCartStore):
+    """Hot carts in Redis hashes; DB writes deferred to persist()/flush()."""
+
+    def __init__(self, connection=None, ttl=None):
+        if connection is None:
+            from django_redis import get_redis_connection
+            connection = get_redis_connection('default')
+        self.redis = connection
+        self.ttl = ttl or getattr(settings, 'CART_STORE_TTL', 60 * 60 * 24 * 14)
+        self.dirty_key = cache.make_key('cart:dirty')
+
+    def _key(self, owner: CartOwner) -> str:
+        return cache.make_key(f'cart:{owner.key}')
+
+    def _load(self, owner: CartOwner) -> dict:
+        """Decoded hash, loading it from the DB cart the first time."""
+        key = self._key(owner)
+        pipe = self.redis.pipeline()
+        pipe.hgetall(key)
+        pipe.expire(key, self.ttl)
+        raw = pipe.execute()[0]
+        if raw:
+            return {k.decode(): v.decode() for k, v in raw.items()}
+
+        data = {'_ts': str(int(time.time()))}
+        cart = self.get_cart(owner, create=False)
+        if cart:
+            for variant_id, quantity in cart.items.values_list('variant_id', 'quantity'):
+                data[f'{VARIANT_FIELD_PREFIX}{variant_id}'] = str(quantity)
+            applied = CartCoupon.get_applied(cart)
+            if applied:
+                data['coupon'] = applied.coupon.code
+        pipe = self.redis.pipeline()
+        # HSETNX: never clobber fields a concurrent request wrote meanwhile
+        for field, value in data.items():
+            pipe.hsetnx(key, field, value)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+        return data
+
+    def _commit(self, pipe, owner: CartOwner) -> list:
+        """Stamp, extend and mark the cart dirty, then run ``pipe``; the version moves once the write is in."""
+        key = self._key(owner)
+        pipe.hset(key, '_ts', int(time.time()))
+        pipe.expire(key, self.ttl)
+        pipe.sadd(self.dirty_key, owner.key)
+        results = pipe.execute()
+        bump_cart_version(owner)
+        return results
+
+    @staticmethod
+    def _quantities(data: dict) -> dict:
+        return {
+            int(field[len(VARIANT_FIELD_PREFIX):]): int(value)
+            for field, value in data.items() if field.startswith(VARIANT_FIELD_PREFIX)
+        }
+
+    def lines(self, owner: CartOwner):
+        data = self._load(owner)
+        quantities = self._quantities(data)
+        variants = ProductVariant.objects.select_related('product', 'product__selling_tax').in_bulk(list(quantities))
+        # Newest first, like CartItem.Meta.ordering
+        items = [
+            CartItem(id=vid, variant=variants[vid], quantity=qty)
+            for vid, qty in reversed(list(quantities.items())) if vid in variants
+        ]
+        return items, get_coupon(data['coupon']) if data.get('coupon') else None
+
+    def count(self, owner: CartOwner) -> dict:
+        quantities = self._quantities(self._load(owner))
+        return {"lines": len(quantities), "quantity": sum(quantities.values())}
+
+    def add(self, owner: CartOwner, variant: ProductVariant, quantity: int):
+        self._load(owner)
+        key, field = self._key(owner), f'{VARIANT_FIELD_PREFIX}{variant.pk}'
+        new_quantity = self.redis.hincrby(key, field, quantity)
+        try:
+            # Same min/max/stock rules as CartItem.save()
+            CartItem(variant=variant, quantity=new_quantity).clean()
+            self._hold_scarce(owner, variant, new_quantity)
+        except ValidationError:
+            # Undo; drop the field again if the line did not exist before
+            if self.redis.hincrby(key, field, -quantity) <= 0:
+                self.redis.hdel(key, field)
+            raise
+        pipe = self.redis.pipeline()
+        self._commit(pipe, owner)
+
+    def set_quantity(self, owner: CartOwner, line_id, quantity: int) -> bool:
+        data = self._load(owner)
+        field = f'{VARIANT_FIELD_PREFIX}{line_id}'
+        if field not in data:
+            return False
+        variant = ProductVariant.objects.select_related('product').get(pk=line_id)
+        CartItem(variant=variant, quantity=quantity).clean()
+        self._hold_scarce(owner, variant, quantity)
+        pipe = self.redis.pipeline()
+        pipe.hset(self._key(owner), field, quantity)
+        self._commit(pipe, owner)
+        return True
+
+    def remove(self, owner: CartOwner, line_id) -> bool:
+        self._load(owner)
+        pipe = self.redis.pipeline()
+        pipe.hdel(self._key(owner), f'{VARIANT_FIELD_PREFIX}{line_id}')
+        return bool(self._commit(pipe, owner)[0])
+
+    def clear(self, owner: CartOwner):
+        key = self._key(owner)
+        pipe = self.redis.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, '_ts', int(time.time()))
+        pipe.expire(key, self.ttl)
+        pipe.sadd(self.dirty_key, owner.key)
+        pipe.execute()
+        release(holder=owner.key)
+        bump_cart_version(owner)
+
+    def apply_coupon(self, owner: CartOwner, code: str) -> bool:
+        coupon = get_coupon(code)
+        if coupon is None:
+            return False
+        items, _ = self.lines(owner)
+        if not coupon.is_valid(sum((i.line_total for i in items), Decimal("0.00"))):
+            return False
+        pipe = self.redis.pipeline()
+        pipe.hset(self._key(owner), 'coupon', coupon.code)
+        self._commit(pipe, owner)
+        return True
+
+    def remove_coupon(self, owner: CartOwner):
+        self._load(owner)
+        pipe = self.redis.pipeline()
+        pipe.hdel(self._key(owner), 'coupon')
+        self._commit(pipe, owner)
+
+    def _batch_state(self, owner: CartOwner) -> dict:
+        return self._quantities(self._load(owner))
+
+    def _batch_write(self, owner: CartOwner, before: dict, after: dict):
+        key = self._key(owner)
+        pipe = self.redis.pipeline()
+        removed = before.keys() - after.keys()
+        if removed:
+            pipe.hdel(key, *[f'{VARIANT_FIELD_PREFIX}{vid}' for vid in removed])
+        changed = {f'{VARIANT_FIELD_PREFIX}{vid}': qty for vid, qty in after.items() if before.get(vid) != qty}
+        if changed:
+            pipe.hset(key, mapping=changed)
+        self._commit(pipe, owner)
+
+    # -- write-behind ------------------------------------------------------
+    def persist(self, owner: CartOwner) -> Optional[Cart]:
+        # Clear the dirty flag first: a write racing with us sets it again
+        self.redis.srem(self.dirty_key, owner.key)
+        raw = self.redis.hgetall(self._key(owner))
+        if not raw:
+            return super().persist(owner)
+        try:
+            return self._write_back(owner, raw)
+        except Exception:
+            self.redis.sadd(self.dirty_key, owner.key)
+            raise
+
+    def _write_back(self, owner: CartOwner, raw) -> Cart:
+        data = {k.decode(): v.decode() for k, v in raw.items()}
+        quantities = self._quantities(data)
+        with transaction.atomic():
+            cart = self.get_cart(owner)
+            # Variants deleted since they were added are dropped, as the DB cascade would
+            live = set(ProductVariant.objects.filter(pk__in=quantities).values_list('pk', flat=True))
+            existing = {item.variant_id: item for item in cart.items.all()}
+            cart.items.exclude(variant_id__in=live & quantities.keys()).delete()
+            changed, created = [], []
+            for variant_id, quantity in quantities.items():
+                if variant_id not in live:
+                    continue
+                item = existing.get(variant_id)
+                if item is None:
+                    created.append(CartItem(cart=cart, variant_id=variant_id, quantity=quantity))
+                elif item.quantity != quantity:
+                    item.quantity = quantity
+                    changed.append(item)
+            # Quantities were validated when they were written to the hash
+            if changed:
+                CartItem.objects.bulk_update(changed, ['quantity'], batch_size=500)
+            if created:
+                CartItem.objects.bulk_create(created, batch_size=500)
+
+            coupon = get_coupon(data['coupon']) if data.get('coupon') else None
+            applied = CartCoupon.get_applied(cart)
+            if coupon is None and applied:
+                applied.delete()
+            elif coupon is not None and (applied is None or applied.coupon_id != coupon.pk):
+                CartCoupon.objects.update_or_create(cart=cart, defaults={'coupon': coupon})
+            Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+        return cart
+
+    def evict(self, owner: CartOwner):
+        pipe = self.redis.pipeline()
+        pipe.delete(self._key(owner))
+        pipe.srem(self.dirty_key, owner.key)
+        pipe.execute()
+        bump_cart_version(owner)
+
+    def flush(self) -> int:
+        """Persist every dirty cart; returns how many were written."""
+        written = 0
+        for key in list(self.redis.sscan_iter(self.dirty_key)):
+            try:
+                self.persist(CartOwner.from_key(key.decode()))
+                written += 1
+            except Exception:
+                logger.exception("Failed to persist cart %s", key)
+        return written
+
+
+_redis_store = None
+
+
+def get_cart_store(owner: CartOwner):
+    """Store responsible for this owner's cart (see CART_STORE / CART_STORE_USERS)."""
+    global _redis_store
+    if getattr(settings, 'CART_STORE', 'db') == 'redis' and (
+            owner.is_guest or getattr(settings, 'CART_STORE_USERS', False)):
+        if _redis_store is None:
+            _redis_store = RedisCartStore()
+        return _redis_store
+    return DatabaseCartStore()
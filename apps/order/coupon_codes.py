@@ -0,0 +1,81 @@
+"""
+Bulk coupon code generation for single-use code campaigns.
+
+Codes are ``<PREFIX><random>`` from an alphabet without look-alike characters
+(0/O, 1/I). Each chunk of candidates is checked against existing codes with
+one query and inserted with one bulk_create; a chunk that collides with a
+concurrent insert is rolled back whole and redrawn, so ``created`` only ever
+holds codes that were written, and chunks are topped up until ``count``
+codes exist.
+bulk_create sends no post_save, so the code filter generation is bumped once
+at the end and the filter is rebuilt right away (usage shards are created
+lazily on first checkout).
+"""
+import secrets
+
+from django.db import IntegrityError, transaction
+
+from apps.helpers.utils import cache_is_shared
+from apps.order.coupons import build_code_filter, bump_coupon_codes_generation
+from apps.order.models import Coupon
+
+ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+# 32 symbols: every random byte maps to one without bias
+_BYTE_TO_SYMBOL = bytes(ord(ALPHABET[b % len(ALPHABET)]) for b in range(256))
+DEFAULT_CHUNK_SIZE = 5000
+MAX_EMPTY_CHUNKS = 5
+
+
+class CouponCodeError(ValueError):
+    pass
+
+
+def random_code(prefix: str, length: int) -> str:
+    return prefix + secrets.token_bytes(length).translate(_BYTE_TO_SYMBOL).decode()
+
+
+def generate_coupon_codes(count: int, prefix: str = "", length: int = 10, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                          progress=None, **fields) -> list:
+    """
+    Create ``count`` coupons with unique random codes sharing ``fields``
+    (discount_type, value, usage_limit - 1 unless given -, ends_at, ...).
+    progress: optional callable(created_so_far) invoked after every chunk.
+    Returns the created codes.
+    """
+    prefix = prefix.strip().upper()
+    code_field = Coupon._meta.get_field("code")
+    if count < 1:
+        raise CouponCodeError("count must be at least 1.")
+    if len(prefix) + length > code_field.max_length:
+        raise CouponCodeError(f"prefix + length must fit in {code_field.max_length} characters.")
+    if len(ALPHABET) ** length < count * 100:
+        raise CouponCodeError("length is too short for this many unique codes.")
+    fields.setdefault("usage_limit", 1)
+    # Surface field errors before the first chunk is written
+    Coupon(code=prefix or "X", **fields).full_clean(exclude=["code"], validate_unique=False)
+
+    created = []
+    empty_chunks = 0
+    while len(created) < count:
+        batch = {random_code(prefix, length) for _ in range(min(chunk_size, count - len(created)))}
+        batch -= set(Coupon.objects.filter(code__in=batch).values_list("code", flat=True))
+        if batch:
+            try:
+                with transaction.atomic():
+                    Coupon.objects.bulk_create([Coupon(code=code, **fields) for code in batch])
+            except IntegrityError:
+                # A code was taken since the check: nothing of this chunk was written
+                batch = None
+        if not batch:
+            empty_chunks += 1
+            if empty_chunks >= MAX_EMPTY_CHUNKS:
+                raise CouponCodeError(f"Could not find free codes after {len(created)} were created; use a longer code.")
+            continue
+        created.extend(batch)
+        if progress is not None:
+            progress(len(created))
+
+    bump_coupon_codes_generation()
+    if cache_is_shared():
+        build_code_filter()
+    return created
@@ -0,0 +1,264 @@
+"""
+Coupon lookups and usage counting for the cart/checkout hot path.
+
+Definitions are read through the shared cache by code, under a coupon
+generation bumped whenever a Coupon is saved or deleted; unknown codes are
+cached too, so guessing codes does not reach the database. Applying a coupon
+to a cart therefore never queries Coupon while the cache is warm.
+
+Usage is counted on COUPON_USAGE_SHARDS CouponUsageShard rows per coupon
+instead of the Coupon row. A checkout reserves one use with a conditional
+UPDATE on a random shard (``used < allowance``), inside its own transaction,
+so the reservation rolls back with a failed order and concurrent checkouts
+of the same code mostly lock different rows. Each shard holds a slice of
+the remaining usage_limit; a full shard makes the reservation move on to the
+next one, and only when every shard is full is the coupon exhausted.
+
+A Bloom filter of every code (shared through the cache, memoized per
+process) answers "does this code exist at all?" before any of that:
+mistyped or guessed codes are rejected without a cache entry or a query.
+It is versioned separately (bumped when codes are added, edited or
+deleted, not when usage moves) and rebuilt lazily by one process at a time.
+With a per-process cache (LocMem, no REDIS_URL) another process's bump is
+never seen, so the filter and negative caching are skipped and lookups go
+to the database.
+
+Coupon.used_count is the reconciled total. ``reconcile_coupon_usage``
+(scheduled) folds shard counts into it and re-splits the remaining
+allowance, which also happens on every Coupon save.
+"""
+import hashlib
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+
+from apps.helpers.utils import cache_is_shared
+from apps.order.models import Coupon, CouponUsageShard
+
+COUPON_GENERATION_KEY = 'coupon:generation'
+COUPON_KEY = 'coupon:def:{generation}:{code}'
+COUPON_CODES_GENERATION_KEY = 'coupon:codes:generation'
+COUPON_FILTER_KEY = 'coupon:filter:{generation}'
+COUPON_FILTER_LOCK_KEY = 'coupon:filter:lock'
+UNKNOWN = 'unknown'
+FILTER_TIMEOUT = 60 * 60 * 24
+
+
+def _seed() -> int:
+    return int(time.time() * 1000)
+
+
+def shard_count() -> int:
+    return max(getattr(settings, 'COUPON_USAGE_SHARDS', 8), 1)
+
+
+# -------------------------------
+# Definitions
+# -------------------------------
+def _generation(key: str) -> int:
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _seed(), timeout=None)
+        generation = cache.get(key) or _seed()
+    return generation
+
+
+def _bump(key: str) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _seed(), timeout=None)
+
+
+def get_coupon_generation() -> int:
+    return _generation(COUPON_GENERATION_KEY)
+
+
+def bump_coupon_generation() -> None:
+    _bump(COUPON_GENERATION_KEY)
+
+
+def bump_coupon_codes_generation() -> None:
+    """Codes were added, changed or removed: the membership filter is rebuilt on next use."""
+    _bump(COUPON_CODES_GENERATION_KEY)
+    _bump(COUPON_GENERATION_KEY)
+
+
+def get_coupon(code: str):
+    """Coupon for ``code`` (case-insensitive) or None, read through the cache."""
+    code = (code or '').strip().lower()
+    if not code:
+        return None
+    if not cache_is_shared():
+        # A code created in another process would stay "unknown" here
+        return Coupon.objects.filter(code__iexact=code).first()
+    found = cache.get_many([COUPON_GENERATION_KEY, COUPON_CODES_GENERATION_KEY])
+    code_filter = get_code_filter(found.get(COUPON_CODES_GENERATION_KEY) or _generation(COUPON_CODES_GENERATION_KEY))
+    if code_filter is not None and code not in code_filter:
+        return None
+    generation = found.get(COUPON_GENERATION_KEY) or get_coupon_generation()
+    key = COUPON_KEY.format(generation=generation, code=code)
+    coupon = cache.get(key)
+    if coupon is None:
+        coupon = Coupon.objects.filter(code__iexact=code).first() or UNKNOWN
+        cache.set(key, coupon, getattr(settings, 'COUPON_CACHE_TIMEOUT', 300))
+    return None if coupon == UNKNOWN else coupon
+
+
+# -------------------------------
+# Code membership filter
+# -------------------------------
+class CodeFilter:
+    """Bloom filter over lower-cased codes: no false negatives, ~error_rate false positives."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01, bits: bytes = None, hashes: int = None):
+        capacity = max(capacity, 1)
+        size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 1024)
+        self.size = size if bits is None else len(bits) * 8
+        self.hashes = hashes or max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray(bits) if bits is not None else bytearray((self.size + 7) // 8)
+
+    def _positions(self, code: str):
+        digest = hashlib.blake2b(code.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, code: str) -> None:
+        for pos in self._positions(code):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, code: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(code))
+
+    def dump(self) -> tuple:
+        return bytes(self.bits), self.hashes
+
+    @classmethod
+    def load(cls, data: tuple):
+        bits, hashes = data
+        return cls(1, bits=bits, hashes=hashes)
+
+
+_local_filter = (None, None)  # (codes generation, CodeFilter) for this process
+
+
+def build_code_filter(generation: int = None) -> CodeFilter:
+    """Scan every coupon code into a fresh filter and share it for ``generation``."""
+    global _local_filter
+    if generation is None:
+        generation = _generation(COUPON_CODES_GENERATION_KEY)
+    # Read the generation before scanning: codes committed later bump it again
+    codes = Coupon.objects.values_list('code', flat=True)
+    code_filter = CodeFilter(codes.count(), getattr(settings, 'COUPON_FILTER_ERROR_RATE', 0.01))
+    for code in codes.iterator(chunk_size=10000):
+        code_filter.add(code.lower())
+    cache.set(COUPON_FILTER_KEY.format(generation=generation), code_filter.dump(), timeout=FILTER_TIMEOUT)
+    _local_filter = (generation, code_filter)
+    return code_filter
+
+
+def get_code_filter(generation: int):
+    """This generation's filter, or None while another process is building it."""
+    global _local_filter
+    if _local_filter[0] == generation:
+        return _local_filter[1]
+    data = cache.get(COUPON_FILTER_KEY.format(generation=generation))
+    if data is not None:
+        _local_filter = (generation, CodeFilter.load(data))
+        return _local_filter[1]
+    if not cache.add(COUPON_FILTER_LOCK_KEY, generation, timeout=60):
+        return None
+    try:
+        return build_code_filter(generation)
+    finally:
+        cache.delete(COUPON_FILTER_LOCK_KEY)
+
+
+# -------------------------------
+# Usage
+# -------------------------------
+def _split(remaining, shards: int):
+    if remaining is None:
+        return [None] * shards
+    remaining = max(remaining, 0)
+    base, extra = divmod(remaining, shards)
+    return [base + (1 if i < extra else 0) for i in range(shards)]
+
+
+def _create_shards(coupon) -> None:
+    remaining = None if coupon.usage_limit is None else coupon.usage_limit - coupon.used_count
+    CouponUsageShard.objects.bulk_create(
+        [CouponUsageShard(coupon_id=coupon.pk, shard=i, allowance=allowance)
+         for i, allowance in enumerate(_split(remaining, shard_count()))],
+        ignore_conflicts=True,
+    )
+
+
+def _take(coupon_id: int, shard: int) -> bool:
+    return bool(
+        CouponUsageShard.objects
+        .filter(coupon_id=coupon_id, shard=shard)
+        .filter(Q(allowance__isnull=True) | Q(used__lt=F('allowance')))
+        .update(used=F('used') + 1)
+    )
+
+
+def reserve_use(coupon) -> bool:
+    """
+    Count one use of ``coupon`` if its usage limit allows; False when exhausted.
+    Call inside the checkout transaction.
+    """
+    shards = shard_count()
+    start = random.randrange(shards)
+    if _take(coupon.pk, start):
+        return True
+    if not CouponUsageShard.objects.filter(coupon_id=coupon.pk).exists():
+        _create_shards(coupon)
+        if _take(coupon.pk, start):
+            return True
+    # Start shard is full: walk the others before calling the coupon exhausted
+    return any(_take(coupon.pk, (start + offset) % shards) for offset in range(1, shards))
+
+
+def rebalance(coupon_id: int) -> int:
+    """
+    Fold the coupon's shard counts into Coupon.used_count and split what is
+    left of usage_limit over fresh shards. Returns the uses folded in.
+    """
+    with transaction.atomic():
+        shards = list(CouponUsageShard.objects.select_for_update().filter(coupon_id=coupon_id).order_by('shard'))
+        folded = sum(shard.used for shard in shards)
+        if folded:
+            Coupon.objects.filter(pk=coupon_id).update(used_count=F('used_count') + folded)
+        coupon = Coupon.objects.filter(pk=coupon_id).only('usage_limit', 'used_count').first()
+        if coupon is None:
+            return 0
+        CouponUsageShard.objects.filter(coupon_id=coupon_id, shard__gte=shard_count()).delete()
+        remaining = None if coupon.usage_limit is None else coupon.usage_limit - coupon.used_count
+        by_shard = {shard.shard: shard for shard in shards}
+        rows = []
+        for i, allowance in enumerate(_split(remaining, shard_count())):
+            row = by_shard.get(i) or CouponUsageShard(coupon_id=coupon_id, shard=i)
+            row.used, row.allowance = 0, allowance
+            rows.append(row)
+        CouponUsageShard.objects.bulk_update([row for row in rows if row.pk], ['used', 'allowance'])
+        CouponUsageShard.objects.bulk_create([row for row in rows if not row.pk], ignore_conflicts=True)
+        if remaining is not None and remaining <= 0:
+            # Cached definitions still carry the old used_count; let carts see the limit
+            transaction.on_commit(bump_coupon_generation)
+    return folded
+
+
+def reconcile_coupon_usage() -> dict:
+    """Rebalance every coupon with uses counted on its shards."""
+    stats = {'coupons': 0, 'uses': 0}
+    coupon_ids = CouponUsageShard.objects.filter(used__gt=0).values_list('coupon_id', flat=True).distinct()
+    for coupon_id in list(coupon_ids):
+        stats['uses'] += rebalance(coupon_id)
+        stats['coupons'] += 1
+    return stats
@@ -0,0 +1,105 @@
+"""
+Idempotency-Key records for POST endpoints that must not run twice
+(checkout, payments).
+
+A request carrying an ``Idempotency-Key`` header claims an IdempotencyKey row
+for (owner, scope, key) with a committed INSERT before doing any work; the
+unique constraint decides which of several concurrent duplicates runs. The
+row keeps a fingerprint of the request (method, path, body) and, once the
+request finishes, its response:
+
+- completed: duplicates get the stored response replayed, nothing else runs;
+- in progress: duplicates wait up to IDEMPOTENCY_WAIT seconds for it to
+  complete, then are told to retry;
+- failed (exception or 5xx): the claim is removed, so a retry runs again.
+
+A claim still in progress after IDEMPOTENCY_LOCK_TIMEOUT seconds belongs to a
+request that died and may be taken over. Rows expire IDEMPOTENCY_KEY_TTL
+seconds after the first request and are removed by
+``purge_expired_idempotency_keys`` (scheduled).
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from apps.order.models import IdempotencyKey
+
+IN_PROGRESS = IdempotencyKey.STATUS_IN_PROGRESS
+COMPLETED = IdempotencyKey.STATUS_COMPLETED
+POLL_INTERVAL = 0.1
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def request_fingerprint(method: str, path: str, data) -> str:
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{method}\n{path}\n{body}".encode()).hexdigest()
+
+
+def claim(owner: str, scope: str, key: str, fingerprint: str):
+    """
+    (record, claimed): ``claimed`` is True when the caller should run the
+    request and then ``complete`` or ``release`` the record.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                owner=owner, scope=scope, key=key, fingerprint=fingerprint,
+                expires_at=now + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 60 * 60 * 24)),
+            )
+        return record, True
+    except IntegrityError:
+        pass
+    record = IdempotencyKey.objects.filter(owner=owner, scope=scope, key=key).first()
+    if record is None or record.expires_at <= now:
+        # Released or expired meanwhile: the key is free again
+        IdempotencyKey.objects.filter(owner=owner, scope=scope, key=key, expires_at__lte=now).delete()
+        return claim(owner, scope, key, fingerprint)
+    stale = now - timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60))
+    if record.status == IN_PROGRESS and record.fingerprint == fingerprint and record.updated_at < stale:
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk, status=IN_PROGRESS, updated_at=record.updated_at,
+        ).update(updated_at=now)
+        if taken:
+            return record, True
+    return record, False
+
+
+def wait(record):
+    """Poll an in-progress record until it completes or IDEMPOTENCY_WAIT runs out; None if it was released."""
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT', 5)
+    while record is not None and record.status == IN_PROGRESS and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+    return record
+
+
+def complete(record, status_code: int, body) -> None:
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        status=COMPLETED, response_status=status_code, response_body=body, updated_at=timezone.now(),
+    )
+
+
+def release(record) -> None:
+    IdempotencyKey.objects.filter(pk=record.pk, status=IN_PROGRESS).delete()
+
+
+def purge_expired_idempotency_keys(chunk_size=DEFAULT_CHUNK_SIZE) -> int:
+    """Delete expired records chunk by chunk; returns how many."""
+    deleted = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+            .order_by('expires_at').values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+        deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
+        if len(ids) < chunk_size:
+            break
+    return deleted
@@ -0,0 +1,50 @@
+"""
+Invoice PDFs.
+
+Invoices are rendered with WeasyPrint (optional dependency; ImportError when
+missing) and kept in default_storage under a name derived from the order's
+state, so a stored PDF is served until the order changes. The render_invoice
+job pre-renders it when an order is confirmed; the staff invoice view serves
+the stored file or renders it on demand.
+"""
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template.loader import render_to_string
+
+from apps.order.models import Order
+
+
+def invoice_orders():
+    return Order.objects.select_related("user", "shipping_address", "billing_address") \
+        .prefetch_related("items", "payments", "status_logs")
+
+
+def invoice_path(order) -> str:
+    state = f"{order.updated_at.isoformat()}|{order.status}|{order.payment_status}"
+    return f"invoices/{order.order_number}-{hashlib.sha1(state.encode()).hexdigest()[:12]}.pdf"
+
+
+def stored_invoice(order):
+    """The stored PDF bytes for the order's current state, or None."""
+    path = invoice_path(order)
+    if not default_storage.exists(path):
+        return None
+    with default_storage.open(path, "rb") as fh:
+        return fh.read()
+
+
+def store_invoice(order, base_url: str = None) -> bytes:
+    """Render the invoice PDF and keep it in storage; returns the PDF bytes."""
+    from weasyprint import HTML
+
+    context = {"order": order, "generated_at": datetime.datetime.utcnow()}
+    html_string = render_to_string("order/invoice.html", context)
+    pdf = HTML(string=html_string, base_url=base_url or settings.DOMAIN).write_pdf()
+    path = invoice_path(order)
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(pdf))
+    return pdf
@@ -0,0 +1,39 @@
+"""Background jobs for orders (apps.jobs)."""
+import logging
+
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+
+from apps.jobs.queue import job
+from apps.order.invoices import invoice_orders, stored_invoice, store_invoice
+from apps.order.models import Order
+
+logger = logging.getLogger(__name__)
+
+
+@job(max_attempts=8)
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related("user", "shipping_address").prefetch_related("items").filter(pk=order_id).first()
+    if order is None:
+        return
+    recipient = order.guest_email or (order.user.email if order.user else None)
+    if not recipient:
+        return
+    context = {"order": order}
+    send_mail(
+        render_to_string("order/email/confirmation_subject.txt", context).strip(),
+        render_to_string("order/email/confirmation.txt", context),
+        None,
+        [recipient],
+    )
+
+
+@job()
+def render_invoice(order_id):
+    order = invoice_orders().filter(pk=order_id).first()
+    if order is None or stored_invoice(order) is not None:
+        return
+    try:
+        store_invoice(order)
+    except ImportError:
+        logger.info("WeasyPrint is not installed; invoice for order %s is rendered on demand.", order.order_number)
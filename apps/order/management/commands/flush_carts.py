@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.order.cart_store import RedisCartStore
+
+
+class Command(BaseCommand):
+    help = "Write hot carts with unsaved changes from Redis back to Cart/CartItem (CART_STORE=redis)."
+
+    def handle(self, *args, **options):
+        if getattr(settings, 'CART_STORE', 'db') != 'redis':
+            self.stdout.write("CART_STORE is not 'redis'; nothing to flush.")
+            return
+        written = RedisCartStore().flush()
+        self.stdout.write(self.style.SUCCESS(f"Persisted {written} cart(s)."))
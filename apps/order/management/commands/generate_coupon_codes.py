@@ -0,0 +1,46 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from apps.order.coupon_codes import DEFAULT_CHUNK_SIZE, CouponCodeError, generate_coupon_codes
+
+
+class Command(BaseCommand):
+    help = "Bulk-create unique random coupon codes (e.g. 100k single-use codes for a campaign)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, required=True, help='Number of codes to create')
+        parser.add_argument('--prefix', type=str, default='', help='Code prefix, e.g. SPRING-')
+        parser.add_argument('--length', type=int, default=10, help='Random characters after the prefix')
+        parser.add_argument('--type', dest='discount_type', choices=['percent', 'fixed'], default='percent')
+        parser.add_argument('--value', type=Decimal, required=True, help='Percent or fixed amount')
+        parser.add_argument('--usage-limit', type=int, default=1, help='Uses per code (default: single use)')
+        parser.add_argument('--min-subtotal', type=Decimal, default=Decimal('0.00'))
+        parser.add_argument('--starts-at', type=str, help='ISO datetime')
+        parser.add_argument('--ends-at', type=str, help='ISO datetime')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Codes per INSERT')
+        parser.add_argument('--output', type=str, help='Write the created codes to this file, one per line')
+
+    def handle(self, *args, **options):
+        def progress(created):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{created}/{options['count']} codes")
+
+        try:
+            codes = generate_coupon_codes(
+                options['count'], prefix=options['prefix'], length=options['length'],
+                chunk_size=options['chunk_size'], progress=progress,
+                discount_type=options['discount_type'], value=options['value'],
+                usage_limit=options['usage_limit'], min_subtotal=options['min_subtotal'],
+                starts_at=parse_datetime(options['starts_at']) if options['starts_at'] else None,
+                ends_at=parse_datetime(options['ends_at']) if options['ends_at'] else None,
+            )
+        except (CouponCodeError, ValidationError) as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                fh.write('\n'.join(codes) + '\n')
+        self.stdout.write(self.style.SUCCESS(f"Created {len(codes)} coupon code(s)."))
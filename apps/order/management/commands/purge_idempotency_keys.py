@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.order.idempotency import DEFAULT_CHUNK_SIZE, purge_expired_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key records, in chunks. Schedule it (e.g. hourly cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Records per DELETE')
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_idempotency_keys(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency key(s)."))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from apps.order.cart_gc import DEFAULT_CHUNK_SIZE, purge_stale_guest_carts
+
+
+class Command(BaseCommand):
+    help = ("Delete guest carts idle for longer than GUEST_CART_TTL_DAYS, in chunks, oldest first. "
+            "Schedule it (e.g. daily cron).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Idle days before a guest cart is purged (default: GUEST_CART_TTL_DAYS)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Carts per transaction')
+        parser.add_argument('--max-chunks', type=int, help='Stop after this many chunks')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between chunks')
+        parser.add_argument('--snapshot', type=str, help='Append a JSON-lines analytics snapshot of purged carts to this file')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be purged')
+
+    def handle(self, *args, **options):
+        def progress(stats):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"chunk {stats['chunks']}: {stats['carts']} carts, {stats['items']} items "
+                                  f"({stats['rows_per_second']} rows/s)")
+
+        kwargs = dict(
+            days=options['days'], chunk_size=options['chunk_size'], max_chunks=options['max_chunks'],
+            pause=options['pause'], dry_run=options['dry_run'], progress=progress,
+        )
+        if options['snapshot'] and not options['dry_run']:
+            with open(options['snapshot'], 'a', encoding='utf-8') as fh:
+                stats = purge_stale_guest_carts(snapshot=fh, **kwargs)
+        else:
+            stats = purge_stale_guest_carts(**kwargs)
+
+        if options['dry_run']:
+            self.stdout.write(f"Would purge {stats['carts']} guest cart(s) with {stats['items']} item(s).")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {stats['carts']} cart(s), {stats['items']} item(s), {stats['coupons']} coupon(s) "
+            f"in {stats['chunks']} chunk(s), {stats['seconds']}s ({stats['rows_per_second']} rows/s)."
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from apps.order.coupons import reconcile_coupon_usage
+
+
+class Command(BaseCommand):
+    help = ("Fold sharded coupon usage counts into Coupon.used_count and re-split the remaining "
+            "usage limits. Schedule it (e.g. every few minutes during campaigns).")
+
+    def handle(self, *args, **options):
+        stats = reconcile_coupon_usage()
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {stats['uses']} use(s) across {stats['coupons']} coupon(s)."))
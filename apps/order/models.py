@@ -3,11 +3,14 @@ from decimal import Decimal
 from typing import Optional
 
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
-from django.db import models, transaction
+from django.db import connection, models, transaction
 from django.db.models import F, Q, Sum
 from django.utils import timezone
 
+from apps.helpers.models import FieldTrackerMixin
+from apps.order.pricing import price_items
 from apps.user.models import CustomUser
 
 # Money helper
@@ -105,6 +108,8 @@ class Cart(models.Model):
         indexes = [
             models.Index(fields=["user"]),
             models.Index(fields=["guest_token"]),
+            # purge_stale_carts walks idle guest carts oldest first
+            models.Index(fields=["updated_at"], name="order_cart_guest_idle_idx", condition=Q(user__isnull=True)),
         ]
         constraints = [
             # Exactly one owner (user XOR guest_token)
@@ -208,70 +213,175 @@ class CartItem(models.Model):
     def line_total(self) -> Decimal:
         return quantize_money(self.get_unit_price() * self.quantity)
 
+    @staticmethod
+    def quantity_limits(variant):
+        """(min, max, stock or None) a line of this variant must respect; stock is None with backorders."""
+        p = variant.product
+        # Enforce product min/max safely (use defaults if missing)
+        min_q = getattr(p, "min_order_quantity", 1) or 1
+        max_q = getattr(p, "max_order_quantity", 100) or 100
+        variant_stock = getattr(variant, "stock", None)
+        if getattr(p, "allow_backorder", False):
+            variant_stock = None
+        return min_q, max_q, variant_stock
+
+    @staticmethod
+    def _over_limit_error(max_q, stock):
+        if stock is not None and stock < max_q:
+            return ValidationError("Requested quantity exceeds available stock.")
+        return ValidationError(f"Maximum order quantity is {max_q}.")
+
     def clean(self):
         if self.quantity < 1:
             raise ValidationError("Quantity must be >= 1.")
-        # Enforce product min/max safely (use defaults if missing)
         if self.variant and getattr(self.variant, "product", None):
-            p = self.variant.product
-            min_q = getattr(p, "min_order_quantity", 1) or 1
-            max_q = getattr(p, "max_order_quantity", 100) or 100
+            min_q, max_q, variant_stock = self.quantity_limits(self.variant)
             if self.quantity < min_q:
                 raise ValidationError(f"Minimum order quantity is {min_q}.")
             if self.quantity > max_q:
                 raise ValidationError(f"Maximum order quantity is {max_q}.")
-        # Stock checks (use variant.stock if present) - respect allow_backorder
-        if self.variant:
-            variant_stock = getattr(self.variant, "stock", None)
-            allow_backorder = getattr(self.variant.product, "allow_backorder", False)
-            if variant_stock is not None and not allow_backorder:
-                # previous bug: compared to literal 15000; use actual variant.stock
-                if self.quantity > variant_stock:
-                    raise ValidationError("Requested quantity exceeds available stock.")
+            # Stock checks (use variant.stock if present) - respect allow_backorder
+            if variant_stock is not None and self.quantity > variant_stock:
+                raise ValidationError("Requested quantity exceeds available stock.")
 
     def save(self, *args, **kwargs):
         self.full_clean()
         return super().save(*args, **kwargs)
 
+    @classmethod
+    def add_quantity(cls, cart: "Cart", variant, quantity: int) -> "CartItem":
+        """
+        Add ``quantity`` of ``variant`` to ``cart`` in a single statement:
+
+            INSERT ... ON CONFLICT (cart_id, variant_id)
+            DO UPDATE SET quantity = quantity + EXCLUDED.quantity WHERE <new quantity within limits>
+            RETURNING id, quantity
+
+        Concurrent adds of the same variant cannot race on uniq_variant_per_cart.
+        Limits come from ``variant`` (load it with its product); raises ValidationError.
+        """
+        min_q, max_q, stock = cls.quantity_limits(variant)
+        limit = max_q if stock is None else min(max_q, stock)
+        if quantity < 1:
+            raise ValidationError("Quantity must be >= 1.")
+        if quantity > limit:
+            raise cls._over_limit_error(max_q, stock)
+
+        if connection.vendor not in ("postgresql", "sqlite") or not connection.features.can_return_columns_from_insert:
+            # No INSERT ... ON CONFLICT ... RETURNING: fall back to read-modify-write
+            with transaction.atomic():
+                item = cls.objects.select_for_update().filter(cart=cart, variant=variant).first()
+                if item is None:
+                    item = cls(cart=cart, variant=variant, quantity=0)
+                item.quantity += quantity
+                item.save()
+            return item
+
+        table = connection.ops.quote_name(cls._meta.db_table)
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        if quantity >= min_q:
+            sql = (
+                f"INSERT INTO {table} (cart_id, variant_id, quantity, added_at, updated_at) "
+                f"VALUES (%s, %s, %s, %s, %s) "
+                f"ON CONFLICT (cart_id, variant_id) DO UPDATE "
+                f"SET quantity = {table}.quantity + EXCLUDED.quantity, updated_at = EXCLUDED.updated_at "
+                f"WHERE {table}.quantity + EXCLUDED.quantity <= %s "
+                f"RETURNING id, quantity"
+            )
+            params = [cart.pk, variant.pk, quantity, now, now, limit]
+        else:
+            # Below the minimum a new line is invalid; only top up an existing one
+            sql = (
+                f"UPDATE {table} SET quantity = quantity + %s, updated_at = %s "
+                f"WHERE cart_id = %s AND variant_id = %s AND quantity + %s <= %s "
+                f"RETURNING id, quantity"
+            )
+            params = [quantity, now, cart.pk, variant.pk, quantity, limit]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        if row is None:
+            if quantity < min_q and not cls.objects.filter(cart=cart, variant=variant).exists():
+                raise ValidationError(f"Minimum order quantity is {min_q}.")
+            raise cls._over_limit_error(max_q, stock)
+        return cls(id=row[0], cart=cart, variant=variant, quantity=row[1])
+
 
 # Updated utility: merge guest cart into user's cart (container + items)
 def merge_guest_cart_into_user(user: CustomUser, guest_token: str):
     """
     Merge a guest cart into the user's cart (summing quantities and respecting constraints).
     Use when a guest signs in (claiming their guest cart).
+
+    Runs a fixed number of statements whatever the cart size: one read of both
+    carts' lines, one upsert of the summed quantities (clamped to product
+    min/max and stock; lines that cannot be satisfied are dropped), bulk
+    deletes of the guest rows and a single coupon revalidation. The guest's
+    stock holds move to the user (those on dropped lines are released), so
+    checkout takes them over instead of competing with them.
     """
     if not guest_token:
         return
+    from apps.inventory.reservations import release, transfer
+    from apps.order.cart_cache import bump_cart_version
+    from apps.order.cart_store import CartOwner
+
     with transaction.atomic():
-        guest_cart = Cart.objects.for_owner(guest_token=guest_token)
+        guest_cart = Cart.objects.select_related("applied_coupon__coupon").filter(guest_token=guest_token).first()
         if not guest_cart:
             return
-        user_cart = Cart.objects.get_or_create_for_owner(user=user)
-
-        # Merge items (sum quantities)
-        for gi in guest_cart.items.select_related("variant"):
-            try:
-                existing = user_cart.items.get(variant=gi.variant)
-                existing.quantity = existing.quantity + gi.quantity
-                existing.save()
-            except CartItem.DoesNotExist:
-                gi.cart = user_cart
-                gi.save()
+        user_cart = Cart.objects.select_related("applied_coupon__coupon").get_or_create(user=user, guest_token=None)[0]
+
+        lines = list(
+            CartItem.objects.select_for_update(of=("self",))
+            .filter(cart_id__in=[guest_cart.pk, user_cart.pk])
+            .select_related("variant__product")
+        )
+        merged, variants = {}, {}
+        for line in lines:
+            merged[line.variant_id] = merged.get(line.variant_id, 0) + line.quantity
+            variants[line.variant_id] = line.variant
+        current = {line.variant_id: line.quantity for line in lines if line.cart_id == user_cart.pk}
+
+        upserts, dropped, subtotal = [], [], Decimal("0.00")
+        for variant_id, quantity in merged.items():
+            min_q, max_q, stock = CartItem.quantity_limits(variants[variant_id])
+            quantity = min(quantity, max_q if stock is None else min(max_q, stock))
+            if quantity < min_q:
+                dropped.append(variant_id)
+                continue
+            item = CartItem(cart=user_cart, variant=variants[variant_id], quantity=quantity)
+            subtotal += item.line_total
+            if current.get(variant_id) != quantity:
+                upserts.append(item)
+        if upserts:
+            CartItem.objects.bulk_create(
+                upserts, update_conflicts=True, unique_fields=["cart", "variant"],
+                update_fields=["quantity", "updated_at"],
+            )
+        if dropped:
+            CartItem.objects.filter(cart=user_cart, variant_id__in=dropped).delete()
 
         # Move coupon if any and none on user_cart
         guest_cc = getattr(guest_cart, "applied_coupon", None)
         user_cc = getattr(user_cart, "applied_coupon", None)
-        if guest_cc and not user_cc:
+        if guest_cc and not user_cc and guest_cc.coupon.is_valid(subtotal):
             # Transfer only if still valid on user's resulting subtotal
-            if guest_cc.coupon.is_valid(user_cart.subtotal()):
-                guest_cc.cart = user_cart
-                guest_cc.save(update_fields=["cart"])
-            else:
-                guest_cc.delete()
+            CartCoupon.objects.filter(pk=guest_cc.pk).update(cart=user_cart)
+
+        guest, owner = CartOwner(guest_token=guest_token), CartOwner(user=user)
+        transfer(guest.key, owner.key)
+        if dropped:
+            release(holder=owner.key, variant_ids=dropped)
 
-        # Remove empty guest cart container (items already moved)
-        # If you prefer to keep guest_cart for analytics, skip delete()
-        guest_cart.delete()
+        # Remove the guest cart container and whatever is left on it
+        CartItem.objects.filter(cart=guest_cart).delete()
+        CartCoupon.objects.filter(cart=guest_cart).delete()
+        Cart.objects.filter(pk=guest_cart.pk).delete()
+
+        # The bulk upsert and coupon move skip the signals that bump cached cart summaries
+        bump_cart_version(guest)
+        bump_cart_version(owner)
 
 
 # ---- Address ----
@@ -340,11 +450,13 @@ class Coupon(models.Model):
             amt = quantize_money(self.value)
         return quantize_money(min(amt, subtotal))
 
-    def increment_usage(self):
-        """Atomically increment used_count; safe under concurrency."""
-        with transaction.atomic():
-            type(self).objects.filter(pk=self.pk).update(used_count=F("used_count") + 1)
-            self.refresh_from_db(fields=["used_count"])
+    def increment_usage(self) -> bool:
+        """
+        Count one use on a CouponUsageShard (apps.order.coupons); False when the
+        usage limit is reached. used_count catches up on reconciliation.
+        """
+        from apps.order.coupons import reserve_use
+        return reserve_use(self)
 
 
 class CartCoupon(models.Model):
@@ -367,9 +479,9 @@ class CartCoupon(models.Model):
 
     @staticmethod
     def apply(code: str, cart: Cart) -> bool:
-        try:
-            coupon = Coupon.objects.get(code__iexact=code)
-        except Coupon.DoesNotExist:
+        from apps.order.coupons import get_coupon
+        coupon = get_coupon(code)
+        if coupon is None:
             return False
         subtotal = cart.subtotal()
         if not coupon.is_valid(subtotal):
@@ -391,13 +503,39 @@ class CartCoupon(models.Model):
         return False
 
 
+class CouponUsageShard(models.Model):
+    """
+    One of COUPON_USAGE_SHARDS usage counters per coupon, so concurrent checkouts
+    do not all queue on the Coupon row. ``allowance`` is this shard's share of
+    the remaining usage_limit (null: unlimited); reconciliation folds ``used``
+    into Coupon.used_count and re-splits what is left.
+    """
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name="usage_shards")
+    shard = models.PositiveSmallIntegerField()
+    used = models.PositiveIntegerField(default=0)
+    allowance = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["coupon", "shard"], name="uniq_coupon_usage_shard"),
+        ]
+        verbose_name = "Coupon Usage Shard"
+        verbose_name_plural = "Coupon Usage Shards"
+
+    def __str__(self):
+        return f"{self.coupon_id}#{self.shard}: {self.used}/{self.allowance if self.allowance is not None else '-'}"
+
+
 # ---- Orders ----
 def _generate_order_number() -> str:
     # Example: ORD-<uuid4 hex 12>
     return f"ORD-{uuid.uuid4().hex[:12].upper()}"
 
 
-class Order(models.Model):
+class Order(FieldTrackerMixin, models.Model):
+    # Status changes are logged (OrderStatusLog) and drive stock holds and jobs (signals)
+    tracked_fields = ("status", "payment_status")
+
     order_number = models.CharField(max_length=40, unique=True, editable=False, db_index=True)
     user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name="orders")
     guest_email = models.EmailField(null=True, blank=True)
@@ -491,9 +629,20 @@ class Order(models.Model):
         self.recalculate_totals(persist=True)
         return True
 
+    # Fulfilment moves forward only; cancelling follows can_cancel(), refunds are not set by status changes
+    STATUS_FLOW = (OrderStatus.PENDING, OrderStatus.CONFIRMED, OrderStatus.PROCESSING,
+                   OrderStatus.SHIPPED, OrderStatus.DELIVERED)
+
     def can_cancel(self):
         return self.status in {OrderStatus.PENDING, OrderStatus.CONFIRMED, OrderStatus.PROCESSING}
 
+    def can_transition_to(self, status: str) -> bool:
+        if status == OrderStatus.CANCELLED:
+            return self.can_cancel()
+        if self.status not in self.STATUS_FLOW or status not in self.STATUS_FLOW:
+            return False
+        return self.STATUS_FLOW.index(status) > self.STATUS_FLOW.index(self.status)
+
     def cancel(self, reason: str = ""):
         if not self.can_cancel():
             raise ValidationError("Order cannot be cancelled at this stage.")
@@ -502,6 +651,32 @@ class Order(models.Model):
             self.notes = (self.notes + "\nCancel: " + reason) if self.notes else ("Cancel: " + reason)
         self.save(update_fields=["status", "notes"])
 
+    @classmethod
+    def bulk_set_status(cls, orders, status: str, changed_by: Optional[CustomUser] = None) -> tuple:
+        """
+        Move ``orders`` (instances or a queryset) to ``status``. Each order is
+        saved on its own so stock holds and jobs follow as usual; their
+        OrderStatusLog rows are inserted together. Orders for which the move is
+        not allowed (can_transition_to: backwards, or cancelling a shipped
+        order) are left alone. Returns (changed, skipped); orders already in
+        ``status`` count as neither.
+        """
+        from apps.order.signals import batch_status_logs
+
+        changed = skipped = 0
+        with transaction.atomic(), batch_status_logs():
+            for order in orders:
+                if order.status == status:
+                    continue
+                if not order.can_transition_to(status):
+                    skipped += 1
+                    continue
+                order.status = status
+                order._changed_by = changed_by
+                order.save(update_fields=["status", "updated_at"])
+                changed += 1
+        return changed, skipped
+
     def mark_paid(self, transaction_id: str = "", method: str = PaymentMethod.COD):
         """Convenience: mark order paid and optionally create a Payment record."""
         self.payment_status = PaymentStatus.PAID
@@ -528,10 +703,13 @@ class Order(models.Model):
         Create an Order from the given cart (preferred).
         Backward-compat: if cart is None, resolve from user/guest_token.
         This method:
-         - validates stock (fails if insufficient and backorder not allowed),
-         - locks variants rows (select_for_update) while decrementing stock,
-         - applies cart coupon,
-         - increments coupon usage atomically,
+         - locks and reads the variant rows once (select_for_update),
+         - validates stock (fails if insufficient and backorder not allowed) and holds
+           warehouse stock for the order (apps.inventory.reservations),
+         - prices lines, coupon, shipping and tax with apps.order.pricing,
+         - reserves a coupon use (sharded counter, limit enforced),
+         - writes the order once, its lines in one bulk INSERT and stock in one conditional UPDATE,
+         - queues the confirmation e-mail (apps.jobs) for after the commit,
          - clears cart items and coupon.
         """
         # Resolve cart
@@ -544,23 +722,45 @@ class Order(models.Model):
             if not cart:
                 raise ValidationError("Cart is empty.")
 
-        cart_items = list(cart.items.select_related("variant", "variant__product").all())
+        from apps.ecom.models import ProductVariant
+        from apps.inventory.reservations import InsufficientStock, format_quantity, hold, release
+        from apps.jobs.queue import enqueue_on_commit
+        from apps.order.jobs import send_order_confirmation
+        from apps.order.cart_cache import bump_cart_version
+        from apps.order.cart_store import CartOwner
+
+        cart_items = list(cart.items.all())
         if not cart_items:
             raise ValidationError("Cart is empty.")
+        if any(item.variant_id is None for item in cart_items):
+            raise ValidationError("Cart contains an invalid variant.")
 
         with transaction.atomic():
-            # Lock all involved ProductVariant rows to avoid races when decrementing stock
-            variant_ids = [ci.variant_id for ci in cart_items if ci.variant_id]
-            # Only lock if variant ids present
-            if variant_ids:
-                # Use ORM select_for_update via model manager and force evaluation to acquire lock
-                variant_model = type(cart_items[0].variant)
-                locked_qs = variant_model.objects.select_for_update().filter(pk__in=variant_ids)
-                # force evaluation to obtain locks
-                locked_qs.count()
-
-            # Create order header
-            order = cls.objects.create(
+            # Lock and read every variant once; prices, limits and stock come from these rows
+            locked = ProductVariant.objects.select_related("product", "product__selling_tax")
+            if connection.features.has_select_for_update:
+                of = ("self",) if connection.features.has_select_for_update_of else ()
+                locked = locked.select_for_update(of=of)
+            variants = locked.in_bulk([item.variant_id for item in cart_items])
+            if len(variants) != len(cart_items):
+                raise ValidationError("Cart contains an invalid variant.")
+
+            decrements = {}
+            for item in cart_items:
+                variant = item.variant = variants[item.variant_id]
+                if variant.product.allow_backorder:
+                    # Backorders allowed -> do NOT decrement the DB stock field to avoid negative values.
+                    continue
+                if item.quantity > variant.stock:
+                    raise ValidationError(f"Not enough stock for SKU {variant.sku}. Requested {item.quantity}, available {variant.stock}.")
+                decrements[variant.pk] = item.quantity
+
+            cart_coupon = CartCoupon.objects.select_related("coupon").filter(cart=cart).first()
+            # Same pipeline as the cart summary: lines, coupon, shipping, tax, totals
+            pricing = price_items(cart_items, cart_coupon.coupon if cart_coupon else None, shipping_method)
+
+            # Header is complete before its single INSERT
+            order = cls(
                 user=cart.user,
                 guest_email=guest_email if not cart.user else None,
                 guest_token=cart.guest_token if not cart.user else None,
@@ -568,81 +768,66 @@ class Order(models.Model):
                 shipping_address=shipping_address,
                 billing_address=billing_address,
                 shipping_method=shipping_method,
+                shipping_method_name=shipping_method.name if shipping_method else "",
+                subtotal_amount=pricing.subtotal,
+                shipping_amount=pricing.shipping,
+                tax_amount=pricing.tax,
+                total_amount=pricing.total,
             )
-            
-            if shipping_method:
-                order.shipping_method_name = shipping_method.name
-                # Calculate shipping charge
-                shipping_charge = shipping_method.base_cost
-                # Threshold check
-                if shipping_method.free_shipping_threshold is not None:
-                    # We'll calculate threshold after items are summed, 
-                    # but for now we initialize it
-                    pass
-                order.shipping_amount = quantize_money(shipping_charge)
-
-            subtotal = Decimal("0.00")
-            # Validate & create order items, decrement stock where applicable
-            for item in cart_items:
-                variant = item.variant
-                if not variant:
-                    raise ValidationError("Cart contains an invalid variant.")
-                # Validate stock (respect variant.product.allow_backorder)
-                variant_stock = getattr(variant, "stock", None)
-                allow_backorder = getattr(variant.product, "allow_backorder", False)
-                if variant_stock is not None and not allow_backorder and item.quantity > variant_stock:
-                    raise ValidationError(f"Not enough stock for SKU {variant.sku}. Requested {item.quantity}, available {variant_stock}.")
-
-                unit_price = quantize_money(item.get_unit_price())
-                line_total = quantize_money(unit_price * item.quantity)
-                OrderItem.objects.create(
-                    order=order,
-                    variant=variant,
-                    product_name=getattr(variant.product, "name", "") or "",
-                    sku=variant.sku or "",
-                    unit_price=unit_price,
-                    quantity=item.quantity,
-                    line_total=line_total,
-                )
-                subtotal += line_total
-
-                # Decrement variant.stock atomically if model has stock field
-                if variant_stock is not None:
-                    # Only decrement DB stock when backorder NOT allowed.
-                    # This prevents writing negative stock (DB enforces stock >= 0).
-                    if not allow_backorder:
-                        updated = type(variant).objects.filter(pk=variant.pk, stock__gte=item.quantity).update(stock=F('stock') - item.quantity)
-                        if updated == 0:
-                            # concurrent change made stock insufficient
-                            raise ValidationError(f"Insufficient stock for SKU {variant.sku} during order creation.")
-                    else:
-                        # Backorders allowed -> do NOT decrement the DB stock field to avoid negative values.
-                        # If you need to track backorders, implement a separate field (e.g., backordered_quantity) and update it here.
-                        pass
-
-            order.subtotal_amount = quantize_money(subtotal)
-
-            # Apply cart coupon if present and valid
-            cart_coupon = getattr(cart, "applied_coupon", None)
-            if cart_coupon and cart_coupon.coupon.is_valid(order.subtotal_amount):
+            if pricing.discount:
+                # Reserved in this transaction: rolled back with the order if checkout fails
+                if not cart_coupon.coupon.increment_usage():
+                    raise ValidationError(f"Coupon {cart_coupon.coupon.code} has reached its usage limit.")
                 order.coupon = cart_coupon.coupon
                 order.coupon_code = cart_coupon.coupon.code
-                order.discount_amount = quantize_money(cart_coupon.coupon.apply(order.subtotal_amount))
-
-            # Re-check free shipping threshold after subtotal is known
-            if shipping_method and shipping_method.free_shipping_threshold is not None:
-                if order.subtotal_amount >= shipping_method.free_shipping_threshold:
-                    order.shipping_amount = Decimal("0.00")
-
-            order.total_amount = quantize_money(order.subtotal_amount - order.discount_amount + order.shipping_amount + order.tax_amount)
+                order.discount_amount = pricing.discount
             order.save()
 
+            owner = CartOwner(user_id=cart.user_id, guest_token=cart.guest_token)
+            if decrements:
+                # Warehouse holds for the order take over the cart's add-to-cart holds
+                release(holder=owner.key)
+                try:
+                    hold(decrements, order=order)
+                except InsufficientStock as e:
+                    raise ValidationError(f"Not enough stock for SKU {variants[e.variant_id].sku}. "
+                                          f"Requested {format_quantity(e.requested)}, available {format_quantity(e.available)}.")
+
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    variant=line.variant,
+                    product_name=line.variant.product.name or "",
+                    sku=line.variant.sku or "",
+                    unit_price=line.unit_price,
+                    quantity=line.quantity,
+                    line_total=line.line_total,
+                )
+                for line in pricing.lines
+            ])
+
+            if decrements:
+                # One conditional UPDATE for all lines; a row whose stock moved below its
+                # quantity (e.g. on backends without row locks) is left out of the count
+                enough = Q()
+                for variant_id, quantity in decrements.items():
+                    enough |= Q(pk=variant_id, stock__gte=quantity)
+                updated = ProductVariant.objects.filter(enough).update(stock=models.Case(
+                    *[models.When(pk=variant_id, then=F("stock") - quantity) for variant_id, quantity in decrements.items()],
+                    default=F("stock"),
+                    output_field=models.PositiveIntegerField(),
+                ))
+                if updated != len(decrements):
+                    stock = dict(ProductVariant.objects.filter(pk__in=decrements).values_list("pk", "stock"))
+                    short = next(variants[pk] for pk, quantity in decrements.items() if stock.get(pk, 0) < quantity)
+                    raise ValidationError(f"Insufficient stock for SKU {short.sku} during order creation.")
+
             # Clear cart items and coupon. We keep the Cart container (for reuse).
-            cart.items.all().delete()
+            CartItem.objects.filter(cart=cart).delete()
             if cart_coupon:
-                # increment usage safely
-                cart_coupon.coupon.increment_usage()
-                cart_coupon.delete()
+                CartCoupon.objects.filter(cart=cart).delete()
+            bump_cart_version(owner)
+            enqueue_on_commit(send_order_confirmation, order_id=order.pk)
 
             return order
 
@@ -775,3 +960,36 @@ class Payment(models.Model):
         if self.order and self.status == PaymentStatus.PAID and self.order.payment_status != PaymentStatus.PAID:
             self.order.payment_status = PaymentStatus.PAID
             self.order.save(update_fields=["payment_status"])
+
+
+# ---- Idempotency ----
+class IdempotencyKey(models.Model):
+    """
+    Outcome of a POST sent with an Idempotency-Key header, per owner and
+    endpoint (apps.order.idempotency). Retries with the same key get the
+    stored response instead of running the request again.
+    """
+    STATUS_IN_PROGRESS = "in_progress"
+    STATUS_COMPLETED = "completed"
+    STATUS_CHOICES = [(STATUS_IN_PROGRESS, "In progress"), (STATUS_COMPLETED, "Completed")]
+
+    owner = models.CharField(max_length=80)  # CartOwner.key
+    scope = models.CharField(max_length=64)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "scope", "key"], name="uniq_idempotency_key"),
+        ]
+        verbose_name = "Idempotency Key"
+        verbose_name_plural = "Idempotency Keys"
+
+    def __str__(self):
+        return f"{self.scope} {self.owner} {self.key} ({self.status})"
@@ -0,0 +1,185 @@
+"""
+Cart/checkout pricing engine.
+
+One pass over a line snapshot (variants loaded with product and
+product.selling_tax) produces every amount the cart summary shows and
+checkout charges, so the two cannot drift apart:
+
+1. line prices  - variant effective (sale-aware) unit price x quantity
+2. discount     - cart coupon on the subtotal, allocated to lines pro rata
+3. shipping     - ShippingMethod: rate_percent of the discounted subtotal when
+                  set, else base_cost + cost_per_kg x total weight; free from
+                  free_shipping_threshold (compared with the subtotal)
+4. tax          - per line from Product.selling_tax on the discounted amount;
+                  Product.tax_type "inclusive" prices already contain it
+                  (reported as tax_included), "exclusive" tax is added
+5. totals       - subtotal - discount + shipping + added tax
+
+Stages are plain callables ``stage(pricing)`` and can be replaced with
+CART_PRICING_STAGES (dotted paths). A CartPricing is plain data, so callers
+can cache ``as_dict()`` per cart version.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+ZERO = Decimal("0.00")
+HUNDRED = Decimal("100")
+TWO_PLACES = Decimal("0.01")
+
+
+def _money(value) -> Decimal:
+    return (value or ZERO).quantize(TWO_PLACES)
+
+
+class PricedLine:
+    __slots__ = ("variant", "quantity", "unit_price", "line_total", "discount", "tax", "tax_inclusive", "weight")
+
+    def __init__(self, variant, quantity: int):
+        self.variant = variant
+        self.quantity = quantity
+        self.unit_price = ZERO
+        self.line_total = ZERO
+        self.discount = ZERO
+        self.tax = ZERO
+        self.tax_inclusive = False
+        self.weight = Decimal("0")
+
+
+class CartPricing:
+    def __init__(self, lines, coupon=None, shipping_method=None):
+        self.lines = lines
+        self.coupon = coupon
+        self.shipping_method = shipping_method
+        self.subtotal = ZERO
+        self.discount = ZERO
+        self.shipping = ZERO
+        self.tax = ZERO  # added on top (exclusive)
+        self.tax_included = ZERO  # already inside prices (inclusive)
+        self.weight = Decimal("0")
+        self.total = ZERO
+
+    def as_dict(self) -> dict:
+        return {
+            "subtotal": str(self.subtotal),
+            "discount": str(self.discount),
+            "shipping": str(self.shipping),
+            "tax": str(self.tax),
+            "tax_included": str(self.tax_included),
+            "total": str(self.total),
+            "weight": str(self.weight),
+            "coupon": self.coupon.code if self.coupon else "",
+            "shipping_method": self.shipping_method.code if self.shipping_method else "",
+        }
+
+
+# -------------------------------
+# Stages
+# -------------------------------
+def line_prices(pricing: CartPricing):
+    for line in pricing.lines:
+        line.unit_price = _money(line.variant.get_effective_price())
+        line.line_total = _money(line.unit_price * line.quantity)
+        line.weight = (line.variant.get_effective_weight() or Decimal("0")) * line.quantity
+    pricing.subtotal = _money(sum((line.line_total for line in pricing.lines), ZERO))
+    pricing.weight = sum((line.weight for line in pricing.lines), Decimal("0"))
+
+
+def coupon_discount(pricing: CartPricing):
+    if not pricing.coupon or not pricing.subtotal:
+        return
+    pricing.discount = _money(pricing.coupon.apply(pricing.subtotal))
+    # Pro rata allocation; the last line takes the rounding remainder
+    remaining = pricing.discount
+    for line in pricing.lines[:-1]:
+        line.discount = _money(pricing.discount * line.line_total / pricing.subtotal)
+        remaining -= line.discount
+    if pricing.lines:
+        pricing.lines[-1].discount = remaining
+
+
+def shipping_for(method, pricing: CartPricing) -> Decimal:
+    """What ``method`` charges for an already priced cart (lines, discount and weight set)."""
+    if method.free_shipping_threshold is not None and pricing.subtotal >= method.free_shipping_threshold:
+        return ZERO
+    if method.rate_percent and method.rate_percent > 0:
+        return _money((pricing.subtotal - pricing.discount) * method.rate_percent / HUNDRED)
+    return _money(method.base_cost + method.cost_per_kg * pricing.weight)
+
+
+def shipping_cost(pricing: CartPricing):
+    if pricing.shipping_method is None or not pricing.lines:
+        return
+    pricing.shipping = shipping_for(pricing.shipping_method, pricing)
+
+
+def line_taxes(pricing: CartPricing):
+    for line in pricing.lines:
+        product = line.variant.product
+        tax = product.selling_tax
+        if tax is None or not tax.is_active or not tax.rate:
+            continue
+        base = line.line_total - line.discount
+        rate = tax.rate / HUNDRED
+        line.tax_inclusive = product.tax_type == "inclusive"
+        line.tax = _money(base - base / (1 + rate)) if line.tax_inclusive else _money(base * rate)
+    pricing.tax = _money(sum((line.tax for line in pricing.lines if not line.tax_inclusive), ZERO))
+    pricing.tax_included = _money(sum((line.tax for line in pricing.lines if line.tax_inclusive), ZERO))
+
+
+def totals(pricing: CartPricing):
+    pricing.total = _money(pricing.subtotal - pricing.discount + pricing.shipping + pricing.tax)
+
+
+DEFAULT_STAGES = (line_prices, coupon_discount, shipping_cost, line_taxes, totals)
+
+
+def get_stages():
+    paths = getattr(settings, "CART_PRICING_STAGES", None)
+    return [import_string(path) for path in paths] if paths else DEFAULT_STAGES
+
+
+def price_lines(lines, coupon=None, shipping_method=None, stages=None) -> CartPricing:
+    """
+    Price [(variant, quantity), ...]. Variants must come with product and
+    product.selling_tax loaded (select_related) - no queries are made here.
+    """
+    pricing = CartPricing([PricedLine(variant, quantity) for variant, quantity in lines], coupon, shipping_method)
+    for stage in stages or get_stages():
+        stage(pricing)
+    return pricing
+
+
+def price_items(items, coupon=None, shipping_method=None, stages=None) -> CartPricing:
+    """Price CartItem-like objects (``variant``/``quantity``)."""
+    return price_lines([(item.variant, item.quantity) for item in items], coupon, shipping_method, stages)
+
+
+def shipping_quotes(items, coupon=None, methods=(), stages=None) -> dict:
+    """
+    Price the cart once without shipping, then quote every method against the
+    same subtotal/discount/weight in memory.
+    """
+    pricing = price_items(items, coupon, None, stages)
+    quotes = []
+    for method in methods:
+        cost = shipping_for(method, pricing) if pricing.lines else ZERO
+        quotes.append({
+            "id": method.pk,
+            "code": method.code,
+            "name": method.name,
+            "carrier": method.carrier or "",
+            "estimated_days_min": method.estimated_days_min,
+            "estimated_days_max": method.estimated_days_max,
+            "cost": str(cost),
+            "free": bool(pricing.lines) and not cost,
+            "total": str(_money(pricing.total + cost)),
+        })
+    return {
+        "subtotal": str(pricing.subtotal),
+        "discount": str(pricing.discount),
+        "tax": str(pricing.tax),
+        "weight": str(pricing.weight),
+        "quotes": quotes,
+    }
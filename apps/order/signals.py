@@ -1,78 +1,131 @@
-from django.db.models.signals import pre_save, post_save, post_delete
+import contextvars
+from contextlib import contextmanager
+
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.apps import apps
+from django.db import transaction
+
+# OrderStatusLog rows collected while inside batch_status_logs()
+_status_log_batch = contextvars.ContextVar("order_status_log_batch", default=None)
 
 
-@receiver(pre_save)
-def order_pre_save(sender, instance, **kwargs):
+@contextmanager
+def batch_status_logs():
     """
-    Capture previous status/payment_status before save so post_save can detect changes.
-    Only act for Order model from this app to avoid importing models at module load time.
+    Collect the OrderStatusLog rows written by order saves inside the block and
+    insert them with one bulk_create when it exits cleanly (bulk status
+    operations); if the block raises, the collected rows are dropped.
     """
-    if instance._meta.app_label != "order" or instance._meta.model_name != "order":
+    if _status_log_batch.get() is not None:
+        yield  # already batching further up the stack
         return
+    batch = []
+    token = _status_log_batch.set(batch)
+    try:
+        yield
+    finally:
+        _status_log_batch.reset(token)
+    if batch:
+        apps.get_model("order", "OrderStatusLog").objects.bulk_create(batch)
 
-    if not instance.pk:
-        instance._old_status = None
-        instance._old_payment_status = None
-    else:
-        try:
-            old = sender.objects.get(pk=instance.pk)
-            instance._old_status = old.status
-            instance._old_payment_status = old.payment_status
-        except sender.DoesNotExist:
-            instance._old_status = None
-            instance._old_payment_status = None
 
+def _saved(field, update_fields):
+    return update_fields is None or field in update_fields
 
-@receiver(post_save)
-def order_post_save(sender, instance, created, **kwargs):
+
+@receiver(post_save, sender="order.Order")
+def order_post_save(sender, instance, created, update_fields=None, **kwargs):
     """
-    Create OrderStatusLog entries when status or payment_status change.
-    If callers set instance._log_skip = True they manage logging themselves.
+    Create OrderStatusLog entries when status or payment_status change (as
+    tracked since the order was loaded; see FieldTrackerMixin). The author is
+    taken from instance._changed_by when set. If callers set
+    instance._log_skip = True they manage logging themselves.
     """
-    if instance._meta.app_label != "order" or instance._meta.model_name != "order":
-        return
-
     if getattr(instance, "_log_skip", False):
         return
 
-    old_status = getattr(instance, "_old_status", None)
-    old_payment = getattr(instance, "_old_payment_status", None)
-
     OrderStatusLog = apps.get_model("order", "OrderStatusLog")
-
-    if old_status != instance.status:
-        OrderStatusLog.objects.create(
+    changed_by = getattr(instance, "_changed_by", None)
+    logs = [
+        OrderStatusLog(
             order=instance,
-            change_type=OrderStatusLog.CHANGE_TYPE_STATUS,
-            old_value=(old_status or ""),
-            new_value=(instance.status or ""),
-            changed_by=None,
+            change_type=change_type,
+            old_value=(instance.previous_value(field) or ""),
+            new_value=(getattr(instance, field) or ""),
+            changed_by=changed_by,
         )
-
-    if old_payment != instance.payment_status:
-        OrderStatusLog.objects.create(
-            order=instance,
-            change_type=OrderStatusLog.CHANGE_TYPE_PAYMENT,
-            old_value=(old_payment or ""),
-            new_value=(instance.payment_status or ""),
-            changed_by=None,
+        for field, change_type in (
+            ("status", OrderStatusLog.CHANGE_TYPE_STATUS),
+            ("payment_status", OrderStatusLog.CHANGE_TYPE_PAYMENT),
         )
+        if _saved(field, update_fields) and instance.has_changed(field)
+    ]
+    if not logs:
+        return
+    batch = _status_log_batch.get()
+    if batch is not None:
+        batch.extend(logs)
+    else:
+        OrderStatusLog.objects.bulk_create(logs)
+
+
+@receiver(post_save, sender="order.Order")
+def order_confirmed(sender, instance, created, update_fields=None, **kwargs):
+    """Pre-render the invoice in the background once an order is confirmed."""
+    if instance.status == "confirmed" and _saved("status", update_fields) and instance.has_changed("status"):
+        from apps.jobs.queue import enqueue_on_commit
+        from apps.order.jobs import render_invoice
 
+        enqueue_on_commit(render_invoice, order_id=instance.pk)
 
-@receiver(post_delete)
+
+@receiver(post_delete, sender="order.OrderItem")
 def orderitem_deleted(sender, instance, **kwargs):
     """
     When an order item is deleted, recalculate order totals.
-    Only act for OrderItem model from this app.
     """
-    if instance._meta.app_label != "order" or instance._meta.model_name != "orderitem":
-        return
-
     if instance.order_id:
         try:
             instance.order.recalculate_totals(persist=True)
         except Exception:
             # ignore if order cannot be found or recalculation fails
             pass
+
+
+def _bump_owning_cart(instance):
+    from apps.order.cart_cache import bump_cart_version
+    from apps.order.cart_store import CartOwner
+
+    # Usually cached: rows fetched through cart.items carry their cart
+    cart = instance._state.fields_cache.get("cart")
+    if cart is None:
+        Cart = apps.get_model("order", "Cart")
+        cart = Cart.objects.filter(pk=instance.cart_id).only("user_id", "guest_token").first()
+    if cart is not None:
+        bump_cart_version(CartOwner(user_id=cart.user_id, guest_token=cart.guest_token))
+
+
+@receiver(post_save, sender="order.CartItem")
+@receiver(post_delete, sender="order.CartItem")
+@receiver(post_save, sender="order.CartCoupon")
+@receiver(post_delete, sender="order.CartCoupon")
+def cart_contents_changed(sender, instance, **kwargs):
+    """Cart summaries are cached per cart version (apps.order.cart_cache); writers outside the store bump it here."""
+    _bump_owning_cart(instance)
+
+
+@receiver(post_save, sender="order.Coupon")
+def coupon_saved(sender, instance, **kwargs):
+    """Drop cached coupon definitions/code filter and re-split the remaining usage limit over the shards."""
+    from apps.order.coupons import bump_coupon_codes_generation, rebalance
+
+    transaction.on_commit(bump_coupon_codes_generation)
+    rebalance(instance.pk)
+
+
+@receiver(post_delete, sender="order.Coupon")
+def coupon_deleted(sender, instance, **kwargs):
+    from apps.order.coupons import bump_coupon_codes_generation
+
+    transaction.on_commit(bump_coupon_codes_generation)
@@ -1,3 +1,162 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.test import TestCase
 
-# Create your tests here.
+from apps.ecom.models import Product, ProductVariant
+from apps.inventory.models import Stock, StockMovement, StockReservation
+from apps.master.models import Warehouse
+from apps.order.cart_store import CartOwner, DatabaseCartStore
+from apps.order.models import (
+    Cart, CartCoupon, Coupon, CouponUsageShard, Order, OrderStatus, OrderStatusLog, merge_guest_cart_into_user,
+)
+from apps.order.signals import batch_status_logs
+
+User = get_user_model()
+
+
+class CheckoutTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='01700000000', name='Test User', password='pass')
+        self.warehouse = Warehouse.objects.create(name='Main', code='MAIN')
+        self.store = DatabaseCartStore()
+
+    def make_variant(self, sku, price='100.00', stock=10, on_hand=None):
+        product = Product.objects.create(name=f'Product {sku}', slug=f'product-{sku.lower()}',
+                                         track_inventory=True, allow_backorder=False)
+        variant = ProductVariant.objects.create(product=product, sku=sku, price=Decimal(price), stock=stock)
+        Stock.objects.create(product_variant=variant, warehouse=self.warehouse,
+                             quantity_on_hand=stock if on_hand is None else on_hand)
+        return ProductVariant.objects.select_related('product').get(pk=variant.pk)
+
+    def active_holds(self, **filters):
+        return StockReservation.objects.filter(status=StockReservation.STATUS_ACTIVE, **filters)
+
+
+class GuestCartMergeTests(CheckoutTestMixin, TestCase):
+    def test_guest_holds_move_to_user_and_checkout_takes_them_over(self):
+        variant = self.make_variant('SCARCE-1', stock=3)
+        guest = CartOwner(guest_token='guest-token')
+        self.store.add(guest, variant, 3)
+        self.assertEqual(self.active_holds(holder=guest.key).count(), 1)
+
+        merge_guest_cart_into_user(self.user, 'guest-token')
+        owner = CartOwner(user=self.user)
+        self.assertFalse(self.active_holds(holder=guest.key).exists())
+        self.assertEqual(self.active_holds(holder=owner.key).count(), 1)
+
+        order = Order.create_from_cart(user=self.user)
+        self.assertEqual(order.items.get().quantity, 3)
+        self.assertFalse(self.active_holds(order__isnull=True).exists())
+        self.assertEqual(sum(h.quantity for h in self.active_holds(order=order)), Decimal('3'))
+        self.assertFalse(Cart.objects.get(user=self.user).items.exists())
+
+
+class CreateFromCartTests(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = CartOwner(user=self.user)
+        self.shirt = self.make_variant('SHIRT-M', price='250.00', stock=10)
+        self.cap = self.make_variant('CAP-1', price='100.00', stock=10)
+
+    def apply_coupon(self, **fields):
+        coupon = Coupon.objects.create(code='SAVE10', discount_type='percent', value=Decimal('10'), **fields)
+        CartCoupon.objects.create(cart=self.store.get_cart(self.owner), coupon=coupon)
+        return coupon
+
+    def assert_nothing_written(self):
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(StockReservation.objects.filter(order__isnull=False).exists())
+        self.assertEqual(ProductVariant.objects.get(pk=self.shirt.pk).stock, 10)
+        self.assertEqual(ProductVariant.objects.get(pk=self.cap.pk).stock, 10)
+        self.assertEqual(Stock.objects.get(product_variant=self.shirt).quantity_reserved, 0)
+
+    def test_success(self):
+        self.store.add(self.owner, self.shirt, 2)
+        self.store.add(self.owner, self.cap, 1)
+        coupon = self.apply_coupon()
+
+        order = Order.create_from_cart(user=self.user)
+
+        self.assertEqual(order.subtotal_amount, Decimal('600.00'))
+        self.assertEqual(order.discount_amount, Decimal('60.00'))
+        self.assertEqual(order.coupon, coupon)
+        self.assertEqual(
+            sorted(order.items.values_list('sku', 'quantity', 'line_total')),
+            [('CAP-1', 1, Decimal('100.00')), ('SHIRT-M', 2, Decimal('500.00'))],
+        )
+        self.assertEqual(ProductVariant.objects.get(pk=self.shirt.pk).stock, 8)
+        self.assertEqual(ProductVariant.objects.get(pk=self.cap.pk).stock, 9)
+        self.assertEqual(sum(h.quantity for h in self.active_holds(order=order)), Decimal('3'))
+        self.assertEqual(Stock.objects.get(product_variant=self.shirt).quantity_reserved, 2)
+        self.assertEqual(sum(CouponUsageShard.objects.filter(coupon=coupon).values_list('used', flat=True)), 1)
+        cart = Cart.objects.get(user=self.user)
+        self.assertFalse(cart.items.exists())
+        self.assertFalse(CartCoupon.objects.filter(cart=cart).exists())
+
+    def test_insufficient_line_rolls_back(self):
+        # Enough on the variant, but the warehouse cannot cover the hold taken after the order row is written
+        short = self.make_variant('SHORT-1', stock=10, on_hand=1)
+        self.store.add(self.owner, self.shirt, 2)
+        self.store.add(self.owner, short, 3)
+        coupon = self.apply_coupon()
+
+        with self.assertRaisesMessage(ValidationError, 'Not enough stock for SKU SHORT-1'):
+            Order.create_from_cart(user=self.user)
+
+        self.assert_nothing_written()
+        self.assertEqual(ProductVariant.objects.get(pk=short.pk).stock, 10)
+        self.assertFalse(CouponUsageShard.objects.filter(coupon=coupon, used__gt=0).exists())
+        self.assertEqual(Cart.objects.get(user=self.user).items.count(), 2)
+
+    def test_exhausted_coupon(self):
+        self.store.add(self.owner, self.shirt, 1)
+        coupon = self.apply_coupon(usage_limit=1)
+        Order.create_from_cart(user=self.user)
+
+        self.store.add(self.owner, self.cap, 1)
+        CartCoupon.objects.create(cart=self.store.get_cart(self.owner), coupon=coupon)
+        with self.assertRaisesMessage(ValidationError, 'Coupon SAVE10 has reached its usage limit.'):
+            Order.create_from_cart(user=self.user)
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(ProductVariant.objects.get(pk=self.cap.pk).stock, 10)
+        self.assertFalse(self.active_holds(order__isnull=False, product_variant=self.cap).exists())
+        self.assertEqual(Cart.objects.get(user=self.user).items.count(), 1)
+
+
+class OrderStatusLogTests(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        owner = CartOwner(user=self.user)
+        self.store.add(owner, self.make_variant('SHIRT-M'), 1)
+        self.order = Order.create_from_cart(user=self.user)
+
+    def status_logs(self):
+        # Status changes after checkout (creation logs '' -> pending)
+        return OrderStatusLog.objects.filter(order=self.order, change_type='status').exclude(old_value='')
+
+    def test_bulk_set_status_logs_each_change(self):
+        changed = Order.bulk_set_status(Order.objects.filter(pk=self.order.pk), OrderStatus.PROCESSING, self.user)
+        self.assertEqual(changed, (1, 0))
+        self.assertEqual(list(self.status_logs().values_list('old_value', 'new_value')),
+                         [(OrderStatus.PENDING, OrderStatus.PROCESSING)])
+
+    def test_bulk_set_status_skips_disallowed_moves(self):
+        Order.bulk_set_status([self.order], OrderStatus.SHIPPED)
+        self.assertEqual(Order.bulk_set_status(Order.objects.all(), OrderStatus.CANCELLED), (0, 1))
+        self.assertEqual(Order.bulk_set_status(Order.objects.all(), OrderStatus.PROCESSING), (0, 1))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, OrderStatus.SHIPPED)
+        self.assertFalse(StockMovement.objects.filter(reference=self.order.order_number, movement_type='in').exists())
+
+    def test_batch_is_dropped_when_the_block_fails(self):
+        with self.assertRaises(RuntimeError):
+            with batch_status_logs():
+                self.order.status = OrderStatus.PROCESSING
+                self.order.save(update_fields=['status', 'updated_at'])
+                raise RuntimeError('bulk operation failed')
+        self.assertFalse(self.status_logs().exists())
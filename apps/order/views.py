@@ -7,12 +7,10 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from django.utils.dateparse import parse_date
 from django.views.decorators.http import require_GET, require_POST
-from django.template.loader import render_to_string
 from django.utils.http import http_date
 
-import datetime
-
-from .models import Order, OrderStatusLog, OrderStatus, PaymentStatus
+from .invoices import invoice_orders, stored_invoice, store_invoice
+from .models import Order, OrderStatus, PaymentStatus
 
 
 # Create your views here.
@@ -133,24 +131,10 @@ def order_status_update(request, pk):
         messages.info(request, "Status unchanged.")
         return redirect("order:order_detail", pk=pk)
 
-    old_status = order.status
     order.status = new_status
-    # Prevent the post_save signal from creating a duplicate log; we'll create a log with changed_by user
-    order._log_skip = True
-    order.save(update_fields=["status"])
-
-    # Create explicit log entry with the requesting user
-    try:
-        OrderStatusLog.objects.create(
-            order=order,
-            change_type=OrderStatusLog.CHANGE_TYPE_STATUS,
-            old_value=old_status or "",
-            new_value=new_status or "",
-            changed_by=request.user if request.user.is_authenticated else None,
-        )
-    except Exception:
-        # Non-fatal: log creation failure should not break the update flow.
-        pass
+    # The post_save receiver logs the change (OrderStatusLog) with the requesting user
+    order._changed_by = request.user if request.user.is_authenticated else None
+    order.save(update_fields=["status", "updated_at"])
 
     messages.success(request, "Status updated.")
     return redirect("order:order_detail", pk=pk)
@@ -158,43 +142,35 @@ def order_status_update(request, pk):
 
 def order_invoice(request, pk):
     """
-    Render a printable invoice for the order and return it as a PDF attachment.
-    This endpoint requires WeasyPrint to be installed. If it's not available,
-    respond with an error so callers know PDF generation is unavailable.
+    Return the order's invoice as a PDF attachment: the copy pre-rendered by
+    the render_invoice job when the order has not changed since, else rendered
+    now (apps.order.invoices). Rendering requires WeasyPrint; if it's not
+    available, respond with an error so callers know PDF generation is unavailable.
     """
-    order = get_object_or_404(
-        Order.objects.select_related("user", "shipping_address", "billing_address")
-            .prefetch_related("items", "payments", "status_logs"),
-        pk=pk
-    )
-    context = {"order": order, "generated_at": datetime.datetime.utcnow()}
-
-    # Render invoice HTML
-    html_string = render_to_string("order/invoice.html", context, request=request)
-
-    # Require WeasyPrint: produce PDF and return as attachment. Do NOT fall back to HTML.
-    try:
-        from weasyprint import HTML
-    except ImportError:
-        # Explicitly inform the caller that server-side PDF generation is not available.
-        return HttpResponse(
-            "PDF generation is not available on the server. Please install WeasyPrint and its dependencies.",
-            status=501,
-            content_type="text/plain"
-        )
+    order = get_object_or_404(invoice_orders(), pk=pk)
 
-    try:
-        pdf = HTML(string=html_string, base_url=request.build_absolute_uri("/")).write_pdf()
-        response = HttpResponse(pdf, content_type="application/pdf")
-        filename = f"invoice-{order.order_number}.pdf"
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
-        response["Cache-Control"] = "no-cache"
-        response["Last-Modified"] = http_date()
-        return response
-    except Exception as exc:
-        # If PDF generation fails despite WeasyPrint being present, surface a server error.
-        return HttpResponse(
-            f"Failed to generate PDF: {str(exc)}",
-            status=500,
-            content_type="text/plain"
-        )
+    pdf = stored_invoice(order)
+    if pdf is None:
+        try:
+            pdf = store_invoice(order, base_url=request.build_absolute_uri("/"))
+        except ImportError:
+            # Explicitly inform the caller that server-side PDF generation is not available.
+            return HttpResponse(
+                "PDF generation is not available on the server. Please install WeasyPrint and its dependencies.",
+                status=501,
+                content_type="text/plain"
+            )
+        except Exception as exc:
+            # If PDF generation fails despite WeasyPrint being present, surface a server error.
+            return HttpResponse(
+                f"Failed to generate PDF: {str(exc)}",
+                status=500,
+                content_type="text/plain"
+            )
+
+    response = HttpResponse(pdf, content_type="application/pdf")
+    filename = f"invoice-{order.order_number}.pdf"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["Cache-Control"] = "no-cache"
+    response["Last-Modified"] = http_date()
+    return response
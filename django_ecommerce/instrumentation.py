@@ -0,0 +1,287 @@
+"""
+Lightweight per-request instrumentation.
+
+Records query count / SQL time, cache get/set counts with hit ratio and DRF
+serialization time for every request, detects repeated identical query shapes
+(N+1) and tags them with the code that issued them (e.g.
+``ProductListSerializer.get_is_in_wishlist``).
+
+Results are exposed through the ``Server-Timing`` response header and a sampled
+structured (JSON) log line on the ``django_ecommerce.instrumentation`` logger.
+The header reveals query counts and timings, so it goes to every client only
+with REQUEST_INSTRUMENTATION_HEADER (default: DEBUG); otherwise only staff
+users get it.
+
+Enable with REQUEST_INSTRUMENTATION_ENABLED=True. When disabled the middleware
+raises MiddlewareNotUsed so Django drops it from the chain entirely and none of
+the cache/serializer hooks are installed (zero overhead).
+"""
+import contextvars
+import json
+import logging
+import random
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('django_ecommerce.instrumentation')
+
+# Active collector for the current request (None outside instrumented requests)
+_current = contextvars.ContextVar('request_instrumentation', default=None)
+
+_MISS = object()
+_hooks_installed = False
+
+# Collapse "IN (%s, %s, %s)" so queries that differ only by list length share a shape
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def query_shape(sql: str) -> str:
+    """Normalise SQL (already parametrised by the ORM) into a comparable shape."""
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACES_RE.sub(' ', sql).strip()
+
+
+class RequestStats:
+    """Counters collected for a single request."""
+
+    def __init__(self, n_plus_one_threshold: int):
+        self.threshold = n_plus_one_threshold
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.cache_gets = 0
+        self.cache_hits = 0
+        self.cache_sets = 0
+        self.serialization_time = 0.0
+        self._ser_depth = 0
+        self.shapes = Counter()
+        self.callers = {}
+
+    # -- recording helpers --
+    def record_query(self, sql: str, duration: float):
+        self.query_count += 1
+        self.sql_time += duration
+        shape = query_shape(sql)
+        self.shapes[shape] += 1
+        # Walk the stack once per shape, when it first crosses the threshold
+        if self.shapes[shape] == self.threshold and shape not in self.callers:
+            self.callers[shape] = _find_caller()
+
+    def n_plus_one(self):
+        return [
+            {'count': count, 'caller': self.callers.get(shape) or 'unknown', 'sql': shape[:300]}
+            for shape, count in self.shapes.most_common()
+            if count >= self.threshold
+        ]
+
+    @property
+    def cache_hit_ratio(self):
+        return (self.cache_hits / self.cache_gets) if self.cache_gets else None
+
+    def as_dict(self, request, response):
+        total = time.perf_counter() - self.started
+        return {
+            'method': request.method,
+            'path': request.path,
+            'status': getattr(response, 'status_code', None),
+            'total_ms': round(total * 1000, 2),
+            'queries': self.query_count,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'cache_gets': self.cache_gets,
+            'cache_hits': self.cache_hits,
+            'cache_sets': self.cache_sets,
+            'cache_hit_ratio': round(self.cache_hit_ratio, 3) if self.cache_hit_ratio is not None else None,
+            'serialization_ms': round(self.serialization_time * 1000, 2),
+            'n_plus_one': self.n_plus_one(),
+        }
+
+    def server_timing(self, total_ms: float) -> str:
+        parts = [
+            f'sql;dur={self.sql_time * 1000:.2f};desc="{self.query_count} queries"',
+            f'cache;desc="{self.cache_hits}/{self.cache_gets} hits, {self.cache_sets} sets"',
+            f'ser;dur={self.serialization_time * 1000:.2f}',
+        ]
+        for idx, item in enumerate(self.n_plus_one()[:3]):
+            parts.append(f'nplusone{idx};desc="{item["caller"]} x{item["count"]}"')
+        parts.append(f'total;dur={total_ms:.2f}')
+        return ', '.join(parts)
+
+
+def _find_caller() -> str:
+    """
+    Find the code responsible for the current query: prefer a serializer
+    ``get_*`` method, otherwise the nearest frame in project code.
+    """
+    try:
+        from rest_framework.serializers import BaseSerializer
+    except ImportError:  # pragma: no cover - DRF always installed here
+        BaseSerializer = None
+
+    base_dir = str(settings.BASE_DIR)
+    project_frame = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if BaseSerializer is not None and code.co_name.startswith('get_'):
+            owner = frame.f_locals.get('self')
+            if isinstance(owner, BaseSerializer):
+                return f"{type(owner).__name__}.{code.co_name}"
+        filename = code.co_filename
+        if (project_frame is None and filename.startswith(base_dir)
+                and 'site-packages' not in filename and filename != __file__):
+            project_frame = f"{filename[len(base_dir) + 1:]}:{code.co_name}:{frame.f_lineno}"
+        frame = frame.f_back
+    return project_frame or 'unknown'
+
+
+def _execute_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.record_query(sql, time.perf_counter() - start)
+
+
+# -------------------------------
+# Cache / serializer hooks (installed once, only when enabled)
+# -------------------------------
+def _wrap_cache_backend(backend_cls):
+    if getattr(backend_cls, '_instrumented', False):
+        return
+    orig_get = backend_cls.get
+    orig_get_many = backend_cls.get_many
+    orig_set = backend_cls.set
+    orig_set_many = backend_cls.set_many
+
+    def get(self, key, default=None, *args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return orig_get(self, key, default, *args, **kwargs)
+        value = orig_get(self, key, _MISS, *args, **kwargs)
+        stats.cache_gets += 1
+        if value is _MISS:
+            return default
+        stats.cache_hits += 1
+        return value
+
+    def get_many(self, keys, *args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return orig_get_many(self, keys, *args, **kwargs)
+        keys = list(keys)
+        result = orig_get_many(self, keys, *args, **kwargs)
+        stats.cache_gets += len(keys)
+        stats.cache_hits += len(result)
+        return result
+
+    def set(self, *args, **kwargs):
+        stats = _current.get()
+        if stats is not None:
+            stats.cache_sets += 1
+        return orig_set(self, *args, **kwargs)
+
+    def set_many(self, data, *args, **kwargs):
+        stats = _current.get()
+        if stats is not None:
+            stats.cache_sets += len(data)
+        return orig_set_many(self, data, *args, **kwargs)
+
+    backend_cls.get = get
+    backend_cls.set = set
+    # BaseCache's *_many fall back to get()/set(); only wrap real overrides to avoid double counting
+    if orig_get_many is not BaseCache.get_many:
+        backend_cls.get_many = get_many
+    if orig_set_many is not BaseCache.set_many:
+        backend_cls.set_many = set_many
+    backend_cls._instrumented = True
+
+
+def _wrap_serializer_data():
+    from rest_framework.serializers import BaseSerializer
+    from rest_framework.renderers import JSONRenderer
+
+    orig_data = BaseSerializer.data
+    orig_render = JSONRenderer.render
+
+    def _timed(stats, fn):
+        # Only time the outermost call so nested serializers are not double counted
+        stats._ser_depth += 1
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            stats._ser_depth -= 1
+            if stats._ser_depth == 0:
+                stats.serialization_time += time.perf_counter() - start
+
+    def data(self):
+        stats = _current.get()
+        if stats is None:
+            return orig_data.fget(self)
+        return _timed(stats, lambda: orig_data.fget(self))
+
+    def render(self, *args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return orig_render(self, *args, **kwargs)
+        return _timed(stats, lambda: orig_render(self, *args, **kwargs))
+
+    BaseSerializer.data = property(data)
+    JSONRenderer.render = render
+
+
+def install_hooks():
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    for alias in settings.CACHES:
+        _wrap_cache_backend(type(caches[alias]))
+    _wrap_serializer_data()
+    _hooks_installed = True
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Collect SQL/cache/serialization stats per request.
+    Keep it first in MIDDLEWARE so the total covers the whole stack.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'REQUEST_INSTRUMENTATION_SAMPLE_RATE', 0.01)
+        self.threshold = getattr(settings, 'REQUEST_INSTRUMENTATION_N_PLUS_ONE_THRESHOLD', 5)
+        self.header = getattr(settings, 'REQUEST_INSTRUMENTATION_HEADER', settings.DEBUG)
+        install_hooks()
+
+    def __call__(self, request):
+        stats = RequestStats(self.threshold)
+        token = _current.set(stats)
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(_execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        total_ms = (time.perf_counter() - stats.started) * 1000
+        if self.header or getattr(getattr(request, 'user', None), 'is_staff', False):
+            response['Server-Timing'] = stats.server_timing(total_ms)
+        if self.sample_rate and random.random() < self.sample_rate:
+            logger.info(json.dumps(stats.as_dict(request, response)))
+        return response
@@ -61,7 +61,8 @@ INSTALLED_APPS = [
     'apps.ecom',
     'apps.inventory',
     'apps.order',
-    'apps.cms'
+    'apps.cms',
+    'apps.jobs',
 ]
 
 ROOT_URLCONF = 'django_ecommerce.urls'
@@ -69,6 +70,7 @@ ROOT_URLCONF = 'django_ecommerce.urls'
 AUTH_USER_MODEL = 'user.CustomUser'
 
 MIDDLEWARE = [
+    'django_ecommerce.instrumentation.RequestInstrumentationMiddleware',  # no-op unless REQUEST_INSTRUMENTATION_ENABLED
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Moved up: should be before CommonMiddleware
@@ -240,6 +242,68 @@ PUBLIC_API_CACHE_ENABLED = config('PUBLIC_API_CACHE_ENABLED', default=True, cast
 PUBLIC_API_CACHE_TIMEOUT = config('PUBLIC_API_CACHE_TIMEOUT', default=300, cast=int)  # seconds
 # Optional: allow disabling caching per environment quickly
 
+# Per-request SQL/cache/serialization instrumentation (Server-Timing header + sampled JSON logs)
+REQUEST_INSTRUMENTATION_ENABLED = config('REQUEST_INSTRUMENTATION_ENABLED', default=False, cast=bool)
+REQUEST_INSTRUMENTATION_SAMPLE_RATE = config('REQUEST_INSTRUMENTATION_SAMPLE_RATE', default=0.01, cast=float)
+REQUEST_INSTRUMENTATION_N_PLUS_ONE_THRESHOLD = config('REQUEST_INSTRUMENTATION_N_PLUS_ONE_THRESHOLD', default=5, cast=int)
+# Server-Timing header for every client; when False only staff users get it
+REQUEST_INSTRUMENTATION_HEADER = config('REQUEST_INSTRUMENTATION_HEADER', default=DEBUG, cast=bool)
+
+# Public Google Merchant feed: written to default_storage per catalog generation; this bounds stock/availability staleness
+MERCHANT_FEED_CACHE_TIMEOUT = config('MERCHANT_FEED_CACHE_TIMEOUT', default=60 * 15, cast=int)
+
+# Product typeahead index: seconds between catalog-generation checks (staleness bound)
+SEARCH_INDEX_CHECK_INTERVAL = config('SEARCH_INDEX_CHECK_INTERVAL', default=2, cast=float)
+# Barcode/SKU scan snapshot: full rebuild after this many seconds (catches bulk update() writes)
+SCAN_INDEX_MAX_AGE = config('SCAN_INDEX_MAX_AGE', default=300, cast=int)
+# Render data-driven home sections on the server from cached fragments (JSON APIs remain for hydration)
+STOREFRONT_SERVER_RENDER_HOME = config('STOREFRONT_SERVER_RENDER_HOME', default=False, cast=bool)
+# Cart storage: 'db' (Cart/CartItem rows) or 'redis' (hot carts in Redis hashes, written back on
+# checkout/merge/`flush_carts`; needs REDIS_URL). Guests always use it, users only with CART_STORE_USERS.
+CART_STORE = config('CART_STORE', default='db')
+CART_STORE_USERS = config('CART_STORE_USERS', default=False, cast=bool)
+CART_STORE_TTL = config('CART_STORE_TTL', default=60 * 60 * 24 * 14, cast=int)  # seconds since last write
+# Cached cart summaries/counts are keyed by cart version; this only bounds coupon-window and
+# shipping/tax setting staleness
+CART_SUMMARY_CACHE_TIMEOUT = config('CART_SUMMARY_CACHE_TIMEOUT', default=300, cast=int)
+# Guest carts idle for longer than this are removed by `manage.py purge_stale_carts`
+GUEST_CART_TTL_DAYS = config('GUEST_CART_TTL_DAYS', default=30, cast=int)
+# Coupon uses are counted on this many rows per coupon; `manage.py reconcile_coupon_usage` folds them
+COUPON_USAGE_SHARDS = config('COUPON_USAGE_SHARDS', default=8, cast=int)
+COUPON_CACHE_TIMEOUT = config('COUPON_CACHE_TIMEOUT', default=300, cast=int)
+# False-positive rate of the coupon code membership filter (unknown codes rejected without a query)
+COUPON_FILTER_ERROR_RATE = config('COUPON_FILTER_ERROR_RATE', default=0.01, cast=float)
+# Cart/checkout pricing stages (dotted paths); empty uses apps.order.pricing.DEFAULT_STAGES
+CART_PRICING_STAGES = config('CART_PRICING_STAGES', default='', cast=Csv())
+# Variants with ProductVariant.stock at or below this are held at add-to-cart (0 disables);
+# holds lapse after INVENTORY_CART_HOLD_TTL seconds, swept by `manage.py release_expired_holds`
+INVENTORY_SCARCE_THRESHOLD = config('INVENTORY_SCARCE_THRESHOLD', default=5, cast=int)
+INVENTORY_CART_HOLD_TTL = config('INVENTORY_CART_HOLD_TTL', default=60 * 15, cast=int)
+# Idempotency-Key records (checkout retries replay the stored response); expired ones are removed
+# by `manage.py purge_idempotency_keys`. Duplicates wait IDEMPOTENCY_WAIT seconds for an in-flight request.
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=60 * 60 * 24, cast=int)
+IDEMPOTENCY_WAIT = config('IDEMPOTENCY_WAIT', default=5, cast=float)
+IDEMPOTENCY_LOCK_TIMEOUT = config('IDEMPOTENCY_LOCK_TIMEOUT', default=60, cast=int)
+# Background jobs (apps.jobs) are run by `manage.py run_worker`; JOBS_RUN_INLINE runs them in-process
+# instead (tests, local development without a worker)
+JOBS_RUN_INLINE = config('JOBS_RUN_INLINE', default=False, cast=bool)
+JOBS_WORKER_CONCURRENCY = config('JOBS_WORKER_CONCURRENCY', default=2, cast=int)
+JOBS_POLL_INTERVAL = config('JOBS_POLL_INTERVAL', default=1.0, cast=float)
+JOBS_MAX_ATTEMPTS = config('JOBS_MAX_ATTEMPTS', default=5, cast=int)
+JOBS_RETRY_BACKOFF = config('JOBS_RETRY_BACKOFF', default=10, cast=int)  # seconds, doubled per attempt
+JOBS_MAX_BACKOFF = config('JOBS_MAX_BACKOFF', default=60 * 60, cast=int)
+JOBS_LOCK_TIMEOUT = config('JOBS_LOCK_TIMEOUT', default=60 * 10, cast=int)  # running longer: worker presumed dead
+# Absolute URLs built outside a request (background jobs)
+DOMAIN = config('DOMAIN', default='http://localhost:8000')
+
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+DEFAULT_FROM_EMAIL = config('EMAIL_HOST_USER_SENDER', default='webmaster@localhost')
+
 LOGIN_URL = 'staff_login'
 LOGIN_REDIRECT_URL = 'dashboard:home'  # added
 LOGOUT_REDIRECT_URL = 'staff_login'  # added
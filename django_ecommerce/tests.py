@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from django_ecommerce import instrumentation
+from django_ecommerce.instrumentation import RequestInstrumentationMiddleware, RequestStats
+
+User = get_user_model()
+
+
+class ItemSerializer(serializers.Serializer):
+    name = serializers.CharField()
+    qty = serializers.IntegerField()
+
+
+def make_middleware(**settings):
+    settings.setdefault('REQUEST_INSTRUMENTATION_ENABLED', True)
+    settings.setdefault('REQUEST_INSTRUMENTATION_SAMPLE_RATE', 0)
+    with override_settings(**settings):
+        return RequestInstrumentationMiddleware(lambda request: HttpResponse('ok'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class InstrumentationMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def get(self, middleware, user):
+        request = self.factory.get('/')
+        request.user = user
+        return middleware(request)
+
+    def test_disabled_middleware_is_dropped(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            make_middleware(REQUEST_INSTRUMENTATION_ENABLED=False)
+
+    def test_server_timing_only_for_staff_by_default(self):
+        middleware = make_middleware(REQUEST_INSTRUMENTATION_HEADER=False)
+        self.assertNotIn('Server-Timing', self.get(middleware, AnonymousUser()))
+        self.assertNotIn('Server-Timing', self.get(middleware, User(is_staff=False)))
+        self.assertIn('sql;dur=', self.get(middleware, User(is_staff=True))['Server-Timing'])
+
+    def test_server_timing_for_everyone_with_header_setting(self):
+        middleware = make_middleware(REQUEST_INSTRUMENTATION_HEADER=True)
+        self.assertIn('Server-Timing', self.get(middleware, AnonymousUser()))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class InstrumentationHooksTests(SimpleTestCase):
+    """The patched cache/serializer methods must behave exactly like the originals."""
+
+    def setUp(self):
+        instrumentation.install_hooks()
+        cache.clear()
+        self.stats = RequestStats(n_plus_one_threshold=5)
+        self.token = instrumentation._current.set(self.stats)
+        self.addCleanup(instrumentation._current.reset, self.token)
+
+    def test_cache_values_are_unchanged(self):
+        self.assertIsNone(cache.set('a', 1))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('missing'))
+        self.assertEqual(cache.get('missing', 'fallback'), 'fallback')
+        cache.set('none', None)
+        self.assertIsNone(cache.get('none', 'fallback'))
+        self.assertEqual(cache.set_many({'b': 2, 'c': 3}), [])
+        self.assertEqual(cache.get_many(iter(['a', 'b', 'missing'])), {'a': 1, 'b': 2})
+        self.assertEqual((self.stats.cache_gets, self.stats.cache_hits, self.stats.cache_sets), (7, 4, 4))
+
+    def test_cache_values_outside_a_request(self):
+        instrumentation._current.set(None)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('missing', 'fallback'), 'fallback')
+        self.assertEqual(cache.get_many(['a', 'missing']), {'a': 1})
+        self.assertEqual((self.stats.cache_gets, self.stats.cache_sets), (0, 0))
+
+    def test_serializer_output_is_unchanged(self):
+        rows = [{'name': 'shirt', 'qty': 2}, {'name': 'cap', 'qty': 1}]
+        data = ItemSerializer(rows, many=True).data
+        self.assertEqual(data, rows)
+        self.assertEqual(ItemSerializer(rows[0]).data, rows[0])
+        self.assertEqual(JSONRenderer().render(data), b'[{"name":"shirt","qty":2},{"name":"cap","qty":1}]')
+        self.assertGreater(self.stats.serialization_time, 0)
+        self.assertEqual(self.stats._ser_depth, 0)